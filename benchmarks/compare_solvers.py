@@ -0,0 +1,58 @@
+"""Compares load, optimize and FVA times of the available LP solvers
+
+Usage: python benchmarks/compare_solvers.py [problem.mps(.gz)] [--threads N]
+"""
+import argparse
+import time
+import pandas as pd
+from pkg_resources import resource_filename
+from pymgpipe import load_model, fva, FVA_TYPE
+from pymgpipe.io import show_available_solvers, suppress_stdout
+
+
+def _time(f, *args, **kwargs):
+    start = time.time()
+    with suppress_stdout():
+        res = f(*args, **kwargs)
+    return res, time.time() - start
+
+
+def compare_solvers(problem, threads=1):
+    results = []
+    for solver in [s for s in ["gurobi", "cplex", "glpk", "highs"] if s in show_available_solvers()]:
+        model, load_time = _time(load_model, problem, solver=solver)
+        _, optimize_time = _time(model.optimize)
+        objective = model.objective.value
+        res, fva_time = _time(fva, model, solver=solver, threads=threads, parallel=threads > 1)
+        results.append(
+            {
+                "solver": solver,
+                "load": load_time,
+                "optimize": optimize_time,
+                "fva": fva_time,
+                "objective": objective,
+                "lp_solved": res.attrs.get("lp_solved"),
+            }
+        )
+
+    try:
+        import highspy  # noqa: F401
+    except ImportError:
+        pass
+    else:
+        res, fva_time = _time(fva, problem, fva_type=FVA_TYPE.NATIVE, threads=threads, parallel=threads > 1)
+        results.append({"solver": "native", "fva": fva_time, "lp_solved": res.attrs.get("lp_solved")})
+    return pd.DataFrame(results).set_index("solver")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "problem",
+        nargs="?",
+        default=resource_filename("pymgpipe", "resources/problems/mini_model.mps.gz"),
+    )
+    parser.add_argument("--threads", type=int, default=1)
+    args = parser.parse_args()
+
+    print(compare_solvers(args.problem, args.threads).to_string(float_format="%.3f"))
@@ -0,0 +1,53 @@
+"""Measures how long `import pymgpipe` takes in a fresh interpreter, and which modules it spends that time on
+
+Usage: python benchmarks/import_time.py [--runs N] [--top N] [--budget SECONDS]
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import pandas as pd
+
+# imported by pymgpipe no matter what, anything else should only be imported where it's used
+_CORE = "import numpy, pandas, optlang, scipy.sparse"
+
+
+def _run(code, *flags):
+    return subprocess.run([sys.executable, *flags, "-c", code], capture_output=True, text=True, check=True)
+
+
+def _time(code, setup=""):
+    out = _run("import time\n%s\nstart = time.perf_counter()\n%s\nprint(time.perf_counter() - start)" % (setup, code))
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def import_time(runs=5):
+    total = [_time("import pymgpipe") for _ in range(runs)]
+    own = [_time("import pymgpipe", setup=_CORE) for _ in range(runs)]
+    return pd.Series({"total": statistics.median(total), "pymgpipe": statistics.median(own)})
+
+
+def slowest_imports(top=15):
+    # `-X importtime` reports self and cumulative microseconds per module on stderr
+    rows = []
+    for line in _run("import pymgpipe", "-X", "importtime").stderr.splitlines()[1:]:
+        _, self_us, cumulative_us, module = [x.strip() for x in line.replace(":", "|", 1).split("|")]
+        rows.append({"module": module, "self": int(self_us) / 1e6, "cumulative": int(cumulative_us) / 1e6})
+    return pd.DataFrame(rows).set_index("module").sort_values("cumulative", ascending=False).head(top)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--budget", type=float, default=None, help="Exit with an error if pymgpipe's own import time (on top of numpy, pandas and optlang) exceeds this, i.e. 0.5")
+    args = parser.parse_args()
+
+    times = import_time(args.runs)
+    print("Median import time over %s runs (s)-" % args.runs)
+    print(times.to_string(float_format="%.3f"))
+    print("\nSlowest imports (s)-")
+    print(slowest_imports(args.top).to_string(float_format="%.3f"))
+    if args.budget is not None and times["pymgpipe"] > args.budget:
+        print("\nImport took longer than the %ss budget!" % args.budget)
+        sys.exit(1)
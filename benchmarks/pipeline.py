@@ -0,0 +1,299 @@
+"""Benchmarks pymgpipe's pipeline stages on synthetic communities of increasing size, and compares runs against a baseline
+
+Stages are `build`, `coupling` (add_coupling_constraints), `diet` (add_diet_to_model) and `fva` on a single sample with `taxa` taxa,
+plus `build_models` and `nmpc` (compute_nmpcs) on a cohort of `samples` such samples. Every stage runs in a fresh process, so peak RSS is that of the stage alone.
+Results are appended to a JSON lines history, one record per stage and scale.
+
+Usage:
+    python -m benchmarks.pipeline run [--taxa 4 16 64] [--samples 4] [--copies 1] [--solver gurobi] [--threads 1] [--label NAME]
+    python -m benchmarks.pipeline compare --baseline NAME [--current NAME] [--tolerance 0.2]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import pandas as pd
+from .synthetic import make_taxa_library, make_cohort, make_diet
+
+STAGES = ["build", "coupling", "diet", "fva", "build_models", "nmpc"]
+HISTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "history.jsonl")
+# records are compared within the same configuration
+_KEY = ["stage", "taxa", "samples", "copies", "solver", "threads"]
+
+
+def run(
+    taxa=(4, 16, 64),
+    samples=4,
+    copies=1,
+    solver="gurobi",
+    threads=1,
+    stages=STAGES,
+    work_dir="./benchmark_work",
+    history=HISTORY,
+    label=None,
+    seed=0,
+):
+    """Runs `stages` at every scale in `taxa` (taxa per sample) and appends the results to `history`
+
+    The taxa library is generated once (see `make_taxa_library`) and reused by later runs with the same parameters.
+
+    Returns: pandas.DataFrame of this run's records
+    """
+    label = _get_commit() if label is None else label
+    run_id = time.strftime("%Y-%m-%dT%H:%M:%S")
+    library = os.path.join(work_dir, "taxa_%sx%s" % (max(taxa) * 2, copies))
+    library_taxa = make_taxa_library(library, max(taxa) * 2, copies=copies, seed=seed)
+
+    records = []
+    for n_taxa in taxa:
+        scale_dir = os.path.join(work_dir, "%s_taxa" % n_taxa)
+        os.makedirs(scale_dir, exist_ok=True)
+        cohort = make_cohort(library_taxa, samples, n_taxa, seed=seed)
+        cohort.to_csv(os.path.join(scale_dir, "cohort.csv"))
+        ctx = dict(work_dir=scale_dir, taxa_dir=library, solver=solver, threads=threads)
+
+        for stage in stages:
+            print("Running %s on %s taxa..." % (stage, n_taxa))
+            result = _run_stage(stage, ctx)
+            records.append(
+                dict(
+                    run=run_id,
+                    label=label,
+                    stage=stage,
+                    taxa=n_taxa,
+                    samples=samples if stage in ["build_models", "nmpc"] else 1,
+                    copies=copies,
+                    solver=solver,
+                    threads=threads,
+                    **result,
+                    **_get_machine(),
+                )
+            )
+
+    os.makedirs(os.path.dirname(os.path.abspath(history)), exist_ok=True)
+    with open(history, "a") as f:
+        for r in records:
+            f.write(json.dumps(r) + "\n")
+    return pd.DataFrame(records)
+
+
+def load_history(history=HISTORY):
+    """Reads benchmark history as a DataFrame (one row per stage and scale of every run)"""
+    with open(history) as f:
+        return pd.DataFrame([json.loads(line) for line in f if line.strip()])
+
+
+def compare(baseline, current=None, history=HISTORY, tolerance=0.2):
+    """Compares wall time, peak RSS and LP counts of `current` (label, defaults to the latest run) against `baseline` (label)
+
+    Repeated runs of the same label are summarised by their median. Configurations that got slower or bigger than `1 + tolerance` times the baseline are flagged as regressions.
+
+    Returns: pandas.DataFrame indexed by stage and scale
+    """
+    df = load_history(history)
+    current = df.sort_values("run")["label"].iloc[-1] if current is None else current
+    metrics = ["wall", "peak_rss_mb", "lps"]
+
+    def _summary(label):
+        runs = df[df["label"] == label]
+        if runs.empty:
+            raise Exception("No benchmark runs labeled %s in %s" % (label, history))
+        return runs.groupby(_KEY)[metrics].median()
+
+    res = _summary(baseline).join(_summary(current), lsuffix="_baseline", rsuffix="_current", how="inner")
+    for m in ["wall", "peak_rss_mb"]:
+        res[m + "_ratio"] = res[m + "_current"] / res[m + "_baseline"]
+    res["regression"] = (res["wall_ratio"] > 1 + tolerance) | (res["peak_rss_mb_ratio"] > 1 + tolerance)
+    res.attrs.update(baseline=baseline, current=current)
+    return res
+
+
+def _run_stage(stage, ctx):
+    # fresh process per stage, so that peak RSS isn't carried over from earlier stages
+    p = multiprocessing.get_context("spawn").Pool(1)
+    try:
+        return p.apply(_measure, (stage, ctx))
+    finally:
+        p.close()
+        p.join()
+
+
+def _measure(stage, ctx):
+    from pymgpipe.io import suppress_stdout
+
+    setup, func = _STAGE_FUNCS[stage]
+    args = setup(ctx)
+    start = time.perf_counter()
+    with suppress_stdout():
+        result = func(ctx, *args)
+    wall = time.perf_counter() - start
+
+    self_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    unit = 1024 ** 2 if sys.platform == "darwin" else 1024
+    return dict(wall=wall, peak_rss_mb=max(self_rss, children_rss) / unit, **result)
+
+
+def _load(ctx, name):
+    from pymgpipe.io import load_model
+
+    return load_model(os.path.join(ctx["work_dir"], name), solver=ctx["solver"])
+
+
+def _save(ctx, model, name):
+    from pymgpipe.io import write_lp_problem
+
+    write_lp_problem(model, out_file=os.path.join(ctx["work_dir"], name), compress=False)
+
+
+def _size(model):
+    return dict(variables=len(model.variables), constraints=len(model.constraints))
+
+
+def _build(ctx):
+    from pymgpipe.modeling import build
+
+    cohort = pd.read_csv(os.path.join(ctx["work_dir"], "cohort.csv"), index_col=0)
+    model = build(cohort, cohort.columns[0], ctx["taxa_dir"], solver=ctx["solver"]).solver
+    _save(ctx, model, "built.mps")
+    return dict(lps=0, **_size(model))
+
+
+def _coupling(ctx, model):
+    from pymgpipe.coupling import add_coupling_constraints
+
+    add_coupling_constraints(model)
+    _save(ctx, model, "coupled.mps")
+    return dict(lps=0, **_size(model))
+
+
+def _diet(ctx, model):
+    from pymgpipe.diet import add_diet_to_model
+
+    # the diet is checked for feasibility, which is a single LP
+    add_diet_to_model(model, make_diet(model))
+    _save(ctx, model, "diet.mps")
+    return dict(lps=1, **_size(model))
+
+
+def _fva(ctx, model):
+    from pymgpipe.fva import fva
+
+    res = fva(model, solver=ctx["solver"], threads=ctx["threads"], parallel=ctx["threads"] > 1)
+    return dict(lps=res.attrs.get("lp_solved", 0), **_size(model))
+
+
+def _build_models(ctx):
+    from pymgpipe.main import build_models
+
+    build_models(
+        os.path.join(ctx["work_dir"], "cohort.csv"),
+        ctx["taxa_dir"],
+        solver=ctx["solver"],
+        threads=ctx["threads"],
+        parallel=ctx["threads"] > 1,
+        out_dir=os.path.join(ctx["work_dir"], "cohort"),
+        diet_fecal_compartments=True,
+        compute_metrics=False,
+        cobra_output=None,
+        force=True,
+        sample_prefix=None,
+    )
+    return dict(lps=0)
+
+
+def _nmpc(ctx):
+    from pymgpipe.nmpc import compute_nmpcs
+
+    res = compute_nmpcs(
+        os.path.join(ctx["work_dir"], "cohort", "problems/"),
+        out_dir=os.path.join(ctx["work_dir"], "nmpcs"),
+        solver=ctx["solver"],
+        threads=ctx["threads"],
+        parallel=ctx["threads"] > 1,
+        force=True,
+    )
+    return dict(lps=res.nmpc.attrs.get("lp_solved", 0))
+
+
+def _no_setup(ctx):
+    return ()
+
+
+# (untimed setup, timed stage), stages that modify a problem pick up where the previous stage left off
+_STAGE_FUNCS = {
+    "build": (_no_setup, _build),
+    "coupling": (lambda ctx: (_load(ctx, "built.mps"),), _coupling),
+    "diet": (lambda ctx: (_load(ctx, "coupled.mps"),), _diet),
+    "fva": (lambda ctx: (_load(ctx, "diet.mps"),), _fva),
+    "build_models": (_no_setup, _build_models),
+    "nmpc": (_no_setup, _nmpc),
+}
+
+
+def _get_commit():
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def _get_machine():
+    return dict(python=platform.python_version(), platform=platform.platform(), cpus=os.cpu_count())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run benchmarks and append results to the history")
+    run_parser.add_argument("--taxa", type=int, nargs="+", default=[4, 16, 64], help="Taxa per sample, one scale per value")
+    run_parser.add_argument("--samples", type=int, default=4, help="Samples in the cohort used by build_models and nmpc")
+    run_parser.add_argument("--copies", type=int, default=1, help="Taxon size multiplier, ~12 gives AGORA-sized taxa")
+    run_parser.add_argument("--solver", default="gurobi")
+    run_parser.add_argument("--threads", type=int, default=1)
+    run_parser.add_argument("--stages", nargs="+", default=STAGES, choices=STAGES)
+    run_parser.add_argument("--work-dir", default="./benchmark_work")
+    run_parser.add_argument("--history", default=HISTORY)
+    run_parser.add_argument("--label", default=None, help="Name of this run, defaults to the current git commit")
+    run_parser.add_argument("--seed", type=int, default=0)
+
+    compare_parser = commands.add_parser("compare", help="Compare a run against a baseline")
+    compare_parser.add_argument("--baseline", required=True)
+    compare_parser.add_argument("--current", default=None, help="Defaults to the latest run")
+    compare_parser.add_argument("--history", default=HISTORY)
+    compare_parser.add_argument("--tolerance", type=float, default=0.2)
+
+    args = parser.parse_args()
+    pd.set_option("display.width", 200)
+    if args.command == "run":
+        res = run(
+            taxa=args.taxa,
+            samples=args.samples,
+            copies=args.copies,
+            solver=args.solver,
+            threads=args.threads,
+            stages=args.stages,
+            work_dir=args.work_dir,
+            history=args.history,
+            label=args.label,
+            seed=args.seed,
+        )
+        print(res.set_index(_KEY)[["wall", "peak_rss_mb", "lps", "variables", "constraints"]].to_string(float_format="%.3f"))
+    else:
+        res = compare(args.baseline, args.current, args.history, args.tolerance)
+        print("%s vs %s (baseline)" % (res.attrs["current"], res.attrs["baseline"]))
+        print(res.to_string(float_format="%.3f"))
+        sys.exit(1 if res["regression"].any() else 0)
@@ -0,0 +1,89 @@
+"""Synthetic taxa libraries, cohorts and diets for benchmarking pymgpipe at scale
+
+Taxa are generated from the `resources/miniTaxa` templates, so every synthetic community stays feasible while its size can be pushed to AGORA-like numbers of taxa and reactions.
+"""
+import json
+import os
+import re
+import numpy as np
+import pandas as pd
+import pymgpipe
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(pymgpipe.__file__), "resources", "miniTaxa")
+
+
+def make_taxa_library(out_dir, n_taxa, copies=1, rename=0.25, variants=4, perturb=0.2, seed=0, template_dir=TEMPLATE_DIR):
+    """Writes `n_taxa` synthetic taxa models to `out_dir` (reused as is if it already holds a library with the same parameters)
+
+    Each taxon is a copy of one of the templates in which-
+        * a fraction `rename` of internal reactions is renamed to one of `variants` variants, so taxa share some but not all of their reactions
+        * finite bounds of internal reactions are scaled by a random factor within 1 +/- `perturb`
+        * internal reactions are duplicated `copies` - 1 times under new ids (parallel pathways), which grows taxa from ~100 to ~100 x `copies` reactions (AGORA taxa have ~1000-3000)
+        * forced fluxes (i.e. ATP maintenance) are lifted, coupling constraints would otherwise make low-abundance taxa infeasible
+
+    Returns: list of taxa names (file names in `out_dir` without their extension)
+    """
+    from pymgpipe.io import load_cobra_model, write_cobra_model
+
+    params = dict(n_taxa=n_taxa, copies=copies, rename=rename, variants=variants, perturb=perturb, seed=seed)
+    manifest = os.path.join(out_dir, "library.json")
+    if os.path.exists(manifest):
+        with open(manifest) as f:
+            cached = json.load(f)
+        if cached["params"] == params:
+            return cached["taxa"]
+
+    os.makedirs(out_dir, exist_ok=True)
+    templates = [load_cobra_model(os.path.join(template_dir, t)) for t in sorted(os.listdir(template_dir))]
+    rng = np.random.default_rng(seed)
+
+    taxa = []
+    for i in range(n_taxa):
+        name = "Synth%05d" % i
+        model = templates[i % len(templates)].copy()
+        model.id = model.name = name
+        internal = [r for r in model.reactions if not r.boundary and "biomass" not in r.id.lower()]
+
+        for r in internal:
+            lb, ub = min(r.lower_bound, 0), max(r.upper_bound, 0)
+            scale = rng.uniform(1 - perturb, 1 + perturb)
+            r.bounds = (lb * scale if np.isfinite(lb) else lb, ub * scale if np.isfinite(ub) else ub)
+
+        duplicates = []
+        for c in range(1, copies):
+            for r in internal:
+                d = r.copy()
+                d.id = "%s_c%s" % (r.id, c)
+                duplicates.append(d)
+        model.add_reactions(duplicates)
+
+        for r in rng.choice(internal, size=int(round(rename * len(internal))), replace=False):
+            r.id = "%s_v%s" % (r.id, rng.integers(variants))
+
+        write_cobra_model(model, os.path.join(out_dir, name + ".xml.gz"))
+        taxa.append(name)
+
+    with open(manifest, "w") as f:
+        json.dump({"params": params, "taxa": taxa}, f)
+    return taxa
+
+
+def make_cohort(taxa, n_samples, taxa_per_sample, seed=0):
+    """Abundance matrix (taxa x samples) in which every sample holds `taxa_per_sample` random taxa with Dirichlet-distributed abundances"""
+    rng = np.random.default_rng(seed)
+    cohort = pd.DataFrame(0.0, index=list(taxa), columns=["sample%s" % (i + 1) for i in range(n_samples)])
+    for sample in cohort.columns:
+        members = rng.choice(len(taxa), size=min(taxa_per_sample, len(taxa)), replace=False)
+        cohort.iloc[members, cohort.columns.get_loc(sample)] = rng.dirichlet(np.ones(len(members)))
+    return cohort
+
+
+def make_diet(model, uptake=100.0):
+    """Diet (as expected by `add_diet_to_model`) allowing `uptake` of every metabolite the community model can take up, which keeps synthetic communities feasible"""
+    from pymgpipe.utils import get_reactions
+
+    diet = {
+        re.sub(r"^Diet_(EX_.*)\[d\]$", r"\1(e)", r.name): uptake
+        for r in get_reactions(model, regex=r"^Diet_EX_.*\[d\]$")
+    }
+    return pd.DataFrame({"Flux Value": diet})
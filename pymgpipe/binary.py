@@ -0,0 +1,363 @@
+import os
+import re
+import json
+import struct
+import hashlib
+import tempfile
+import numpy as np
+from scipy.sparse import csr_matrix
+from .matrix import LinearProblem, get_linear_problem
+
+# bump the last byte when the layout changes, readers reject any version they don't know
+_MAGIC = b"\x89PMGLP\r\n"
+_VERSION = 1
+# arrays start at multiples of this, so memory-mapped arrays are aligned for any dtype
+_ALIGN = 64
+BINARY_EXTENSION = ".pmg"
+
+_STORE_MAGIC = b"\x89PMGST\r\n"
+# magic, followed by offset, length and capacity of the slot holding the current index, and offset and capacity of the spare slot
+_STORE_HEADER = struct.Struct("<QQQQQ")
+STORE_EXTENSION = ".pms"
+# separates store path and sample, i.e. `problems.pms::mc1`
+STORE_SEPARATOR = "::"
+
+
+def is_binary_problem(path):
+    """Returns True if `path` is a pymgpipe binary problem, detected by its magic bytes (regardless of the file extension)"""
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(_MAGIC)) == _MAGIC
+    except OSError:
+        return False
+
+
+def write_binary_problem(model, out_file, metadata=None):
+    """Writes LP problem to pymgpipe's binary problem format
+
+    The file holds the CSR constraint matrix, bounds and objective as raw little-endian arrays (aligned so they can be memory-mapped), the variable and constraint names as newline-separated tables,
+    and a JSON header with metadata. By default the metadata holds the sample name, taxa abundances, diet and coupling parameters, all derived from the problem itself.
+
+    Args:
+        model (optlang.interface.Model | LinearProblem): LP problem
+        out_file (str): Output file, conventionally ending in `.pmg`
+        metadata (dict): Additional JSON-serializable metadata, merged into the derived metadata
+    """
+    problem = model if isinstance(model, LinearProblem) else get_linear_problem(model)
+    arrays = _get_arrays(problem)
+
+    layout, offset = {}, 0
+    for k, arr in arrays.items():
+        layout[k] = {"dtype": arr.dtype.str, "count": len(arr), "offset": offset}
+        offset = _aligned(offset + arr.nbytes)
+    header = json.dumps(_get_header(problem, layout, metadata)).encode()
+    start = _aligned(len(_MAGIC) + 8 + len(header))
+
+    out_dir = os.path.dirname(os.path.abspath(out_file))
+    # written to a temporary file first so that readers never map a partial problem
+    fd, tmp = tempfile.mkstemp(dir=out_dir, suffix=BINARY_EXTENSION)
+    with os.fdopen(fd, "wb") as f:
+        f.write(_MAGIC + struct.pack("<Q", len(header)) + header)
+        for k, arr in arrays.items():
+            f.seek(start + layout[k]["offset"])
+            f.write(arr.tobytes())
+        f.truncate(start + offset)
+    os.replace(tmp, out_file)
+
+
+def read_binary_problem(path, mmap=True):
+    """Reads LP problem from pymgpipe's binary problem format
+
+    Args:
+        path (str): Path to binary problem
+        mmap (bool): Memory-map the numeric arrays instead of reading them into memory
+
+    Returns: LinearProblem (with read-only arrays)
+    """
+    header, start = _read_header(path)
+    buf = np.memmap(path, dtype=np.uint8, mode="r") if mmap else np.fromfile(path, dtype=np.uint8)
+    return _get_problem(header, buf, start)
+
+
+def read_binary_metadata(path):
+    """Returns metadata of a binary problem (see `write_binary_problem`) without reading the problem itself
+
+    Returns: dict
+    """
+    return _read_header(path)[0]["metadata"]
+
+
+def write_to_store(model, store, sample=None, metadata=None):
+    """Appends LP problem to a multi-sample problem store (created if it doesn't exist yet)
+
+    A store is a single file holding the problems of many samples, with an index mapping each sample to its arrays (same layout as `write_binary_problem`).
+    Arrays are content-addressed, so arrays shared by several samples (e.g. name tables of samples with the same taxa, or bounds) are stored and memory-mapped only once.
+    Writing a sample that's already in the store replaces it, the previous arrays are left in the file but no longer indexed.
+
+    Arrays are appended at the end of the file. The index lives in one of two slots: the updated index is written to the spare slot, which then becomes current by switching the pointer in the header,
+    so readers never see a partial sample. A slot that's too small for the index is replaced by a new one with room to grow, so the space taken by indices stays proportional to the size of the index.
+    Concurrent writers (e.g. parallel `build_models` workers) are serialized with a file lock (where `fcntl` is available, i.e. not on Windows).
+
+    Args:
+        model (optlang.interface.Model | LinearProblem): LP problem
+        store (str): Path to store, conventionally ending in `.pms`
+        sample (str): Sample label within the store, defaults to the name of the problem
+        metadata (dict): Additional JSON-serializable metadata, merged into the derived metadata
+    """
+    problem = model if isinstance(model, LinearProblem) else get_linear_problem(model)
+    sample = str(problem.name) if sample is None else sample
+    problem = problem._replace(name=sample)
+    arrays = _get_arrays(problem)
+
+    fd = os.open(store, os.O_RDWR | os.O_CREAT)
+    with os.fdopen(fd, "r+b") as f:
+        _lock(f, exclusive=True)
+        f.seek(0, os.SEEK_END)
+        if f.tell() == 0:
+            f.write(_STORE_MAGIC + _STORE_HEADER.pack(0, 0, 0, 0, 0))
+        index = _read_store_index(f, store)
+        offset, _, capacity, spare, spare_capacity = _read_store_header(f, store)
+
+        layout = {}
+        for k, arr in arrays.items():
+            key = hashlib.sha256(arr.dtype.str.encode() + arr.tobytes()).hexdigest()
+            if key not in index["blobs"]:
+                index["blobs"][key] = _append(f, arr.tobytes())
+            layout[k] = {"dtype": arr.dtype.str, "count": len(arr), "offset": index["blobs"][key]}
+        index["samples"][sample] = _get_header(problem, layout, metadata)
+
+        encoded = json.dumps(index).encode()
+        if len(encoded) > spare_capacity:
+            # the old spare slot is left unused
+            spare_capacity = _aligned(len(encoded) * 3 // 2)
+            spare = _aligned(f.seek(0, os.SEEK_END))
+            f.truncate(spare + spare_capacity)
+        f.seek(spare)
+        f.write(encoded)
+        f.flush()
+        os.fsync(f.fileno())
+
+        # switching the index pointer publishes the new sample, the previous index slot becomes the spare one
+        f.seek(len(_STORE_MAGIC))
+        f.write(_STORE_HEADER.pack(spare, len(encoded), spare_capacity, offset, capacity))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def read_from_store(store, sample, mmap=True):
+    """Reads the LP problem of a sample from a multi-sample problem store (see `write_to_store`)
+
+    Args:
+        store (str): Path to store
+        sample (str): Sample label within the store
+        mmap (bool): Memory-map the numeric arrays instead of reading them into memory
+
+    Returns: LinearProblem (with read-only arrays)
+    """
+    header = _get_store_entry(store, sample)
+    buf = np.memmap(store, dtype=np.uint8, mode="r") if mmap else np.fromfile(store, dtype=np.uint8)
+    return _get_problem(header, buf)
+
+
+def get_store_samples(store):
+    """Returns the samples held in a multi-sample problem store, as `store::sample` references that can be passed to `load_model`, `fva`, `solve_model` or `compute_nmpcs`
+
+    Returns: list
+    """
+    return [store + STORE_SEPARATOR + s for s in _load_store_index(store)["samples"]]
+
+
+def read_store_metadata(store, sample):
+    """Returns metadata of a sample in a multi-sample problem store without reading its problem
+
+    Returns: dict
+    """
+    return _get_store_entry(store, sample)["metadata"]
+
+
+def is_problem_store(path):
+    """Returns True if `path` is a multi-sample problem store, detected by its magic bytes (regardless of the file extension)"""
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(_STORE_MAGIC)) == _STORE_MAGIC
+    except OSError:
+        return False
+
+
+def split_store_path(path):
+    """Splits `store::sample` references into `(store, sample)`, returns `(path, None)` for anything else"""
+    if isinstance(path, str) and STORE_SEPARATOR in path:
+        store, sample = path.rsplit(STORE_SEPARATOR, 1)
+        return store, sample
+    return path, None
+
+
+def _get_store_entry(store, sample):
+    samples = _load_store_index(store)["samples"]
+    if sample not in samples:
+        raise Exception("Sample %s not found in problem store %s" % (sample, store))
+    return samples[sample]
+
+
+def _read_store_header(f, store):
+    f.seek(0)
+    if f.read(len(_STORE_MAGIC)) != _STORE_MAGIC:
+        raise Exception("%s is not a pymgpipe problem store" % store)
+    return _STORE_HEADER.unpack(f.read(_STORE_HEADER.size))
+
+
+def _load_store_index(store):
+    # readers hold a shared lock, so the slot they read from isn't reused by a writer in the meantime
+    with open(store, "rb") as f:
+        _lock(f, exclusive=False)
+        return _read_store_index(f, store)
+
+
+def _read_store_index(f, store):
+    offset, length = _read_store_header(f, store)[:2]
+    if length == 0:
+        return {"version": _VERSION, "samples": {}, "blobs": {}}
+
+    f.seek(offset)
+    index = json.loads(f.read(length))
+    if index["version"] != _VERSION:
+        raise Exception(
+            "%s was written with problem store version %s, expected %s" % (store, index["version"], _VERSION)
+        )
+    return index
+
+
+def _lock(f, exclusive):
+    # Advisory lock on `f`, released when `f` is closed. Stores aren't locked where `fcntl` isn't available (i.e. Windows)
+    try:
+        import fcntl
+    except ImportError:
+        return
+    fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+
+
+def _append(f, data):
+    # Writes `data` at the next aligned offset at the end of the file, returns that offset
+    offset = _aligned(f.seek(0, os.SEEK_END))
+    f.seek(offset)
+    f.write(data)
+    return offset
+
+
+def _read_header(path):
+    with open(path, "rb") as f:
+        if f.read(len(_MAGIC)) != _MAGIC:
+            raise Exception("%s is not a pymgpipe binary problem" % path)
+        (length,) = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(length))
+    if header["version"] != _VERSION:
+        raise Exception(
+            "%s was written with binary problem version %s, expected %s" % (path, header["version"], _VERSION)
+        )
+    return header, _aligned(len(_MAGIC) + 8 + length)
+
+
+def _get_arrays(problem):
+    A = problem.A.tocsr()
+    A.sort_indices()
+    return {
+        "indptr": A.indptr.astype("<i8"),
+        "indices": A.indices.astype("<i4"),
+        "data": A.data.astype("<f8"),
+        "col_lb": np.asarray(problem.col_lb, dtype="<f8"),
+        "col_ub": np.asarray(problem.col_ub, dtype="<f8"),
+        "row_lb": np.asarray(problem.row_lb, dtype="<f8"),
+        "row_ub": np.asarray(problem.row_ub, dtype="<f8"),
+        "obj": np.asarray(problem.obj, dtype="<f8"),
+        "col_names": np.frombuffer("\n".join(problem.col_names).encode(), dtype=np.uint8),
+        "row_names": np.frombuffer("\n".join(problem.row_names).encode(), dtype=np.uint8),
+    }
+
+
+def _get_header(problem, layout, metadata=None):
+    meta = _get_metadata(problem)
+    meta.update(metadata if metadata is not None else {})
+    return {
+        "version": _VERSION,
+        "name": str(problem.name),
+        "sense": problem.sense,
+        "shape": [len(problem.row_names), len(problem.col_names)],
+        "arrays": layout,
+        "metadata": meta,
+    }
+
+
+def _get_problem(header, buf, start=0):
+    # Arrays are views into `buf`, array offsets in `header` are relative to `start`
+    def _array(k):
+        a = header["arrays"][k]
+        return np.frombuffer(buf, dtype=a["dtype"], count=a["count"], offset=start + a["offset"])
+
+    def _names(k):
+        names = _array(k).tobytes().decode()
+        return np.array(names.split("\n") if len(names) > 0 else [], dtype=object)
+
+    n_rows, n_cols = header["shape"]
+    return LinearProblem(
+        name=header["name"],
+        A=csr_matrix((_array("data"), _array("indices"), _array("indptr")), shape=(n_rows, n_cols), copy=False),
+        col_names=_names("col_names"),
+        row_names=_names("row_names"),
+        col_lb=_array("col_lb"),
+        col_ub=_array("col_ub"),
+        row_lb=_array("row_lb"),
+        row_ub=_array("row_ub"),
+        obj=_array("obj"),
+        sense=header["sense"],
+    )
+
+
+def _aligned(offset):
+    return -(-offset // _ALIGN) * _ALIGN
+
+
+def _get_metadata(problem):
+    # Sample name, abundances, diet and coupling parameters as found in the problem
+    from .utils import _get_reverse_id
+
+    cols = {c: i for i, c in enumerate(problem.col_names)}
+    A = problem.A.tocsc()
+
+    def _column(name):
+        j = cols[name]
+        return zip(problem.row_names[A.indices[A.indptr[j] : A.indptr[j + 1]]], A.data[A.indptr[j] : A.indptr[j + 1]])
+
+    abundances = {}
+    if "communityBiomass" in cols:
+        abundances = {
+            row.split("__")[1]: -float(coef)
+            for row, coef in _column("communityBiomass")
+            if re.match("^biomass.*__", row, re.IGNORECASE) and coef != 0
+        }
+
+    diet = {}
+    for c, j in cols.items():
+        if c.startswith("Diet_EX_") and "reverse" not in c:
+            r = cols.get(_get_reverse_id(c))
+            lb = problem.col_lb[j] - (problem.col_ub[r] if r is not None else 0)
+            ub = problem.col_ub[j] - (problem.col_lb[r] if r is not None else 0)
+            diet[c] = [_to_json(lb), _to_json(ub)]
+
+    # coupling constraints read `v - C * biomass <= u`, see `add_coupling_constraints`
+    coupling = None
+    upper = np.flatnonzero([r.endswith("_cp") and not r.endswith("_l_cp") for r in problem.row_names])
+    if len(upper) > 0:
+        row = problem.A.tocsr()[upper[0]].tocoo()
+        biomass = [coef for j, coef in zip(row.col, row.data) if problem.col_names[j].startswith("biomass")]
+        coupling = {
+            "constraints": int(sum(r.endswith("_cp") for r in problem.row_names)),
+            "u_const": _to_json(problem.row_ub[upper[0]]),
+            "C_const": -float(biomass[0]) if len(biomass) > 0 else None,
+        }
+
+    return {"sample": str(problem.name), "abundances": abundances, "diet": diet, "coupling": coupling}
+
+
+def _to_json(value):
+    # JSON has no infinity
+    return None if np.isinf(value) else float(value)
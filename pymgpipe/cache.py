@@ -0,0 +1,180 @@
+import os
+import hashlib
+import tempfile
+import numpy as np
+from collections import namedtuple
+from .logger import logger
+
+Optimum = namedtuple("Optimum", "objective_values col_basis row_basis solver")
+Optimum.__doc__ = """Optimal solution of an LP problem as stored in the optimum cache
+
+    `objective_values` maps each objective variable to its optimal primal value. `col_basis` and `row_basis` hold the optimal basis in the encoding of `solver` (or None if the solver doesn't expose one).
+"""
+
+# bump when the key or file layout changes so stale entries are ignored
+_CACHE_VERSION = b"1"
+
+
+def get_problem_key(model):
+    """Returns key identifying an LP problem in the optimum cache
+
+    Problems passed in as file paths are keyed by the hash of the file. In-memory models are keyed by the hash of their constraint matrix, bounds and objective,
+    so any diet or coupling constraints applied to the model are part of the key.
+
+    Args:
+        model (str | optlang.interface.Model | LinearProblem): LP problem or path to LP problem
+
+    Returns: str
+    """
+    from .binary import split_store_path, read_from_store
+    from .matrix import LinearProblem, get_linear_problem
+
+    h = hashlib.sha256(_CACHE_VERSION)
+    store, sample = split_store_path(model)
+    if sample is not None:
+        # samples within a store are keyed like in-memory models
+        model = read_from_store(store, sample)
+    elif isinstance(model, str):
+        with open(model, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        return h.hexdigest()
+
+    problem = model if isinstance(model, LinearProblem) else get_linear_problem(model)
+    A = problem.A.tocsr()
+    A.sort_indices()
+    for arr in [A.indptr, A.indices, A.data, problem.col_lb, problem.col_ub, problem.row_lb, problem.row_ub, problem.obj]:
+        h.update(np.ascontiguousarray(arr).tobytes())
+    h.update("\n".join(problem.col_names).encode())
+    h.update("\n".join(problem.row_names).encode())
+    h.update(problem.sense.encode())
+    return h.hexdigest()
+
+
+def load_optimum(cache_dir, key):
+    """Loads cached optimum for problem `key`, returns None if not found
+
+    Args:
+        cache_dir (str): Directory containing cached optima
+        key (str): Problem key as returned by `get_problem_key`
+
+    Returns: Optimum
+    """
+    path = os.path.join(cache_dir, "%s.npz" % key)
+    if not os.path.exists(path):
+        return None
+
+    try:
+        with np.load(path) as f:
+            return Optimum(
+                objective_values=dict(zip(f["names"].tolist(), f["values"].tolist())),
+                col_basis=f["col_basis"] if "col_basis" in f else None,
+                row_basis=f["row_basis"] if "row_basis" in f else None,
+                solver=str(f["solver"]),
+            )
+    except Exception as e:
+        logger.warning("Ignoring unreadable cached optimum %s- %s" % (path, e))
+        return None
+
+
+def save_optimum(cache_dir, key, optimum):
+    """Saves optimum of problem `key` to cache
+
+    Args:
+        cache_dir (str): Directory containing cached optima
+        key (str): Problem key as returned by `get_problem_key`
+        optimum (Optimum): Optimal solution to cache
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    arrays = {
+        "names": np.array(list(optimum.objective_values.keys()), dtype=str),
+        "values": np.array(list(optimum.objective_values.values()), dtype=float),
+        "solver": np.array(optimum.solver),
+    }
+    if optimum.col_basis is not None and optimum.row_basis is not None:
+        arrays["col_basis"] = np.asarray(optimum.col_basis, dtype=np.int8)
+        arrays["row_basis"] = np.asarray(optimum.row_basis, dtype=np.int8)
+
+    # written to a temporary file first so that concurrent runs never read a partial entry
+    fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix=".npz")
+    with os.fdopen(fd, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(tmp, os.path.join(cache_dir, "%s.npz" % key))
+
+
+def get_basis(model):
+    """Returns optimal basis `(col_basis, row_basis)` of a solved model, or None if not available
+
+    Only gurobi and glpk models expose their basis.
+
+    Args:
+        model (optlang.interface.Model): Solved LP problem
+
+    Returns: tuple
+    """
+    from .io import _get_solver_name
+
+    solver = _get_solver_name(model)
+    try:
+        if solver == "gurobi":
+            grb = model.problem
+            return (
+                np.array(grb.getAttr("VBasis", grb.getVars()), dtype=np.int8),
+                np.array(grb.getAttr("CBasis", grb.getConstrs()), dtype=np.int8),
+            )
+        elif solver == "glpk":
+            import swiglpk as glp
+
+            lp = model.problem
+            return (
+                np.array([glp.glp_get_col_stat(lp, j + 1) for j in range(glp.glp_get_num_cols(lp))], dtype=np.int8),
+                np.array([glp.glp_get_row_stat(lp, i + 1) for i in range(glp.glp_get_num_rows(lp))], dtype=np.int8),
+            )
+    except Exception:
+        # e.g. barrier solution without crossover
+        return None
+    return None
+
+
+def set_basis(model, col_basis, row_basis):
+    """Sets starting basis of a model, returns True if the basis was applied
+
+    For gurobi, the model is re-solved from the basis so that subsequent solves through optlang are warm-started.
+
+    Args:
+        model (optlang.interface.Model): LP problem
+        col_basis (np.array): Basis status of each variable, as returned by `get_basis`
+        row_basis (np.array): Basis status of each constraint, as returned by `get_basis`
+
+    Returns: bool
+    """
+    from .io import _get_solver_name
+
+    solver = _get_solver_name(model)
+    if len(col_basis) != len(model.variables) or len(row_basis) != len(model.constraints):
+        return False
+
+    if solver == "gurobi":
+        import gurobipy
+        from optlang.interface import OPTIMAL
+
+        grb = model.problem
+        grb.setAttr("VBasis", grb.getVars(), col_basis.tolist())
+        grb.setAttr("CBasis", grb.getConstrs(), row_basis.tolist())
+
+        # optlang resets gurobi models that aren't at an optimal status before solving, which would discard the basis,
+        # so the optimum is recovered from the basis here (takes no simplex iterations)
+        grb.optimize()
+        if grb.Status == gurobipy.GRB.OPTIMAL:
+            model._status = OPTIMAL
+        return True
+    elif solver == "glpk":
+        import swiglpk as glp
+
+        lp = model.problem
+        for j, s in enumerate(col_basis):
+            glp.glp_set_col_stat(lp, j + 1, int(s))
+        for i, s in enumerate(row_basis):
+            glp.glp_set_row_stat(lp, i + 1, int(s))
+        return True
+    return False
@@ -1,6 +1,6 @@
-import cobra
 import re
 from .utils import get_reactions, get_reverse_var
+from .io import _is_cobra_model
 
 
 def remove_coupling_constraints(model):
@@ -12,7 +12,7 @@ def remove_coupling_constraints(model):
     Notes:
         Removes all coupling constraints from model (if they exist)
     """
-    if isinstance(model, cobra.Model):
+    if _is_cobra_model(model):
         model = model.solver
     c = [k for k in model.constraints if re.match(".*_cp$", k.name)]
     if len(c) == 0:
@@ -35,7 +35,7 @@ def add_coupling_constraints(model, u_const=0.01, C_const=400):
 
         `-C_const - (u_counts * <abundance of taxa A>) <= My_reaction_taxa_A <= C_const + (u_counts * <abundance of taxa A>)`
     """
-    if isinstance(model, cobra.Model):
+    if _is_cobra_model(model):
         model = model.solver
     if 'coupled' in model.variables: # fixing some bug from old version of models
         model.remove('coupled')
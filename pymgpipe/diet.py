@@ -1,7 +1,5 @@
 import pandas as pd
 import os
-import cobra
-from pkg_resources import resource_listdir, resource_filename
 from .utils import (
     load_dataframe,
     get_reactions,
@@ -12,9 +10,11 @@ from .utils import (
 from .io import load_model
 from .logger import logger
 
+_DIET_DIR = os.path.join(os.path.dirname(__file__), "resources", "diets")
+
 def get_available_diets():
     """Returns all diets that come pre-packaged with pymgpipe"""
-    return [f.split('.txt')[0] for f in os.listdir(resource_filename("pymgpipe", "resources/diets/"))]
+    return [f.split('.txt')[0] for f in os.listdir(_DIET_DIR)]
 
 def _get_adapted_diet(
     diet, essential_metabolites=None, micronutrients=None, vaginal=False, threshold=0.8
@@ -468,7 +468,7 @@ def add_diet_to_model(
     elif isinstance(diet, str):
         try:
             diet_df = pd.read_csv(
-                resource_filename("pymgpipe", "resources/diets/%s.txt" % diet),
+                os.path.join(_DIET_DIR, "%s.txt" % diet),
                 sep="\t",
                 header=0,
                 index_col=0,
@@ -484,7 +484,7 @@ def add_diet_to_model(
                     diet,
                     [
                         x.split(".")[0]
-                        for x in resource_listdir("pymgpipe", "resources/diets/")
+                        for x in os.listdir(_DIET_DIR)
                     ],
                 )
             )
@@ -1,27 +1,43 @@
 import os
+import re
 import gc
 import sys
+import time
+import tempfile
 import numpy as np
 import pandas as pd
 from multiprocessing import Pool
+from collections import deque, namedtuple, OrderedDict
+from itertools import groupby
+from operator import itemgetter
+from queue import Queue
 from functools import partial
 from optlang.interface import Objective
+from optlang.symbolics import Zero
 from pathlib import Path
 from .utils import (
     load_model,
     Constants,
     get_reactions,
+    get_reaction_bounds,
     _get_reverse_id,
-    solve_model,
+    _get_variable_index,
+    _set_method,
     load_dataframe,
+    InfeasibleModelException,
 )
-from .io import suppress_stdout
+from .io import suppress_stdout, write_lp_problem, _get_solver_name, _get_highs_problem
+from .matrix import get_linear_problem, build_model
+from .reduction import reduce_problem
+from .cache import Optimum, get_problem_key, load_optimum, save_optimum, get_basis, set_basis
 from .logger import logger
 from enum import Enum
+from math import isinf
 
 class FVA_TYPE(Enum):
     REGULAR = 1
     FAST = 2
+    NATIVE = 3
 
 class VFFVA(object):
     def __init__(self):
@@ -37,6 +53,9 @@ class VFFVA(object):
 
 vffva_config = VFFVA()
 
+# net bounds of every reaction in the worker's problem, see `_get_net_bounds` (None in cohort workers)
+global_net_bounds = None
+
 def fva(
     model=None,
     fva_type=FVA_TYPE.REGULAR,
@@ -54,19 +73,24 @@ def fva(
     schedule="dynamic",
     objective_percent=None,
     force=False,
+    prune=True,
+    cache_dir=None,
+    directions=None,
+    reduce=False,
 ):
     """Run Flux Variability Analysis (FVA) on target reactions
 
-    Available FVA types are `regular` and `fast`. `Fast` FVA is significantly faster, but requires both a CPLEX license and full install of the VFFVA package.
+    Available FVA types are `regular`, `fast` and `native`. `Fast` FVA is significantly faster, but requires both a CPLEX license and full install of the VFFVA package.
     Additionally, all problems need to be in .mps format if using `fast` FVA type. For more information, see VFFVA package- https://github.com/marouenbg/VFFVA.
+    `Native` FVA follows the same strategy as VFFVA (every worker loads the .mps file once and warm-starts each min/max solve from the previous basis) but runs in Python on the open-source HiGHS solver, so it only requires `highspy`.
 
     Args:
         model (str | optlang.Model): model you want to run FVA on
-        fva_type (str): FVA type used to compute min/max values, allowed values are `fast` and `regular`
+        fva_type (str): FVA type used to compute min/max values, allowed values are `fast`, `native` and `regular`
         reactions (list): List of reactions you want to target
         regex (str): Regex match for list of reactions you want to target
         ex_only (bool): Run FVA on exchange reactions only
-        solver (str): LP solver used, allowed values are `gurobi` and `cplex`
+        solver (str): LP solver used, allowed values are `gurobi`, `cplex`, `glpk` and `highs`
         threads (float): How many threads to use to run FVA
         write_to_file (bool): Setting this to True will save results to `out_file`
         out_file (str): Name of file you want to save results (should have .csv extension)
@@ -76,12 +100,30 @@ def fva(
         schedule (str): VFFVA specific parameter, see VFFVA package- https://github.com/marouenbg/VFFVA.
         objective_percent (float): Takes value between 0-100. If not set to None, will compute objective and constrain to specified percentage of maximum value before running FVA
         force (bool): Will compute FVA and overwrite existing file (if file is found with target reactions)
+        prune (bool): Skip LPs whose optimum is already certified by a previous solution (`regular` and `native` FVA only)
+        cache_dir (str): Directory used to cache the optimal objective and basis of `model` (`regular` and `native` FVA only). If set to None, nothing is cached
+        directions (dict | function): Maps target reactions to the directions (`min`, `max`) to solve, or function returning this mapping given the list of target reactions and the `LinearProblem` of `model` (`regular` and `native` FVA only).
+            Only reactions present in the mapping are run and directions that aren't solved are left as NaN. If set to None, both directions of every target reaction are solved
+        reduce (bool): Run FVA on a lossless reduction of `model` that only keeps the target reactions and objective (see `pymgpipe.reduction.reduce_problem`, `regular` and `native` FVA only)
 
     Notes:
         If computation is cut short prematurely, this function will pick up where it left off based on which reactions are already present in `out_file`.
+        Results are appended to `out_file` as each batch of reactions finishes, and the file is rewritten once (sorted and thresholded) at the end.
+
+        With `prune` set to True, every primal solution is checked for target reactions sitting at one of their bounds. A reaction at its upper (or lower) bound in a feasible solution has already reached its maximum (or minimum), so that LP is skipped. Extremes certified by one batch of reactions are handed to every batch that follows (in cohort runs, only to the rest of the same batch).
+        The number of solved and skipped LPs is stored in the `attrs` of the returned DataFrame, along with the optimal values of the objective variables (`objective_values`).
+        Reactions mapped to an empty list of `directions` (e.g. fluxes certified by `pymgpipe.pruning.analyze_structure`) are returned as NaN without solving any LPs and counted in `lp_certified`.
+
+        For parallel `regular` and `native` FVA, each worker loads the problem from `model` itself (in-memory models are first written to a temporary .mps file) and applies the `objective_percent` constraint locally.
+        Reactions are pulled from a shared queue in small batches whose size adapts to the measured time per LP, so a few slow reactions don't stall the whole run.
+
+        With `cache_dir` set, the initial solve is skipped when an optimum for the same problem is found in the cache (see `pymgpipe.cache.get_problem_key`).
+        The optimal basis (gurobi, glpk and native FVA only) is handed to every worker so that the first min/max solves start warm.
 
     """
         
+    import tqdm
+
     gc.enable()
 
     if fva_type == FVA_TYPE.FAST:
@@ -91,191 +133,972 @@ def fva(
         assert os.path.isdir(vffva_config.path), 'Could not find VFFVA folder at %s'%vffva_config.path
         path = model
 
-    model = load_model(path=model, solver=solver)
-    with suppress_stdout():
-        model.optimize()
-    if model.status == "infeasible":
-        raise Exception("%s model is infeasible!" % model.name)
-
     if reactions is None and regex is None and ex_only is True:
         regex = Constants.EX_REGEX
 
-    reactions_to_run = [r.name for r in get_reactions(model, reactions, regex)]
+    tmp_dir = tempfile.TemporaryDirectory()
+    try:
+        if reduce and fva_type != FVA_TYPE.FAST:
+            model, reactions, directions = _reduce_model(
+                model, fva_type, solver, reactions, regex, directions, tmp_dir.name
+            )
+            regex = None
+        source, model, model_name, reactions_to_run, optimum, _ = _initial_solve(
+            model, fva_type, solver, reactions, regex, cache_dir, tmp_dir
+        )
+        if directions is not None and fva_type != FVA_TYPE.FAST:
+            directions = _get_directions(directions, reactions_to_run, model, fva_type, model_name)
+        if fva_type == FVA_TYPE.NATIVE:
+            # workers load their own copy of the problem
+            model = None
+        objective_values = optimum.objective_values
 
-    out_df = pd.DataFrame()
-    if write_to_file:
-        out_file = out_file if out_file is not None else "%s_fva.csv" % model.name
-        out_df = load_dataframe(out_file, return_empty=True) if not force else pd.DataFrame()
+        out_df = pd.DataFrame()
+        if write_to_file:
+            out_file = out_file if out_file is not None else "%s_fva.csv" % model_name
+            if not force:
+                _drop_partial_line(out_file)
+            out_df = load_dataframe(out_file, return_empty=True) if not force else pd.DataFrame()
 
-        metabs_to_skip = list(out_df.index)
-        if len(metabs_to_skip) > 0:
-            print("\nFound existing file, skipping %s metabolites..." % len(metabs_to_skip))
-            reactions_to_run = [r for r in reactions_to_run if r not in metabs_to_skip]
+            metabs_to_skip = list(out_df.index)
+            if len(metabs_to_skip) > 0:
+                print("\nFound existing file, skipping %s metabolites..." % len(metabs_to_skip))
+                reactions_to_run = [r for r in reactions_to_run if r not in metabs_to_skip]
 
-    if len(reactions_to_run) == 0:
-        print("---Finished! No reactions left to run---")
-        return
+        if directions is not None and fva_type != FVA_TYPE.FAST:
+            reactions_to_run = [r for r in reactions_to_run if r in directions]
 
-    if parallel is False:
-        threads = 1
-        parallel = False
-    else:
-        threads = (
-            os.cpu_count() if threads == -1 or threads > os.cpu_count() else threads
+        if len(reactions_to_run) == 0:
+            print("---Finished! No reactions left to run---")
+            return
+
+        if parallel is False:
+            threads = 1
+            parallel = False
+        else:
+            threads = (
+                os.cpu_count() if threads == -1 or threads > os.cpu_count() else threads
+            )
+            threads = max(1, min(threads, len(reactions_to_run)))
+
+            parallel = False if threads <= 1 else parallel
+
+        logger.info(
+            "Starting parallel FVA on %s reactions using dynamic batches on %s threads...\n"
+            % (len(reactions_to_run), threads)
         )
-        threads = min(threads, len(reactions_to_run))
 
-        parallel = False if threads <= 1 else parallel
+        if fva_type in [FVA_TYPE.REGULAR, FVA_TYPE.NATIVE]:
+            # VFFVA does this automatically
+            objective_bounds = {}
+            if objective_percent is not None:
+                print(f'Constraining objective value to {objective_percent}% of optimal value...')
+                objective_bounds = _get_objective_bounds(objective_values, objective_percent)
 
-    split_reactions = np.array_split(reactions_to_run, threads)
-    logger.info(
-        "Starting parallel FVA on %s reactions using %s chunks on %s threads...\n"
-        % (len(reactions_to_run), threads, len(split_reactions))
-    )
+            # optimal basis is only usable by the solver that produced it
+            basis = None
+            if optimum.col_basis is not None and optimum.solver == (
+                "highs" if fva_type == FVA_TYPE.NATIVE else _get_solver_name(model)
+            ):
+                basis = (optimum.col_basis, optimum.row_basis)
 
-    if fva_type == FVA_TYPE.REGULAR:
-        # VFFVA does this automatically
-        if objective_percent is not None:
-            print(f'Constraining objective value to {objective_percent}% of optimal value...')
-            
-            prev_bounds = {}
-            primals = {v:v.primal for v in model.objective.expression.free_symbols}
-            for v, value in primals.items():
-                prev_bounds[v.name]=(v.lb,v.ub)
-                v.lb = float(value) * (objective_percent/100)
-                v.ub = float(value)
-                print(v)
-            
-            model.update()
-
-        _func = partial(_optlang_worker, threshold)
-        if parallel:
-            p = Pool(processes=threads, initializer=partial(_pool_init, model))
-            res = p.imap(_func, split_reactions)
-        else:
-            _pool_init(model)
-            res = map(_func, split_reactions)
+            if fva_type == FVA_TYPE.NATIVE:
+                _func = partial(_highs_worker, prune)
+            else:
+                _func = partial(_optlang_worker, prune)
 
-        for result in res:
-            result_df = pd.DataFrame.from_records(result, index="id")
-            out_df = pd.concat([out_df, result_df], axis=0)
-            out_df.sort_index(inplace=True)
+            tasks = [(r, directions[r] if directions is not None else _BOTH) for r in reactions_to_run]
+            # reactions without any direction left to solve are certified without an LP
+            records = [_get_record(r, dirs, {}) for r, dirs in tasks if len(dirs) == 0]
+            tasks = [t for t in tasks if len(t[1]) > 0]
+            solved, skipped, certified = 0, 0, len(records)
+            # extremes certified by any batch so far, handed to the batches that follow (see `_certify_shared`)
+            shared = {}
 
-            if write_to_file:
-                out_df.to_csv(out_file)
-        try:
-            p.close()
-            p.join()
-        except Exception:
-            pass
-
-        # reset
-        if objective_percent is not None:
-            for v, (lower, upper) in prev_bounds.items():
-                model.variables[v].set_bounds(lower, upper)
-
-            model.update()
-
-    elif fva_type == FVA_TYPE.FAST:
-        status = os.system("mpirun --version")
-        if status != 0:
-            raise ValueError(
-                [
-                    "MPI and/or CPLEX nont installed, please follow the install guide"
-                    "or use the quick install script"
-                ]
+            if parallel:
+                # workers load the problem themselves instead of receiving a pickled copy
+                if fva_type == FVA_TYPE.NATIVE:
+                    initializer = partial(_highs_pool_init, source, objective_bounds, basis)
+                else:
+                    if not isinstance(source, str):
+                        source = _write_temp_problem(model, tmp_dir)
+                    initializer = partial(
+                        _pool_init, source, _get_solver_name(model), objective_bounds, basis
+                    )
+
+                p = Pool(processes=threads, initializer=initializer)
+                submit = partial(_submit_async, p, _func, shared)
+            elif fva_type == FVA_TYPE.NATIVE:
+                _set_global_highs(*_load_highs(source, objective_bounds, basis))
+                submit = partial(_submit_serial, _func, shared)
+            else:
+                prev_objective = _get_objective(model)
+                prev_bounds = _constrain_objective(model, objective_bounds)
+                _set_global_model(model)
+                submit = partial(_submit_serial, _func, shared)
+
+            checkpoint = None
+            try:
+                checkpoint = _open_checkpoint(out_file, out_df.empty) if write_to_file else None
+                if checkpoint is not None and certified > 0:
+                    pd.DataFrame.from_records(records, index="id").to_csv(checkpoint, header=False)
+                    checkpoint.flush()
+                with tqdm.tqdm(total=len(tasks), leave=False) as progress:
+                    for result, stats in _schedule_batches(tasks, submit, threads):
+                        solved += stats["solved"]
+                        skipped += stats["skipped"]
+                        progress.update(len(result))
+                        for m, found in stats.get("certified", {}).items():
+                            shared.setdefault(m, {}).update(found)
+
+                        records.extend(result)
+                        if checkpoint is not None:
+                            pd.DataFrame.from_records(result, index="id").to_csv(
+                                checkpoint, header=False
+                            )
+                            checkpoint.flush()
+            finally:
+                if checkpoint is not None:
+                    checkpoint.close()
+                if parallel:
+                    # every batch has finished by now, unless something went wrong
+                    p.terminate()
+                    p.join()
+                elif fva_type == FVA_TYPE.REGULAR:
+                    # reset
+                    _constrain_objective(model, prev_bounds)
+                    _set_objective(model, prev_objective)
+
+            out_df = pd.concat(
+                [out_df, pd.DataFrame.from_records(records, index="id")], axis=0
             )
 
-        # Set schedule and chunk size parameters
-        os.environ["OMP_SCHEDUELE"] = schedule + str(len(split_reactions[0]))
+            if prune:
+                logger.info(
+                    "Skipped %s out of %s LPs using solution-guided pruning"
+                    % (skipped, solved + skipped)
+                )
+            if certified > 0:
+                logger.info("Certified %s reactions without solving any LPs" % certified)
+
+        elif fva_type == FVA_TYPE.FAST:
+            status = os.system("mpirun --version")
+            if status != 0:
+                raise ValueError(
+                    [
+                        "MPI and/or CPLEX nont installed, please follow the install guide"
+                        "or use the quick install script"
+                    ]
+                )
 
-        objective_percent = objective_percent if objective_percent is not None else -1
+            # Set schedule and chunk size parameters
+            os.environ["OMP_SCHEDUELE"] = schedule + str(int(np.ceil(len(reactions_to_run) / threads)))
 
-        var_dict = {i: v.name for i, v in enumerate(model.variables)}
-        var_dict_inv = {v: k for k, v in var_dict.items()}
+            objective_percent = objective_percent if objective_percent is not None else -1
 
-        ex_indices = [var_dict_inv[r] for r in reactions_to_run]
+            var_dict = {i: v.name for i, v in enumerate(model.variables)}
+            var_dict_inv = {v: k for k, v in var_dict.items()}
 
-        # Set reactions to optimize
-        rxns_file = "rxns_%s.txt" % model.name
-        with open(rxns_file, "w") as f:
-            for num in ex_indices:
-                f.write(str(num) + "\n")
+            ex_indices = [var_dict_inv[r] for r in reactions_to_run]
 
-        assert vffva_config.path is not None, "Please set value of `vffva_config.path` to location of VFFVA executable"
+            # Set reactions to optimize
+            rxns_file = "rxns_%s.txt" % model.name
+            with open(rxns_file, "w") as f:
+                for num in ex_indices:
+                    f.write(str(num) + "\n")
+
+            assert vffva_config.path is not None, "Please set value of `vffva_config.path` to location of VFFVA executable"
         
-        try:
-            status = os.system( "mpirun -np " + str(threads) + " --bind-to " + str(mem_aff) + " -x OMP_NUM_THREADS=" + str(1) + f" {vffva_config.path}/lib/veryfastFVA " + path + " " + str(objective_percent) + " " + str(scaling) + " " + rxns_file )
-        except:
-            raise Exception(
-                "Ran into issue when submitting VFFVA mpirun, please check installation- %s"
-                % status
-            )
+            try:
+                status = os.system( "mpirun -np " + str(threads) + " --bind-to " + str(mem_aff) + " -x OMP_NUM_THREADS=" + str(1) + f" {vffva_config.path}/lib/veryfastFVA " + path + " " + str(objective_percent) + " " + str(scaling) + " " + rxns_file )
+            except:
+                raise Exception(
+                    "Ran into issue when submitting VFFVA mpirun, please check installation- %s"
+                    % status
+                )
+
+            # Fetch results
+            resultFile = path[:-4] + "output.csv"
+            if not os.path.exists(resultFile):
+                raise Exception(
+                    "Ran into issue when running VFFVA, could not find results file..."
+                )
+            result_df = pd.read_csv(resultFile, header=0)
 
-        # Fetch results
-        resultFile = path[:-4] + "output.csv"
-        if not os.path.exists(resultFile):
-            raise Exception(
-                "Ran into issue when running VFFVA, could not find results file..."
+            os.system("rm " + resultFile)
+            os.system("rm " + rxns_file)
+            result_df.rename(
+                {i: var_dict[x] for i, x in enumerate(ex_indices) if i in result_df.index},
+                axis=0,
+                inplace=True,
             )
-        result_df = pd.read_csv(resultFile, header=0)
-
-        os.system("rm " + resultFile)
-        os.system("rm " + rxns_file)
-        result_df.rename(
-            {i: var_dict[x] for i, x in enumerate(ex_indices) if i in result_df.index},
-            axis=0,
-            inplace=True,
-        )
-        result_df.index.rename("id", inplace=True)
-        result_df.columns = ['min', 'max']
+            result_df.index.rename("id", inplace=True)
+            result_df.columns = ['min', 'max']
         
-        out_df = pd.concat([out_df, result_df], axis=0)
-    else:
-        raise Exception('`fva_type` must be equal to either FVA_TYPE.REGULAR or FVA_TYPE.FAST! Received %s'%fva_type)
+            out_df = pd.concat([out_df, result_df], axis=0)
+        else:
+            raise Exception('`fva_type` must be equal to either FVA_TYPE.REGULAR, FVA_TYPE.FAST or FVA_TYPE.NATIVE! Received %s'%fva_type)
+    finally:
+        tmp_dir.cleanup()
+
+    _format_result(out_df, threshold)
+    out_df.attrs["objective_values"] = objective_values
+    if fva_type in [FVA_TYPE.REGULAR, FVA_TYPE.NATIVE]:
+        out_df.attrs["lp_solved"] = solved
+        out_df.attrs["lp_skipped"] = skipped
+        out_df.attrs["lp_certified"] = certified
+
+    if write_to_file:
+        out_df.to_csv(out_file)
+
+    return out_df
 
+
+_BOTH = ("max", "min")
+
+
+def _get_directions(directions, reactions, problem, fva_type, name):
+    # Directions per reaction, ordered as `_BOTH` so that results don't depend on the order they were given in
+    if callable(directions):
+        if fva_type == FVA_TYPE.NATIVE:
+            problem = _get_highs_problem(problem[0], name)
+        else:
+            problem = get_linear_problem(problem)
+        directions = directions(reactions, problem)
+    return {
+        r: tuple(d for d in _BOTH if d in ([dirs] if isinstance(dirs, str) else dirs))
+        for r, dirs in directions.items()
+    }
+
+
+def _get_objective_bounds(objective_values, objective_percent):
+    if objective_percent is None:
+        return {}
+    return {
+        v: (value * (objective_percent / 100), value)
+        for v, value in objective_values.items()
+    }
+
+
+def _format_result(out_df, threshold):
     if threshold is not None:
         out_df[abs(out_df) < threshold] = 0
 
     out_df.sort_index(inplace=True)
     out_df.columns = ['min', 'max']
 
-    if write_to_file:
-        out_df.to_csv(out_file)
 
-    return out_df
+def _initial_solve(model, fva_type, solver, reactions, regex, cache_dir, tmp_dir):
+    """Loads and solves `model` (or fetches its optimum from `cache_dir`) and selects the target reactions
+
+    Returns `(source, problem, name, reactions, optimum, key)`, where `source` is the path each worker loads the problem from (in-memory models are only written to `tmp_dir` if needed),
+    `problem` is either the loaded optlang model or `(highspy.Highs, columns)` for native FVA and `key` is the cache key of the problem (None without `cache_dir`).
+    """
+    source = model
+    if fva_type == FVA_TYPE.NATIVE:
+        if not (isinstance(source, str) and source.endswith((".mps", ".mps.gz"))):
+            model = load_model(path=source, solver=solver)
+            source = _write_temp_problem(model, tmp_dir)
+        key = get_problem_key(model) if cache_dir is not None else None
+        optimum = load_optimum(cache_dir, key) if key is not None else None
+        cached = optimum is not None
+
+        model_name = os.path.basename(source).split(".")[0]
+        problem, columns = _load_highs(source)
+        if optimum is None:
+            optimum = Optimum(
+                _optimize_highs(problem, model_name), *_get_highs_basis(problem), "highs"
+            )
+        reactions_to_run = _select_columns(columns, reactions, regex)
+        problem = (problem, columns)
+    else:
+        model = load_model(path=model, solver=solver)
+        key = (
+            get_problem_key(source if isinstance(source, str) else model)
+            if cache_dir is not None
+            else None
+        )
+        optimum = load_optimum(cache_dir, key) if key is not None else None
+        cached = optimum is not None
+
+        if optimum is None:
+            with suppress_stdout():
+                model.optimize()
+            if model.status == "infeasible":
+                raise Exception("%s model is infeasible!" % model.name)
+
+            optimum = Optimum(
+                {v.name: float(v.primal) for v in model.objective.variables},
+                *(get_basis(model) or (None, None)),
+                _get_solver_name(model),
+            )
+        elif optimum.solver == _get_solver_name(model) and optimum.col_basis is not None:
+            set_basis(model, optimum.col_basis, optimum.row_basis)
+
+        problem = model
+        model_name = model.name
+        reactions_to_run = [r.name for r in get_reactions(model, reactions, regex)]
+
+    if cached:
+        logger.info("Using cached optimum for %s" % model_name)
+    elif key is not None:
+        save_optimum(cache_dir, key, optimum)
+    return source, problem, model_name, reactions_to_run, optimum, key
+
+
+def _reduce_model(model, fva_type, solver, reactions, regex, directions, tmp_dir):
+    """Reduces `model` to its target reactions and objective, returns `(model, reactions, directions)` to run FVA on instead
+
+    Function `directions` are evaluated on the original problem, so that structural pruning still sees the full model.
+    For native FVA, the reduced problem is written to `tmp_dir` and its path is returned.
+    """
+    model = load_model(path=model, solver=solver)
+    reactions = [r.name for r in get_reactions(model, reactions, regex)]
+    reduction = reduce_problem(model, keep=reactions + [_get_reverse_id(r) for r in reactions])
+
+    original, problem = reduction.original, reduction.problem
+    logger.info(
+        "Reduced %s from %s variables and %s constraints to %s variables and %s constraints"
+        % (model.name, len(original.col_names), len(original.row_names), len(problem.col_names), len(problem.row_names))
+    )
+    if callable(directions):
+        directions = directions(reactions, original)
+
+    model = build_model(problem, _get_solver_name(model))
+    if fva_type == FVA_TYPE.NATIVE:
+        path = os.path.join(tmp_dir, "%s.mps" % model.name)
+        write_lp_problem(model, out_file=path, compress=False)
+        return path, reactions, directions
+    return model, reactions, directions
+
+
+def _write_temp_problem(model, tmp_dir):
+    path = os.path.join(tmp_dir.name, "%s.mps" % model.name)
+    write_lp_problem(model, out_file=path, compress=False)
+    return path
+
+
+def _open_checkpoint(out_file, new):
+    """Opens `out_file` for appending one row per finished reaction (a new file starts with just the header)"""
+    if new or not os.path.exists(out_file):
+        f = open(out_file, "w")
+        f.write("id,min,max\n")
+        return f
+    return open(out_file, "a")
+
+
+def _drop_partial_line(out_file):
+    # An interrupted run can leave a half-written last row behind
+    if not os.path.exists(out_file):
+        return
+    with open(out_file, "rb+") as f:
+        content = f.read()
+        if len(content) > 0 and not content.endswith(b"\n"):
+            f.truncate(content.rfind(b"\n") + 1)
+
+
+def _schedule_batches(reactions, submit, workers, target_time=2.0, max_batch=64, jobs=()):
+    """Hands out reactions in small batches and yields `(result, stats)` as each batch finishes
+
+    Batches are pulled from a shared queue by whichever worker is free. The first batches are single reactions;
+    after that, the batch size is chosen so that a batch takes roughly `target_time` seconds based on the measured time per LP.
+    Batches also shrink as the queue drains so that no worker is left with a long tail of reactions.
+
+    `jobs` (callables that submit themselves and put a single `_JobResult` on the queue they're given, i.e. the initial solves of a cohort) run alongside the batches,
+    at most `workers` at a time, and are yielded as `(None, value)`. Reactions can be added to `reactions` (a deque) whenever a job is yielded.
+    """
+    pending = reactions if isinstance(reactions, deque) else deque(reactions)
+    jobs = deque(jobs)
+    done = Queue()
+    in_flight, jobs_in_flight = 0, 0
+    lp_time = None
+
+    while pending or jobs or in_flight > 0:
+        while (pending or jobs) and in_flight < 2 * workers:
+            if jobs and (jobs_in_flight < workers or not pending):
+                jobs.popleft()(done)
+                jobs_in_flight += 1
+            else:
+                size = 1 if lp_time is None else int(target_time / max(lp_time, 1e-6))
+                size = max(1, min(size, max_batch, len(pending) // (2 * workers)))
+
+                submit([pending.popleft() for _ in range(min(size, len(pending)))], done)
+            in_flight += 1
+
+        res = done.get()
+        in_flight -= 1
+        if isinstance(res, BaseException):
+            raise res
+        if isinstance(res, _JobResult):
+            jobs_in_flight -= 1
+            yield None, res.value
+            continue
+
+        result, stats = res
+        if stats["solved"] > 0:
+            per_lp = stats["time"] / stats["solved"]
+            lp_time = per_lp if lp_time is None else 0.8 * lp_time + 0.2 * per_lp
+        yield result, stats
+
+
+_JobResult = namedtuple("_JobResult", "value")
+
+
+def _submit_async(pool, func, shared, batch, done):
+    known = {m: shared[m] for m, _ in batch if m in shared}
+    pool.apply_async(func, (batch, known), callback=done.put, error_callback=done.put)
+
+
+def _submit_serial(func, shared, batch, done):
+    done.put(func(batch, {m: shared[m] for m, _ in batch if m in shared}))
 
 
 # works for both cplex and gurobi
-def _optlang_worker(threshold, metabolites):
+def _optlang_worker(prune, tasks, known=None):
+    # `tasks` holds (reaction, directions) pairs, `known` extremes certified by earlier batches
     global global_model
 
+    start = time.time()
+    # same settings `solve_model` uses
+    global_model.configuration.verbosity = 0
+    global_model.configuration.presolve = True
+    _set_method(global_model, "primal")
+    index = _get_variable_index(global_model)
+    bounds = {}
+    for m, _ in tasks:
+        reverse = index.reverse[index.positions[m]]
+        bounds[m] = (
+            index.positions[m],
+            reverse if reverse < len(index.names) else None,
+        ) + get_reaction_bounds(global_model, m)
+    found = {m: dict(known.get(m, {})) if known else {} for m, _ in tasks}
+
+    stats = {"solved": 0, "skipped": 0, "certified": {}}
     result = []
-    for m in metabolites:
+    for m, directions in tasks:
+        forward, reverse = bounds[m][:2]
         net = global_model.variables[m]
+        if reverse is not None:
+            net -= global_model.variables[index.names[reverse]]
+
+        for direction in directions:
+            if direction in found[m]:
+                stats["skipped"] += 1
+                continue
+
+            global_model.objective = Objective(net, direction=direction)
+            # the objective value is the net flux, so the primal vector is all that's fetched
+            primals = _solve_primals(global_model)
+            found[m][direction] = primals[forward] - (primals[reverse] if reverse is not None else 0)
+            stats["solved"] += 1
 
-        reverse_id = _get_reverse_id(m)
-        if reverse_id in global_model.variables:
-            net -= global_model.variables[reverse_id]
+            if prune:
+                _certify_extremes(primals, bounds, found)
+                _certify_shared(primals, stats["certified"])
 
-        global_model.objective = Objective(net, direction="max")
-        max_sol = solve_model(model=global_model, reactions=[m]).to_dict()[
-            global_model.name
-        ][m]
+        result.append(_get_record(m, directions, found[m]))
 
-        global_model.objective = Objective(net, direction="min")
-        min_sol = solve_model(model=global_model, reactions=[m]).to_dict()[
-            global_model.name
-        ][m]
+    stats["time"] = time.time() - start
+    return result, stats
 
-        result.append({"id": m, "min": min_sol, "max": max_sol})
-    return result
 
-def _pool_init(sample_model):
+def _solve_primals(model):
+    # Values of every variable, in the order of `_get_variable_index`
+    model.optimize()
+    if model.status == "infeasible":
+        raise InfeasibleModelException("%s is infeasible!" % model.name)
+    return np.asarray(model._get_primal_values(), dtype=float)
+
+
+def _get_record(m, directions, found):
+    # Directions that weren't asked for are left empty, even if pruning certified them
+    return {
+        "id": m,
+        "min": found["min"] if "min" in directions else np.nan,
+        "max": found["max"] if "max" in directions else np.nan,
+    }
+
+
+def _certify_extremes(primals, bounds, found, tol=1e-9):
+    # A reaction sitting at its own bound in a feasible solution has reached its extreme in that direction
+    for m, (forward, reverse, lower, upper) in bounds.items():
+        if len(found[m]) == 2:
+            continue
+
+        flux = primals[forward] - (primals[reverse] if reverse is not None else 0)
+        if "max" not in found[m] and not isinf(upper) and flux >= upper - tol * max(1, abs(upper)):
+            found[m]["max"] = upper
+        if "min" not in found[m] and not isinf(lower) and flux <= lower + tol * max(1, abs(lower)):
+            found[m]["min"] = lower
+
+_NetBounds = namedtuple("_NetBounds", "names forward reverse lower upper reported")
+
+
+def _get_net_bounds(names, lower, upper):
+    # Net bounds of every reaction (forward minus reverse variable), `reported` keeps track of the extremes already handed back by this worker
+    positions = {n: i for i, n in enumerate(names)}
+    reverse = np.array([positions.get(_get_reverse_id(n), -1) for n in names], dtype=int)
+    forward = np.setdiff1d(np.arange(len(names)), reverse[reverse >= 0])
+    reverse = reverse[forward]
+    has_reverse = reverse >= 0
+    lower, upper = np.asarray(lower, dtype=float), np.asarray(upper, dtype=float)
+    return _NetBounds(
+        np.asarray(names, dtype=object)[forward],
+        forward,
+        reverse,
+        lower[forward] - np.where(has_reverse, upper[reverse], 0),
+        upper[forward] - np.where(has_reverse, lower[reverse], 0),
+        {"min": np.zeros(len(forward), dtype=bool), "max": np.zeros(len(forward), dtype=bool)},
+    )
+
+
+def _certify_shared(primals, certified, tol=1e-9):
+    # Same test as `_certify_extremes`, applied to every reaction of the problem so that reactions of later batches are certified too
+    net = global_net_bounds
+    if net is None:
+        return
+    flux = primals[net.forward] - np.where(net.reverse >= 0, primals[net.reverse], 0)
+    with np.errstate(invalid="ignore"):
+        hits = [
+            ("max", net.upper, flux >= net.upper - tol * np.maximum(1, abs(net.upper))),
+            ("min", net.lower, flux <= net.lower + tol * np.maximum(1, abs(net.lower))),
+        ]
+    for direction, bound, hit in hits:
+        new = np.flatnonzero(hit & np.isfinite(bound) & ~net.reported[direction])
+        net.reported[direction][new] = True
+        for i in new:
+            certified.setdefault(net.names[i], {})[direction] = float(bound[i])
+
+
+def _pool_init(path, solver, objective_bounds, basis=None):
     sys.stdout = open(os.devnull, "w")
+    _set_global_model(_load_worker_model(path, solver, objective_bounds, basis))
+
+
+def _load_worker_model(path, solver, objective_bounds, basis=None):
+    model = load_model(path=path, solver=solver)
+    if basis is not None:
+        set_basis(model, *basis)
+    _constrain_objective(model, objective_bounds)
+    return model
+
+
+def _set_global_model(model):
+    global global_model, global_net_bounds
+    global_model = model
+    global_net_bounds = _get_net_bounds(
+        _get_variable_index(model).names,
+        [-np.inf if v.lb is None else v.lb for v in model.variables],
+        [np.inf if v.ub is None else v.ub for v in model.variables],
+    )
+
+
+def _constrain_objective(model, objective_bounds):
+    # Returns previous bounds so the constraint can be undone
+    prev_bounds = {}
+    for v, (lower, upper) in objective_bounds.items():
+        prev_bounds[v] = (model.variables[v].lb, model.variables[v].ub)
+        model.variables[v].set_bounds(lower, upper)
+    model.update()
+    return prev_bounds
+
+
+def _get_objective(model):
+    return (
+        model.objective.get_linear_coefficients(model.objective.variables),
+        model.objective.direction,
+    )
+
+
+def _set_objective(model, objective):
+    coefficients, direction = objective
+    model.objective = model.interface.Objective(Zero, direction=direction)
+    model.objective.set_linear_coefficients(coefficients)
+    model.update()
+
+
+def _load_highs(path, objective_bounds=None, basis=None):
+    try:
+        import highspy
+    except ImportError:
+        raise Exception("Native FVA requires HiGHS, please install it with `pip install highspy`")
+
+    problem = highspy.Highs()
+    problem.setOptionValue("output_flag", False)
+    if problem.readModel(path) != highspy.HighsStatus.kOk:
+        raise Exception("Provided model is not a valid .mps file- %s" % path)
+
+    columns = {c: i for i, c in enumerate(problem.getLp().col_names_)}
+    _constrain_highs(problem, columns, objective_bounds or {})
+    if basis is not None:
+        _set_highs_basis(problem, *basis)
+    return problem, columns
+
+
+def _optimize_highs(problem, name):
+    # Returns optimal values of the objective variables
+    import highspy
+
+    problem.run()
+    if problem.getModelStatus() != highspy.HighsModelStatus.kOptimal:
+        raise Exception("%s model is infeasible!" % name)
+
+    lp = problem.getLp()
+    primals = problem.getSolution().col_value
+    return {
+        lp.col_names_[i]: float(primals[i])
+        for i in np.flatnonzero(lp.col_cost_)
+    }
+
+
+def _constrain_highs(problem, columns, objective_bounds):
+    for v, (lower, upper) in objective_bounds.items():
+        problem.changeColBounds(columns[v], lower, upper)
+
+
+def _get_highs_basis(problem):
+    # Returns (None, None) if HiGHS didn't end up with a valid basis
+    basis = problem.getBasis()
+    if not basis.valid:
+        return None, None
+    return (
+        np.array([int(s) for s in basis.col_status], dtype=np.int8),
+        np.array([int(s) for s in basis.row_status], dtype=np.int8),
+    )
+
+
+def _set_highs_basis(problem, col_basis, row_basis):
+    import highspy
+
+    lp = problem.getLp()
+    if len(col_basis) != lp.num_col_ or len(row_basis) != lp.num_row_:
+        return
+    basis = highspy.HighsBasis()
+    basis.col_status = [highspy.HighsBasisStatus(int(s)) for s in col_basis]
+    basis.row_status = [highspy.HighsBasisStatus(int(s)) for s in row_basis]
+    basis.valid = True
+    problem.setBasis(basis)
+
+
+def _select_columns(columns, reactions=None, regex=None):
+    # Mirrors `get_reactions` for problems that are not loaded through optlang
+    if reactions is not None and len(reactions) > 0:
+        return [r for r in reactions if r in columns]
+    elif regex is not None:
+        return [
+            c for c in columns
+            if re.match(regex, c, re.IGNORECASE) and "reverse" not in c
+        ]
+    return [c for c in columns if "reverse" not in c]
+
+
+def _highs_pool_init(path, objective_bounds, basis=None):
+    sys.stdout = open(os.devnull, "w")
+    _set_global_highs(*_load_highs(path, objective_bounds, basis))
+
+
+def _set_global_highs(problem, columns):
+    global global_highs, global_net_bounds
+    global_highs = _get_highs_state(problem, columns)
+    global_net_bounds = _get_net_bounds(list(columns), global_highs[2], global_highs[3])
+
+
+def _get_highs_state(problem, columns):
+    # Objective is replaced per reaction, bounds are cached for pruning
+    lp = problem.getLp()
+    problem.changeColsCost(
+        lp.num_col_, np.arange(lp.num_col_, dtype=np.int32), np.zeros(lp.num_col_)
+    )
+    return (problem, columns, np.array(lp.col_lower_), np.array(lp.col_upper_))
+
+
+def _highs_worker(prune, tasks, known=None):
+    import highspy
+
+    problem, columns, lower, upper = global_highs
+    senses = {"max": highspy.ObjSense.kMaximize, "min": highspy.ObjSense.kMinimize}
+
+    start = time.time()
+    bounds = {}
+    for m, _ in tasks:
+        f = columns[m]
+        r = columns.get(_get_reverse_id(m))
+        if r is None:
+            bounds[m] = (f, None, lower[f], upper[f])
+        else:
+            bounds[m] = (f, r, lower[f] - upper[r], upper[f] - lower[r])
+    found = {m: dict(known.get(m, {})) if known else {} for m, _ in tasks}
+
+    stats = {"solved": 0, "skipped": 0, "certified": {}}
+    result = []
+    for m, directions in tasks:
+        f, r = bounds[m][:2]
+        indices = [f] if r is None else [f, r]
+        problem.changeColsCost(
+            len(indices), np.array(indices, dtype=np.int32), np.array([1.0, -1.0][:len(indices)])
+        )
+
+        for direction in directions:
+            if direction in found[m]:
+                stats["skipped"] += 1
+                continue
+
+            # basis from the previous solve is kept, so each LP is warm-started
+            problem.changeObjectiveSense(senses[direction])
+            problem.run()
+            if problem.getModelStatus() != highspy.HighsModelStatus.kOptimal:
+                raise InfeasibleModelException(
+                    "Could not solve %s of %s- %s" % (direction, m, problem.getModelStatus())
+                )
+            found[m][direction] = problem.getInfo().objective_function_value
+            stats["solved"] += 1
+
+            if prune:
+                primals = np.array(problem.getSolution().col_value)
+                _certify_extremes(primals, bounds, found)
+                _certify_shared(primals, stats["certified"])
+
+        problem.changeColsCost(
+            len(indices), np.array(indices, dtype=np.int32), np.zeros(len(indices))
+        )
+        result.append(_get_record(m, directions, found[m]))
+
+    stats["time"] = time.time() - start
+    return result, stats
+
+
+_CohortConfig = namedtuple(
+    "_CohortConfig",
+    "fva_type solver reactions regex objective_percent cache_dir prune max_resident directions reduce tmp_dir",
+)
+
+
+def _cohort_fva(
+    samples,
+    fva_type=FVA_TYPE.REGULAR,
+    reactions=None,
+    regex=None,
+    solver="gurobi",
+    threads=1,
+    threshold=1e-5,
+    objective_percent=None,
+    cache_dir=None,
+    prune=True,
+    max_resident=2,
+    directions=None,
+    reduce=False,
+):
+    """Runs FVA on all `samples` using a single process pool, yields `(sample, result)` as each sample finishes
+
+    Samples are solved in parallel, and the reactions of each sample are handed out as (sample, reaction-batch) tasks by `_schedule_batches` as soon as its initial solve finishes,
+    so small samples don't leave workers idle and results don't wait on the slowest initial solve. Each worker keeps up to `max_resident` problems loaded (evicting the least recently used one)
+    and loads any other sample it's given from its path. A sample that cannot be solved yields its exception instead of a result.
+    `directions` and `reduce` are applied to every sample as in `fva` by the worker that solves the sample, which writes the reduced problem to a temporary file for other workers to load.
+    """
+    tmp_dir = tempfile.TemporaryDirectory()
+    # workers load every sample from a path
+    sources = {}
+    for sample in samples:
+        if isinstance(sample, str) and (
+            fva_type == FVA_TYPE.REGULAR or sample.endswith((".mps", ".mps.gz"))
+        ):
+            sources.setdefault(sample, sample)
+        else:
+            # samples can share a name, so every written problem gets its own directory
+            model = load_model(path=sample, solver=solver)
+            path = os.path.join(tempfile.mkdtemp(dir=tmp_dir.name), "%s.mps" % model.name)
+            write_lp_problem(model, out_file=path, compress=False)
+            sources[path] = sample
+
+    config = _CohortConfig(
+        fva_type, solver, reactions, regex, objective_percent, cache_dir, prune, max_resident, directions, reduce, tmp_dir.name
+    )
+    p = Pool(processes=threads, initializer=_cohort_init, initargs=(config,))
+    try:
+        objective_values, objective_bounds, problems, records, stats, pending = {}, {}, {}, {}, {}, deque()
+        jobs = [partial(_submit_prepare, p, source) for source in sources]
+        submit = partial(_submit_cohort, p, objective_bounds, problems)
+        for result, prepared in _schedule_batches(pending, submit, threads, jobs=jobs):
+            if result is None:
+                source, res = prepared
+                if isinstance(res, Exception):
+                    yield sources[source], res
+                    continue
+                reactions_to_run, sample_directions, objective_values[source], problems[source] = res
+                if sample_directions is not None:
+                    reactions_to_run = [r for r in reactions_to_run if r in sample_directions]
+                if len(reactions_to_run) == 0:
+                    yield sources[source], None
+                    continue
+
+                objective_bounds[source] = _get_objective_bounds(
+                    objective_values[source], objective_percent
+                )
+                tasks = [
+                    (r, sample_directions[r] if sample_directions is not None else _BOTH)
+                    for r in reactions_to_run
+                ]
+                # reactions without any direction left to solve are certified without an LP
+                records[source] = [_get_record(r, dirs, {}) for r, dirs in tasks if len(dirs) == 0]
+                stats[source] = {
+                    "solved": 0,
+                    "skipped": 0,
+                    "certified": len(records[source]),
+                    "total": len(reactions_to_run),
+                }
+                if len(records[source]) == len(tasks):
+                    yield sources[source], _get_cohort_result(source, records, stats, objective_values, threshold)
+                    continue
+                pending.extend((source, r, dirs) for r, dirs in tasks if len(dirs) > 0)
+                continue
+
+            for source, res, res_stats in result:
+                if source not in records:
+                    continue
+                if isinstance(res, Exception):
+                    del records[source]
+                    yield sources[source], res
+                    continue
+
+                records[source].extend(res)
+                stats[source]["solved"] += res_stats["solved"]
+                stats[source]["skipped"] += res_stats["skipped"]
+                if len(records[source]) == stats[source]["total"]:
+                    yield sources[source], _get_cohort_result(source, records, stats, objective_values, threshold)
+    finally:
+        p.terminate()
+        p.join()
+        tmp_dir.cleanup()
+
+
+def _get_cohort_result(source, records, stats, objective_values, threshold):
+    out_df = pd.DataFrame.from_records(records.pop(source), index="id")
+    _format_result(out_df, threshold)
+    out_df.attrs["lp_solved"] = stats[source]["solved"]
+    out_df.attrs["lp_skipped"] = stats[source]["skipped"]
+    out_df.attrs["lp_certified"] = stats[source]["certified"]
+    out_df.attrs["objective_values"] = objective_values[source]
+    return out_df
+
+
+def _submit_prepare(pool, source, done):
+    pool.apply_async(
+        _cohort_prepare, (source,), callback=lambda res: done.put(_JobResult((source, res))), error_callback=done.put
+    )
+
+
+def _submit_cohort(pool, objective_bounds, problems, batch, done):
+    bounds = {source: objective_bounds[source] for source, _, _ in batch}
+    batch_problems = {source: problems[source] for source, _, _ in batch}
+    pool.apply_async(
+        _cohort_worker, (batch, bounds, batch_problems), callback=done.put, error_callback=done.put
+    )
+
+
+def _cohort_init(config):
+    sys.stdout = open(os.devnull, "w")
+
+    global cohort_config, resident_problems, global_net_bounds
+    cohort_config = config
+    resident_problems = OrderedDict()
+    # workers switch between problems, so extremes are only certified within a batch
+    global_net_bounds = None
+
+
+def _cohort_prepare(source):
+    # Initial solve of a sample, the solved problem stays resident in this worker
+    # Returns the path (and cache key) of the problem that was solved, which is what other workers load
+    c = cohort_config
+    try:
+        model, reactions, regex, directions = source, c.reactions, c.regex, c.directions
+        if c.reduce:
+            # samples can share a name, so every reduced problem gets its own directory
+            reduced_dir = tempfile.mkdtemp(dir=c.tmp_dir)
+            model, reactions, directions = _reduce_model(
+                source, c.fva_type, c.solver, reactions, regex, directions, reduced_dir
+            )
+            regex = None
+
+        _, problem, name, reactions_to_run, optimum, key = _initial_solve(
+            model, c.fva_type, c.solver, reactions, regex, c.cache_dir, None
+        )
+        path = source
+        if c.reduce:
+            path = model if isinstance(model, str) else os.path.join(reduced_dir, "%s.mps" % name)
+            if not isinstance(model, str):
+                write_lp_problem(problem, out_file=path, compress=False)
+
+        if directions is not None:
+            directions = _get_directions(directions, reactions_to_run, problem, c.fva_type, name)
+        objective_bounds = _get_objective_bounds(optimum.objective_values, c.objective_percent)
+        if c.fva_type == FVA_TYPE.NATIVE:
+            _constrain_highs(*problem, objective_bounds)
+            _make_resident(path, _get_highs_state(*problem))
+        else:
+            _constrain_objective(problem, objective_bounds)
+            _make_resident(path, problem)
+    except Exception as e:
+        # solver exceptions are not always picklable
+        return Exception(str(e))
+    return reactions_to_run, directions, optimum.objective_values, (path, key)
+
+
+def _cohort_worker(batch, objective_bounds, problems):
+    c = cohort_config
+    func = (
+        partial(_highs_worker, c.prune)
+        if c.fva_type == FVA_TYPE.NATIVE
+        else partial(_optlang_worker, c.prune)
+    )
+
+    start = time.time()
+    stats = {"solved": 0, "skipped": 0}
+    result = []
+    for source, group in groupby(batch, key=itemgetter(0)):
+        try:
+            _activate_resident(*problems[source], objective_bounds[source])
+            records, res_stats = func([(r, directions) for _, r, directions in group])
+        except Exception as e:
+            result.append((source, Exception(str(e)), None))
+            continue
+
+        stats["solved"] += res_stats["solved"]
+        stats["skipped"] += res_stats["skipped"]
+        result.append((source, records, res_stats))
+
+    stats["time"] = time.time() - start
+    return result, stats
+
+
+def _activate_resident(path, key, objective_bounds):
+    # Points the worker globals at the problem at `path` (with cache key `key`), loading it first if it isn't resident
+    global global_model, global_highs
+    c = cohort_config
+
+    if path in resident_problems:
+        resident_problems.move_to_end(path)
+    else:
+        basis = None
+        if key is not None:
+            optimum = load_optimum(c.cache_dir, key)
+            if optimum is not None and optimum.col_basis is not None and optimum.solver == (
+                "highs" if c.fva_type == FVA_TYPE.NATIVE else c.solver
+            ):
+                basis = (optimum.col_basis, optimum.row_basis)
+
+        if c.fva_type == FVA_TYPE.NATIVE:
+            _make_resident(path, _get_highs_state(*_load_highs(path, objective_bounds, basis)))
+        else:
+            _make_resident(path, _load_worker_model(path, c.solver, objective_bounds, basis))
+
+    if c.fva_type == FVA_TYPE.NATIVE:
+        global_highs = resident_problems[path]
+    else:
+        global_model = resident_problems[path]
 
-    global global_model
-    global_model = sample_model
 
-    global global_problem
-    global_problem = sample_model.problem
+def _make_resident(path, problem):
+    resident_problems[path] = problem
+    resident_problems.move_to_end(path)
+    while len(resident_problems) > cohort_config.max_resident:
+        resident_problems.popitem(last=False)
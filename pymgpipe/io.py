@@ -1,16 +1,24 @@
 import os
 import sys
-import cobra
+import gzip
+import shutil
+import tempfile
 import os.path as path
 import pickle
+import queue
 import optlang
+import threading
+import numpy as np
 from .logger import logger
+from collections import deque
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 
 class UnsupportedSolverException(Exception):
     def __init__(
         self,
-        msg="Unrecognized solver. Supported solvers include gurobi and cplex",
+        msg="Unrecognized solver. Supported solvers include gurobi, cplex, glpk and highs",
         *args,
         **kwargs
     ):
@@ -28,25 +36,48 @@ def suppress_stdout():
             sys.stdout = old_stdout
 
 
+# cobra.io functions are looked up by name on first use (see `_get_cobra_func`), importing COBRA takes seconds
 _read_funcs = {
-    ".xml": cobra.io.read_sbml_model,
-    ".gz": cobra.io.read_sbml_model,
-    ".mat": cobra.io.load_matlab_model,
-    ".json": cobra.io.load_json_model,
+    ".xml": "read_sbml_model",
+    ".gz": "read_sbml_model",
+    ".mat": "load_matlab_model",
+    ".json": "load_json_model",
     ".pickle": lambda fn: pickle.load(open(fn, "rb")),
 }
 
 _write_funcs = {
-    ".xml": cobra.io.write_sbml_model,
-    ".gz": cobra.io.write_sbml_model,
-    ".mat": cobra.io.save_matlab_model,
-    ".json": cobra.io.save_json_model,
+    ".xml": "write_sbml_model",
+    ".gz": "write_sbml_model",
+    ".mat": "save_matlab_model",
+    ".json": "save_json_model",
     ".pickle": lambda fn: pickle.dump(open(fn, "wb")),
 }
 
 
+def _get_cobra_func(funcs, ext):
+    import cobra.io
+
+    func = funcs[ext]
+    return getattr(cobra.io, func) if isinstance(func, str) else func
+
+
+def _is_cobra_model(model):
+    # a COBRA model can't exist before COBRA is imported, so this check never imports it
+    cobra = sys.modules.get("cobra")
+    return cobra is not None and isinstance(model, cobra.Model)
+
+
+# compressed formats written by pymgpipe itself (see `compress_file`), rather than by the solver or COBRA
+_COMPRESSED_EXTENSIONS = (".gz", ".zst")
+_GZIP_CHUNK_SIZE = 1 << 22
+
+
 def show_available_solvers():
-    return [k.lower() for k, v in optlang.available_solvers.items() if v]
+    solvers = [k.lower() for k, v in optlang.available_solvers.items() if v]
+    # optlang's HiGHS interface also needs OSQP
+    if "highs" in solvers and not hasattr(optlang, "hybrid_interface"):
+        solvers.remove("highs")
+    return solvers
 
 
 def _get_optlang_interface(solver):
@@ -62,52 +93,254 @@ def _get_optlang_interface(solver):
         return optlang.cplex_interface
     elif solver == "glpk":
         return optlang.glpk_interface
+    elif solver == "highs":
+        return optlang.hybrid_interface
     else:
         raise Exception(
-            "Provided solver %s is unsupported. Solver must either be `gurobi` or `cplex`."
+            "Provided solver %s is unsupported. Solver must be one of `gurobi`, `cplex`, `glpk` or `highs`."
             % solver
         )
 
 
+def _get_cobra_solver(solver):
+    # COBRA refers to optlang's HiGHS interface as `hybrid`
+    return "hybrid" if solver == "highs" else solver
+
+
+def _set_cobra_solver(model, solver):
+    # HiGHS doesn't support the `primal` LP method, which would otherwise be cloned over from the current solver
+    if _get_cobra_solver(solver) != _get_cobra_solver(_get_solver_name(model.solver)):
+        model.solver.configuration.lp_method = "auto"
+    model.solver = _get_cobra_solver(solver)
+
+
+def _get_solver_name(model):
+    name = model.interface.__name__.split(".")[-1].replace("_interface", "")
+    return "highs" if name == "hybrid" else name
+
+
 # Loads cobra file and returns cobrapy model
 # RETURNS- cobra model
 def load_cobra_model(file, solver="gurobi"):
-    """Loads and returns COBRA model"""
+    """Loads and returns COBRA model (.zst compressed models are decompressed to a temporary file first)"""
+    if file.endswith(".zst"):
+        with _decompressed(file) as tmp:
+            return load_cobra_model(tmp, solver)
+
     _, ext = path.splitext(file)
-    read_func = _read_funcs[ext]
+    read_func = _get_cobra_func(_read_funcs, ext)
     try:
         with suppress_stdout():
             model = read_func(file)
     except Exception:
         raise Exception("Error reading cobra model at %s" % file)
     model.name = file.split("/")[-1].split(".")[0]
-    model.solver = solver
+    _set_cobra_solver(model, solver)
 
     return model
 
 
-def write_cobra_model(model, file):
+def write_cobra_model(model, file, threads=-1):
     """Writes COBRA model to file
-    
+
+    Models written to .gz or .zst files (i.e. `model.xml.gz`) are written uncompressed first and then compressed on `threads` threads (see `compress_file`).
+
     Warning: COBRA won't save any custom modifications added to the model (i.e. coupling constraints, diet, etc). For this reason, we recommend working and using the corresponding optlang LP problems.
     """
-    _, ext = path.splitext(file)
-    write_func = _write_funcs[ext]
+    _stage_cobra_model(model, file, threads)()
+
+
+def _stage_cobra_model(model, file, threads=-1):
+    # Same as `_stage_lp_problem`. SBML models are serialized by the returned callable, which only reads the model's Python attributes (the objective is read here, so it's cached by optlang). The model can't be modified until it's run
+    compressed = file.endswith(_COMPRESSED_EXTENSIONS)
+    tmp_dir, out_file = _get_uncompressed_path(file) if compressed else (None, file)
+    _, ext = path.splitext(out_file)
+
     try:
         with suppress_stdout():
-            write_func(model, file)
+            if ext == ".xml":
+                model.solver.objective.expression
+                write = partial(_write_sbml_model, model, out_file)
+            else:
+                _get_cobra_func(_write_funcs, ext)(model, out_file)
+                write = _done
     except Exception:
+        if compressed:
+            tmp_dir.cleanup()
         raise Exception("Error writing cobra model to %s" % file)
 
+    if compressed:
+        return partial(_write_compressed, write, tmp_dir, out_file, file, threads)
+    return write
+
+
+def _write_sbml_model(model, file):
+    from cobra.io import write_sbml_model
+
+    # runs on writer threads, where swapping sys.stdout (see `suppress_stdout`) would race with the calling thread
+    try:
+        write_sbml_model(model, file)
+    except Exception:
+        raise Exception("Error writing cobra model to %s" % file)
+
+
+def compress_file(in_file, out_file, threads=-1, level=None):
+    """Compresses `in_file` to `out_file` using gzip or zstd, depending on the extension of `out_file` (.gz or .zst)
+
+    Both formats are compressed on `threads` threads, independently of any solver or COBRA model, so compression can also be moved off the thread that builds models.
+    gzip files are written as a series of independently compressed members, which is valid gzip that every gzip reader (including the solvers) reads as one stream.
+    zstd compression requires `zstandard`.
+
+    Args:
+        in_file (str): File to compress
+        out_file (str): Compressed file
+        threads (int): Number of compression threads, -1 uses all cpus
+        level (int): Compression level, defaults to 6 for gzip and 3 for zstd
+    """
+    threads = os.cpu_count() if threads == -1 else max(1, threads)
+    if out_file.endswith(".zst"):
+        zstd = _import_zstd()
+        compressor = zstd.ZstdCompressor(level=3 if level is None else level, threads=threads if threads > 1 else 0)
+        with open(in_file, "rb") as f_in, open(out_file, "wb") as f_out:
+            compressor.copy_stream(f_in, f_out)
+    elif out_file.endswith(".gz"):
+        level = 6 if level is None else level
+        with open(in_file, "rb") as f_in, open(out_file, "wb") as f_out, ThreadPoolExecutor(threads) as pool:
+            # zlib releases the GIL, so members are compressed in parallel. At most 2 chunks per thread are held in memory
+            pending = deque()
+            for chunk in iter(lambda: f_in.read(_GZIP_CHUNK_SIZE), b""):
+                pending.append(pool.submit(gzip.compress, chunk, level, mtime=0))
+                if len(pending) >= 2 * threads:
+                    f_out.write(pending.popleft().result())
+            while pending:
+                f_out.write(pending.popleft().result())
+    else:
+        raise Exception("Unsupported compression format- %s" % out_file)
+
+
+def decompress_file(in_file, out_file):
+    """Decompresses .gz or .zst file `in_file` to `out_file`"""
+    if in_file.endswith(".zst"):
+        zstd = _import_zstd()
+        with open(in_file, "rb") as f_in, open(out_file, "wb") as f_out:
+            zstd.ZstdDecompressor().copy_stream(f_in, f_out)
+    elif in_file.endswith(".gz"):
+        with gzip.open(in_file, "rb") as f_in, open(out_file, "wb") as f_out:
+            shutil.copyfileobj(f_in, f_out, _GZIP_CHUNK_SIZE)
+    else:
+        raise Exception("Unsupported compression format- %s" % in_file)
+
+
+class AsyncWriter(object):
+    """Runs write jobs (i.e. `write_cobra_model`, `write_lp_problem`) on background threads, so that serialization overlaps with whatever the caller does next
+
+    Jobs are queued in a bounded queue, `submit` blocks while `max_pending` jobs are waiting, which keeps the number of models held in memory bounded.
+    A job that fails is re-raised (with its label) by the next call to `submit` or `drain`, so errors reach the caller instead of being lost on the writer thread.
+
+    Args:
+        threads (int): Number of writer threads
+        max_pending (int): Number of jobs that can wait in the queue before `submit` blocks
+    """
+
+    def __init__(self, threads=1, max_pending=1):
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._errors = queue.Queue()
+        for _ in range(threads):
+            # daemon threads never keep the process alive, `drain` has to be called before exiting
+            threading.Thread(target=self._run, daemon=True).start()
+
+    def submit(self, label, func, *args, **kwargs):
+        """Queues `func(*args, **kwargs)`, blocks while the queue is full"""
+        self._raise()
+        self._queue.put((label, func, args, kwargs))
+
+    def drain(self):
+        """Waits for all queued jobs to finish, raises the first error"""
+        self._queue.join()
+        self._raise()
+
+    def _run(self):
+        while True:
+            label, func, args, kwargs = self._queue.get()
+            try:
+                func(*args, **kwargs)
+            except Exception as e:
+                self._errors.put(Exception("Failed to write %s- %s" % (label, e)))
+            finally:
+                self._queue.task_done()
+
+    def _raise(self):
+        try:
+            error = self._errors.get_nowait()
+        except queue.Empty:
+            return
+        raise error
+
+
+def _import_zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise Exception("Reading or writing .zst files requires zstandard, please install it with `pip install zstandard`")
+    return zstandard
+
+
+def _done():
+    pass
+
+
+def _write_compressed(write, tmp_dir, tmp, out_file, threads=-1):
+    # Runs `write` (which writes `tmp`) and compresses `tmp` to `out_file`, the temporary directory is removed either way
+    try:
+        write()
+    except Exception:
+        tmp_dir.cleanup()
+        raise
+    _compress_temp_file(tmp_dir, tmp, out_file, threads)
+
+
+def _get_uncompressed_path(out_file):
+    # Temporary directory (next to `out_file`) and path of the uncompressed file within it, the directory is removed by `_compress_temp_file`
+    tmp_dir = tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(out_file)))
+    return tmp_dir, os.path.join(tmp_dir.name, path.splitext(os.path.basename(out_file))[0])
+
+
+def _compress_temp_file(tmp_dir, tmp, out_file, threads=-1):
+    try:
+        compress_file(tmp, out_file, threads)
+    finally:
+        tmp_dir.cleanup()
+
+
+@contextmanager
+def _compressed(out_file, threads=-1):
+    # Yields uncompressed temporary file (with the same name as `out_file`, minus the compression extension) that's compressed to `out_file` on exit
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(out_file))) as tmp_dir:
+        tmp = os.path.join(tmp_dir, path.splitext(os.path.basename(out_file))[0])
+        yield tmp
+        compress_file(tmp, out_file, threads)
+
+
+@contextmanager
+def _decompressed(in_file):
+    # Yields decompressed temporary copy of `in_file` (with the same name, minus the compression extension)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp = os.path.join(tmp_dir, path.splitext(os.path.basename(in_file))[0])
+        decompress_file(in_file, tmp)
+        yield tmp
+
 
 # Loads either LP file or cobra file and returns optlang model representing underlying optimization problem
 # RETURNS- optlang model
 def load_model(path, solver="gurobi"):
-    """Loads optlang.interface.Model from either an LP file (.lp or .mps) or any of the available COBRA file types (.xml, .mat, etc)
-    
+    """Loads optlang.interface.Model from either an LP file (.lp, .mps or pymgpipe's binary .pmg format), a sample within a problem store (`problems.pms::sample`) or any of the available COBRA file types (.xml, .mat, etc)
+
+    Notes:
+        `gurobi` and `cplex` read both .lp and .mps problems. The open-source solvers read .mps problems only, `glpk` natively and `highs` through `highspy`.
+
     Returns: optlang.interface.Model
     """
-    if isinstance(path, cobra.Model):
+    if _is_cobra_model(path):
         path.solver.name = path.name
         return path.solver
     elif isinstance(path, optlang.interface.Model):
@@ -115,15 +348,46 @@ def load_model(path, solver="gurobi"):
     elif not isinstance(path, str):
         raise Exception("Expected string, received %s" % type(path))
 
-    if not os.path.isfile(path):
+    from .binary import split_store_path, is_problem_store, is_binary_problem
+
+    store, sample = split_store_path(path)
+    if not os.path.isfile(store):
         raise Exception("Could not find model at %s" % path)
 
     print("Loading model from %s..." % path)
+    if sample is not None or is_problem_store(store):
+        from .binary import read_from_store, get_store_samples
+        from .matrix import build_model
+
+        if sample is None:
+            samples = get_store_samples(store)
+            if len(samples) != 1:
+                raise Exception(
+                    "Problem store %s holds %s samples, select one with `%s::<sample>`" % (store, len(samples), store)
+                )
+            store, sample = split_store_path(samples[0])
+        return build_model(read_from_store(store, sample), solver)
+    elif is_binary_problem(path):
+        from .binary import read_binary_problem
+        from .matrix import build_model
+
+        return build_model(read_binary_problem(path), solver)
+    elif path.endswith(".zst"):
+        # solvers only read gzip themselves
+        with _decompressed(path) as tmp:
+            return load_model(tmp, solver)
+
     try:
         if solver == "gurobi":
             model = _load_gurobi_model(path)
         elif solver == "cplex":
             model = _load_cplex_model(path)
+        elif solver == "glpk":
+            model = _load_glpk_model(path)
+        elif solver == "highs":
+            from .matrix import build_model
+
+            return build_model(_read_mps_problem(path), solver)
         else:
             raise UnsupportedSolverException
         try:
@@ -143,27 +407,82 @@ def load_model(path, solver="gurobi"):
     return optlang_model
 
 
-def write_lp_problem(model, out_file=None, compress=True, force=True):
-    """Writes optlang.interface.Model out to file (will compress by default)"""
+def write_lp_problem(model, out_file=None, compress=True, force=True, threads=-1):
+    """Writes optlang.interface.Model out to file (will compress by default, except for binary .pmg problems)
+
+    Problems are compressed with gzip unless `out_file` ends in .zst. Either way, the solver writes the uncompressed problem and compression runs on `threads` threads (see `compress_file`).
+
+    Problems written to `problems.pms` or `problems.pms::sample` are appended to a multi-sample problem store instead (see `pymgpipe.binary.write_to_store`).
+    """
+    _stage_lp_problem(model, out_file, compress, force, threads)()
+
+
+def _stage_lp_problem(model, out_file=None, compress=True, force=True, threads=-1, metadata=None):
+    # Does everything that needs the solver right away, returns the rest of the write (compression, binary arrays, disk) as a callable that's safe to run on another thread. `metadata` only applies to binary problems and stores
     out_file = "./" + model.name + ".xml" if out_file is None else out_file
 
-    if compress and not (out_file.endswith(".gz") or out_file.endswith(".7z")):
+    from .binary import (
+        BINARY_EXTENSION,
+        STORE_EXTENSION,
+        STORE_SEPARATOR,
+        write_binary_problem,
+        write_to_store,
+        get_store_samples,
+        split_store_path,
+    )
+    from .matrix import get_linear_problem
+
+    store, sample = split_store_path(out_file)
+    if sample is not None or store.endswith(STORE_EXTENSION):
+        model = load_model(model)
+        sample = model.name if sample is None else sample
+        if not force and os.path.exists(store) and store + STORE_SEPARATOR + sample in get_store_samples(store):
+            print("Model already exists!")
+            return _done
+        return partial(write_to_store, get_linear_problem(model), store, sample, metadata)
+    elif out_file.endswith(BINARY_EXTENSION):
+        # binary problems are memory-mapped when loaded, so they're never compressed
+        return partial(write_binary_problem, get_linear_problem(load_model(model)), out_file, metadata)
+
+    if compress and not out_file.endswith(_COMPRESSED_EXTENSIONS + (".7z",)):
         out_file = out_file + ".gz"
     if not force and os.path.basename(out_file).split(".")[0] in [
         f.split(".")[0] for f in os.listdir(os.path.dirname(out_file))
     ]:
         print("Model already exists!")
-        return
+        return _done
 
-    # some computers cant compress to gz
-    try:
-        load_model(model).problem.write(out_file)
-    except Exception:
-        if compress:
-            logger.warning(
-                "Could not write LP to compressed file format, trying .7z extension"
-            )
-            model.solver.problem.write(out_file.replace(".gz", ".7z"))
+    model = load_model(model)
+    if out_file.endswith(_COMPRESSED_EXTENSIONS):
+        # the plain problem is written first, compression runs on pymgpipe's own threads
+        tmp_dir, tmp = _get_uncompressed_path(out_file)
+        try:
+            write = _stage_problem_file(model, tmp)
+        except Exception:
+            tmp_dir.cleanup()
+            raise
+        return partial(_write_compressed, write, tmp_dir, tmp, out_file, threads)
+
+    return _stage_problem_file(model, out_file)
+
+
+def _stage_problem_file(model, out_file):
+    # MPS files are written by HiGHS from a snapshot of the problem's arrays, so only the snapshot needs the solver. Without HiGHS (or for .lp files) the solver writes the file right away
+    if ".mps" in out_file:
+        try:
+            import highspy
+        except ImportError:
+            highspy = None
+        if highspy is not None:
+            from .matrix import get_linear_problem
+
+            return partial(_write_mps_problem, get_linear_problem(model), out_file)
+
+    if _get_solver_name(model) == "glpk":
+        _write_glpk_problem(model, out_file)
+    else:
+        model.problem.write(out_file)
+    return _done
 
 
 def _load_cplex_model(path):
@@ -184,3 +503,190 @@ def _load_gurobi_model(path):
             return gurobipy.read(path)
     except Exception:
         raise Exception("Provided model is not a valid GUROBI model- %s" % path)
+
+
+def _load_glpk_model(path):
+    import swiglpk as glp
+
+    sense, header = _read_mps_objsense(path)
+    problem = glp.glp_create_prob()
+    term_out = glp.glp_term_out(glp.GLP_OFF)
+    try:
+        if sense is None:
+            status = glp.glp_read_mps(problem, glp.GLP_MPS_FILE, None, path)
+        else:
+            # GLPK doesn't know the OBJSENSE section written by gurobi and HiGHS, so it's left out and the sense is set here instead
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                tmp = os.path.join(tmp_dir, "problem.mps")
+                with _open_text(path) as f_in, open(tmp, "w") as f_out:
+                    f_out.writelines(line for i, line in enumerate(f_in) if i not in header)
+                status = glp.glp_read_mps(problem, glp.GLP_MPS_FILE, None, tmp)
+    finally:
+        glp.glp_term_out(term_out)
+    if status != 0:
+        glp.glp_delete_prob(problem)
+        raise Exception("Provided model is not a valid MPS model- %s" % path)
+
+    glp.glp_set_obj_dir(problem, glp.GLP_MAX if sense == "MAX" else glp.GLP_MIN)
+    return problem
+
+
+def _write_glpk_problem(model, out_file):
+    import swiglpk as glp
+
+    if ".mps" not in out_file:
+        raise Exception("Problems solved with glpk or highs can only be written to .mps files- %s" % out_file)
+
+    model.update()
+    with (_compressed(out_file) if out_file.endswith(_COMPRESSED_EXTENSIONS) else _as_is(out_file)) as tmp_file:
+        term_out = glp.glp_term_out(glp.GLP_OFF)
+        try:
+            status = glp.glp_write_mps(model.problem, glp.GLP_MPS_FILE, None, tmp_file)
+        finally:
+            glp.glp_term_out(term_out)
+        if status != 0:
+            raise Exception("GLPK could not write problem to %s" % out_file)
+        if glp.glp_get_obj_dir(model.problem) == glp.GLP_MAX:
+            _insert_objsense(tmp_file, "MAX")
+
+
+def _read_mps_objsense(path):
+    # Objective sense of an MPS file and the indices of the lines holding it, OBJSENSE comes before ROWS as either `OBJSENSE MAX` or `OBJSENSE` followed by `    MAX`
+    with _open_text(path) as f:
+        for i, line in enumerate(f):
+            fields = line.split()
+            if line.startswith("ROWS"):
+                break
+            elif len(fields) > 0 and fields[0] == "OBJSENSE":
+                if len(fields) > 1:
+                    return fields[1].upper(), {i}
+                return next(f).split()[0].upper(), {i, i + 1}
+    return None, set()
+
+
+def _insert_objsense(out_file, sense):
+    # GLPK doesn't write the objective sense, it goes right before the ROWS section
+    tmp = out_file + ".tmp"
+    with open(out_file) as f_in, open(tmp, "w") as f_out:
+        for line in f_in:
+            if line.startswith("ROWS"):
+                f_out.write("OBJSENSE\n    %s\n" % sense)
+                f_out.write(line)
+                break
+            f_out.write(line)
+        shutil.copyfileobj(f_in, f_out, _GZIP_CHUNK_SIZE)
+    os.replace(tmp, out_file)
+
+
+def _open_text(path):
+    return gzip.open(path, "rt") if path.endswith(".gz") else open(path)
+
+
+@contextmanager
+def _as_is(out_file):
+    yield out_file
+
+
+def _read_mps_problem(path):
+    try:
+        import highspy
+    except ImportError:
+        raise Exception("Reading problems with highs requires HiGHS, please install it with `pip install highspy`")
+
+    h = highspy.Highs()
+    h.setOptionValue("output_flag", False)
+    if h.readModel(path) != highspy.HighsStatus.kOk:
+        raise Exception("Provided model is not a valid MPS model- %s" % path)
+    return _get_highs_problem(h, path.split("/")[-1].split(".")[0])
+
+
+def _read_mps_column(path, column):
+    """Returns coefficients `{row: value}` of a single column of an MPS file, without reading the rest of the problem
+
+    Columns are stored contiguously in the COLUMNS section, so reading stops right after the last entry of `column`.
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    coefficients = {}
+    in_columns = False
+    with opener(path, "rt") as f:
+        for line in f:
+            if not line.startswith(" "):
+                if in_columns:
+                    break
+                in_columns = line.startswith("COLUMNS")
+                continue
+            if not in_columns:
+                continue
+
+            fields = line.split()
+            if fields[0] != column:
+                if len(coefficients) > 0:
+                    break
+                continue
+            # each line holds one or two (row, value) pairs
+            for row, value in zip(fields[1::2], fields[2::2]):
+                coefficients[row] = float(value)
+    return coefficients
+
+
+def _get_highs_problem(h, name):
+    import highspy
+    from scipy.sparse import csc_matrix
+    from .matrix import LinearProblem
+
+    lp = h.getLp()
+    A = csc_matrix(
+        (lp.a_matrix_.value_, lp.a_matrix_.index_, lp.a_matrix_.start_),
+        shape=(lp.num_row_, lp.num_col_),
+    )
+    return LinearProblem(
+        name=name,
+        A=A.tocsr(),
+        col_names=np.array(lp.col_names_, dtype=object),
+        row_names=np.array(lp.row_names_, dtype=object),
+        col_lb=np.array(lp.col_lower_),
+        col_ub=np.array(lp.col_upper_),
+        row_lb=np.array(lp.row_lower_),
+        row_ub=np.array(lp.row_upper_),
+        obj=np.array(lp.col_cost_),
+        sense="max" if lp.sense_ == highspy.ObjSense.kMaximize else "min",
+    )
+
+
+def _write_mps_problem(problem, out_file):
+    try:
+        import highspy
+    except ImportError:
+        raise Exception("Writing problems with highs requires HiGHS, please install it with `pip install highspy`")
+
+    if ".mps" not in out_file:
+        raise Exception("Problems solved with glpk or highs can only be written to .mps files- %s" % out_file)
+
+    A = problem.A.tocsc()
+    lp = highspy.HighsLp()
+    lp.num_col_ = len(problem.col_names)
+    lp.num_row_ = len(problem.row_names)
+    lp.col_cost_ = problem.obj
+    lp.col_lower_ = problem.col_lb
+    lp.col_upper_ = problem.col_ub
+    lp.row_lower_ = problem.row_lb
+    lp.row_upper_ = problem.row_ub
+    lp.a_matrix_.format_ = highspy.MatrixFormat.kColwise
+    lp.a_matrix_.start_ = A.indptr
+    lp.a_matrix_.index_ = A.indices
+    lp.a_matrix_.value_ = A.data
+    lp.col_names_ = list(problem.col_names)
+    lp.row_names_ = list(problem.row_names)
+    lp.sense_ = highspy.ObjSense.kMaximize if problem.sense == "max" else highspy.ObjSense.kMinimize
+    lp.model_name_ = str(problem.name)
+
+    h = highspy.Highs()
+    h.setOptionValue("output_flag", False)
+    h.passModel(lp)
+
+    # HiGHS never compresses its output
+    if out_file.endswith(_COMPRESSED_EXTENSIONS):
+        with _compressed(out_file) as tmp_file:
+            h.writeModel(tmp_file)
+    else:
+        h.writeModel(out_file)
@@ -1,29 +1,25 @@
 import sys
 import os
 import gc
-import tqdm
+import json
 import pandas as pd
-import matplotlib.pyplot as plt 
 import numpy as np
 import time
-import skbio 
-import seaborn as sns 
-from cobra import Configuration
-from scipy.spatial.distance import squareform, pdist
 from pathlib import Path
 from multiprocessing import Pool
+from multiprocessing.util import Finalize
 from functools import partial
-from .modeling import build
+from .modeling import build, find_blocked_taxon_reactions, get_net_flux_problem
 from .diet import add_diet_to_model
-from .io import load_cobra_model, write_lp_problem, write_cobra_model, suppress_stdout
+from .io import load_model, load_cobra_model, write_lp_problem, write_cobra_model, suppress_stdout, AsyncWriter, _get_cobra_solver, _stage_cobra_model, _stage_lp_problem
 from .utils import load_dataframe, remove_reverse_vars
 from .coupling import add_coupling_constraints
-from .metrics import _compute_diversity_metrics
+from .binary import BINARY_EXTENSION, STORE_EXTENSION, STORE_SEPARATOR, split_store_path, get_store_samples, read_binary_metadata, read_store_metadata
+from .metrics import _compute_diversity_metrics, _get_model_summary
 from .logger import logger
 
-cobra_config = Configuration()
-cobra_config.lower_bound = -1000
-cobra_config.upper_bound = 1000
+# background writer of the current process (pid, AsyncWriter), see `_get_writer`
+_writer = None
 
 
 def build_models(
@@ -48,9 +44,13 @@ def build_models(
     force_uptake=True,
     diet_threshold=0.8,
     compress=True,
+    compression=".gz",
     compute_metrics=True,
     force=False,
-    sample_prefix='mc'
+    sample_prefix='mc',
+    remove_blocked=False,
+    net_fluxes=False,
+    cobra_output="full",
 ):
     """Build community COBRA models using mgpipe-like compartments and constraints.
 
@@ -70,23 +70,35 @@ def build_models(
         micronutrients (list): List of metabolites to include as micronutrients within diet
         force_uptake (bool): Force minimum uptake of nutrients from diet
         diet_threshold (float): Threshold on imposed diet uptake, i.e. lb < metabolite < (threshold * lb)
-        solver (str): LP solver (gurobi or cplex) used to solve models, defaults to gurobi
+        solver (str): LP solver (gurobi, cplex, glpk or highs) used to solve models, defaults to gurobi
         parallel (bool): Samples will be built in parallel if set to True
         threads (int): Number of threads to use if building in parallel
-        lp_type (str): File type for LP problem (either .mps or .lp), defaults to .mps
+        lp_type (str): File type for LP problem (.mps, .lp or pymgpipe's binary .pmg format, see `pymgpipe.binary`), defaults to .mps. Set to .pms to write all samples into a single problem store (*out_dir/problems/problems.pms*)
         cobra_type (str): File type for COBRA model (.xml, .mat, .json), defaults to .xml
         compress (bool): Models and LP problems will be saved as compressed files if set to True, defaults to True
+        compression (str): Compression format used if `compress` is True, either .gz or .zst (requires `zstandard`), defaults to .gz. Both are compressed on multiple threads, see `pymgpipe.io.compress_file`
         compute_metrics (bool): Compute diversity metrics for built models, defaults to True
+        remove_blocked (bool): Leave out taxon reactions that can never carry flux, defaults to False. Blocked reactions are found once per taxon and cached within `taxa_dir` (see `find_blocked_taxon_reactions`)
+        net_fluxes (bool): Write LP problems with a single net flux variable per reaction instead of COBRA's forward and reverse variables (see `get_net_flux_problem`), defaults to False. Takes precedence over `remove_reverse_vars_from_lp`
+        cobra_output (str): What to write to *out_dir/models/*, defaults to `full`. Either `full` (community COBRA models, see `cobra_type`), `summary` (lightweight JSON summary of each model's structure and taxa) or None (nothing).
+            Writing full community models is one of the slowest steps for large communities, and any model can be generated on demand from its LP problem instead (see `get_cobra_model`)
 
     Notes:
         COBRA models written to *out_dir/models/*\n
         LP problems written to *out_dir/problems/*\n
-        All modifications done at the level of the LP (i.e. coupling constraints, diet) are not saved when writing COBRA models to file. For this reason, it is always recommended to work with LP models in the `problems/` folder.
+        All modifications done at the level of the LP (i.e. coupling constraints, diet) are not saved when writing COBRA models to file. For this reason, it is always recommended to work with LP models in the `problems/` folder.\n
+        Samples whose LP problem already exists are skipped unless `force` is True, regardless of what's in *out_dir/models/*
 
     """
      
+    import tqdm
+    from cobra import Configuration
+
     start = time.time()
-    cobra_config.solver = solver
+    cobra_config = Configuration()
+    cobra_config.lower_bound = -1000
+    cobra_config.upper_bound = 1000
+    cobra_config.solver = _get_cobra_solver(solver)
 
     gc.disable()
     Path(out_dir).mkdir(exist_ok=True)
@@ -108,13 +120,16 @@ def build_models(
         % (len(samples_to_run), len(taxa))
     )
 
+    if cobra_output not in ["full", "summary", None]:
+        raise Exception("Unsupported cobra_output- %s (expected full, summary or None)" % cobra_output)
+
     if samples is not None:
         samples_to_run = samples if isinstance(samples, list) else [samples]
 
     if len(samples_to_run) <= 1:
         parallel = False
 
-    threads = os.cpu_count() - 1 if threads == -1 else threads
+    threads = max(1, os.cpu_count() - 1) if threads == -1 else threads
     threads = min(threads, len(samples_to_run))
 
     print("Building %s models..." % len(samples_to_run))
@@ -126,8 +141,21 @@ def build_models(
     print("Solver- %s" % solver.upper())
     print("LP type- %s" % str(lp_type.split(".")[1]).upper())
     print("COBRA type- %s" % str(cobra_type.split(".")[1]).upper())
-    print("compress- %s" % str(compress).upper())
+    print("COBRA output- %s" % str(cobra_output).upper())
+    print("compress- %s" % (compression.upper() if compress else "FALSE"))
     print("Output directory- %s" % str(out_dir).upper())
+    print("Remove blocked reactions- %s" % str(remove_blocked).upper())
+    print("Net flux variables- %s" % str(net_fluxes).upper())
+
+    if remove_blocked:
+        # computed up front so that parallel builds don't repeat the check for shared taxa
+        taxa_files = {t.split(".")[0]: taxa_dir + t for t in os.listdir(taxa_dir)}
+        for taxon in tqdm.tqdm([t for t in taxa if t in taxa_files], desc="Finding blocked reactions"):
+            find_blocked_taxon_reactions(taxa_files[taxon], solver=solver)
+
+    # samples already in the problem store are looked up once, reading the store index for every sample would be quadratic in the number of samples
+    store = problem_dir + "problems" + STORE_EXTENSION
+    stored_samples = set(get_store_samples(store)) if lp_type == STORE_EXTENSION and os.path.exists(store) else set()
 
     _func = partial(
         _inner,
@@ -150,12 +178,17 @@ def build_models(
         diet_threshold,
         abundance_threshold,
         compress,
+        compression,
         compute_metrics,
-        force
+        force,
+        remove_blocked,
+        net_fluxes,
+        cobra_output,
+        stored_samples,
     )
 
     if parallel:
-        p = Pool(threads, initializer=_mute)
+        p = Pool(threads, initializer=_init_worker)
         p.daemon = False
 
         metrics = list(
@@ -163,11 +196,23 @@ def build_models(
         )
         p.close()
         p.join()
+
+        # workers flush their last writes as they exit, where errors are only printed
+        stored_samples = set(get_store_samples(store)) if lp_type == STORE_EXTENSION and os.path.exists(store) else set()
+        missing = [s for s in samples_to_run if _find_problem(_get_problem_path(problem_dir, lp_type, s), stored_samples) is None]
+        if len(missing) > 0:
+            raise Exception("Failed to write LP problems for %s" % ", ".join(missing))
     else:
         metrics = tqdm.tqdm(list(map(_func, samples_to_run)), total=len(samples_to_run))
+        _get_writer().drain()
 
     if compute_metrics:
         try:
+            import matplotlib.pyplot as plt
+            import seaborn as sns
+            import skbio
+            from scipy.spatial.distance import squareform, pdist
+
             abundance_df = pd.DataFrame({m['sample']:m['reaction_abundance'] for m in metrics})
             abundance_df.to_csv(out_dir+'reaction_abundance.csv')
 
@@ -236,22 +281,41 @@ def _inner(
     diet_threshold,
     abundance_threshold,
     compress,
+    compression,
     compute_metrics,
     force,
+    remove_blocked,
+    net_fluxes,
+    cobra_output,
+    stored_samples,
     sample_label,
 ):
-    model_out = (
-        model_dir + "%s.%s" % (sample_label, cobra_type.split(".")[1])
-        if not compress
-        else model_dir + sample_label + ".xml.gz"
-    )
-    lp_out = problem_dir + "%s.%s" % (sample_label, lp_type.split(".")[1])
+    if cobra_output == "summary":
+        model_out = model_dir + sample_label + ".summary.json"
+    else:
+        model_out = (
+            model_dir + "%s.%s" % (sample_label, cobra_type.split(".")[1])
+            if not compress
+            else model_dir + sample_label + ".xml" + compression
+        )
+    lp_out = _get_problem_path(problem_dir, lp_type, sample_label)
 
     pymgpipe_model = None
     metrics = None
+    cobra_write = None
 
-    if not force and os.path.exists(model_out):
-        pymgpipe_model = load_cobra_model(model_out)
+    lp_file = _find_problem(lp_out, stored_samples)
+    if not force and lp_file is not None:
+        # the LP problem is what gets used downstream, so it alone decides whether a sample is done
+        logger.info('Skipping %s because LP problem already exists!'%sample_label)
+        if compute_metrics:
+            metrics = _read_metrics(lp_file)
+            if metrics is None:
+                metrics = _compute_diversity_metrics(load_model(lp_file, solver))
+        return metrics
+
+    if not force and cobra_output == "full" and os.path.exists(model_out):
+        pymgpipe_model = load_cobra_model(model_out, solver)
     else:
         with suppress_stdout():
             pymgpipe_model = build(
@@ -260,43 +324,98 @@ def _inner(
                 taxa_directory=taxa_dir,
                 threshold=abundance_threshold,
                 diet_fecal_compartments=diet_fecal_compartments,
-                solver=solver
+                solver=solver,
+                remove_blocked=remove_blocked,
             )
-        force = True 
-        write_cobra_model(pymgpipe_model, model_out)
+        if cobra_output == "full":
+            cobra_write = _stage_cobra_model(pymgpipe_model, model_out)
+            if remove_reverse_vars_from_lp and hard_remove and not net_fluxes:
+                # COBRA looks up reverse variables when writing, so models that lose them are written before they're modified
+                cobra_write()
+                cobra_write = None
+        elif cobra_output == "summary":
+            _get_writer().submit(model_out, _write_json, _get_model_summary(pymgpipe_model), model_out)
 
     if compute_metrics:
         metrics = _compute_diversity_metrics(pymgpipe_model)
         if metrics is None or len(metrics)==0:
             logger.warning('Unable to compute diversity metrics for %s'%pymgpipe_model.name)
 
-    if force or (not os.path.exists(lp_out) and not os.path.exists(lp_out+'.gz') and not os.path.exists(lp_out+'.7z')):
-        # ----- START OPTLANG MODIFICATIONS -----
-        if remove_reverse_vars_from_lp:
-            try:
-                logger.info('Removing variables from %s...'%sample_label)
-                remove_reverse_vars(pymgpipe_model,hard_remove)
-            except Exception:
-                logger.warning('Failed to remove reverse variables!')
-
-        if diet is not None:
-            add_diet_to_model(pymgpipe_model, diet, force_uptake, essential_metabolites, micronutrients, vaginal, diet_threshold)
-
-        if coupling_constraints:
-            try:
-                logger.info('Adding coupling constraints to %s...'%sample_label)
-                add_coupling_constraints(pymgpipe_model)
-            except Exception:
-                logger.warning("Failed to add coupling constraints!")
-
-        write_lp_problem(pymgpipe_model, out_file=lp_out, compress=compress, force=True)
-    else:
-        logger.info('Skipping %s because LP problem already exists!'%sample_label)
+    # ----- START OPTLANG MODIFICATIONS -----
+    if net_fluxes:
+        pymgpipe_model = get_net_flux_problem(pymgpipe_model, solver)
+    elif remove_reverse_vars_from_lp:
+        try:
+            logger.info('Removing variables from %s...'%sample_label)
+            remove_reverse_vars(pymgpipe_model,hard_remove)
+        except Exception:
+            logger.warning('Failed to remove reverse variables!')
+
+    if diet is not None:
+        add_diet_to_model(pymgpipe_model, diet, force_uptake, essential_metabolites, micronutrients, vaginal, diet_threshold)
+
+    if coupling_constraints:
+        try:
+            logger.info('Adding coupling constraints to %s...'%sample_label)
+            add_coupling_constraints(pymgpipe_model)
+        except Exception:
+            logger.warning("Failed to add coupling constraints!")
+
+    # binary problems and stores are memory-mapped, so they're never compressed
+    compressed = compress and lp_type not in [BINARY_EXTENSION, STORE_EXTENSION]
+    lp_file = lp_out + compression if compressed else lp_out
+    lp_write = _stage_lp_problem(pymgpipe_model, out_file=lp_file, compress=compressed, force=True, metadata=_metrics_metadata(metrics))
+
+    # nothing touches the model (or its solver) from here on, so the COBRA model is serialized on the writer thread while the next sample is built
+    # it's written before the LP problem, which is what marks a sample as done
+    if cobra_write is not None:
+        _get_writer().submit(model_out, cobra_write)
+    _get_writer().submit(lp_file, lp_write)
     del pymgpipe_model
     gc.collect()
     return metrics
 
 
+def _get_problem_path(problem_dir, lp_type, sample_label):
+    if lp_type == STORE_EXTENSION:
+        # every sample goes into a single store
+        return problem_dir + "problems" + STORE_EXTENSION + STORE_SEPARATOR + sample_label
+    return problem_dir + "%s.%s" % (sample_label, lp_type.split(".")[1])
+
+
+def _find_problem(lp_out, stored_samples):
+    # Existing LP problem written to `lp_out` (with or without compression), None if there isn't one. Samples within a store are looked up in `stored_samples`
+    store, sample = split_store_path(lp_out)
+    if sample is not None:
+        return lp_out if lp_out in stored_samples else None
+    return next((lp_out + ext for ext in ['', '.gz', '.zst', '.7z'] if os.path.exists(lp_out + ext)), None)
+
+
+def _metrics_metadata(metrics):
+    # diversity metrics are saved with binary problems and stores, so that skipped samples don't need to load their LP problem
+    if not metrics:
+        return None
+    return {"metrics": dict(metrics, unique_reactions=sorted(metrics["unique_reactions"]))}
+
+
+def _read_metrics(lp_file):
+    # Metrics saved by `_metrics_metadata`, None for other problem formats (or problems written without metrics)
+    store, sample = split_store_path(lp_file)
+    if sample is not None:
+        metadata = read_store_metadata(store, sample)
+    elif lp_file.endswith(BINARY_EXTENSION):
+        metadata = read_binary_metadata(lp_file)
+    else:
+        return None
+    metrics = metadata.get("metrics")
+    return None if metrics is None else dict(metrics, unique_reactions=set(metrics["unique_reactions"]))
+
+
+def _write_json(obj, out_file):
+    with open(out_file, "w") as f:
+        json.dump(obj, f, indent=1)
+
+
 def _format_coverage_file(coverage_file, out_dir = './', sample_prefix = None):
     coverage = load_dataframe(coverage_file)
 
@@ -319,5 +438,24 @@ def _format_coverage_file(coverage_file, out_dir = './', sample_prefix = None):
     
     return coverage.rename(columns=sample_conversion_dict)
 
+def _get_writer():
+    # Writes overlap with building the next sample, only the solver-free part of each write runs on the writer thread (solver environments aren't thread-safe)
+    # Forked processes inherit the writer but not its thread, so every process gets its own
+    global _writer
+    if _writer is None or _writer[0] != os.getpid():
+        _writer = (os.getpid(), AsyncWriter())
+    return _writer[1]
+
+
+def _init_worker():
+    _mute()
+    # pool workers exit without waiting on daemon threads, so each worker flushes its writes once, on its way out
+    Finalize(None, _drain_writer, exitpriority=10)
+
+
+def _drain_writer():
+    _get_writer().drain()
+
+
 def _mute():
     sys.stdout = open(os.devnull, "w")
\ No newline at end of file
@@ -0,0 +1,267 @@
+import numpy as np
+from collections import namedtuple
+from optlang.symbolics import Zero
+from scipy.sparse import csr_matrix
+
+LinearProblem = namedtuple(
+    "LinearProblem",
+    "name A col_names row_names col_lb col_ub row_lb row_ub obj sense",
+)
+LinearProblem.__doc__ = """Solver-independent representation of an LP problem
+
+    `A` is a scipy CSR matrix (rows x columns), bounds and objective coefficients are numpy arrays (infinite bounds as +/-np.inf) and `sense` is either `max` or `min`.
+"""
+
+
+def get_linear_problem(model):
+    """Extracts the constraint matrix, bounds and objective of an LP problem
+
+    Args:
+        model (optlang.interface.Model): LP problem
+
+    Returns: LinearProblem
+    """
+    from .io import load_model, _get_solver_name
+
+    model = load_model(model)
+    model.update()
+    if _get_solver_name(model) == "gurobi":
+        return _get_gurobi_problem(model)
+    return _get_optlang_problem(model)
+
+
+def build_model(problem, solver="gurobi"):
+    """Builds optlang.interface.Model from LinearProblem using given solver
+
+    Args:
+        problem (LinearProblem): Problem as returned by `get_linear_problem`
+        solver (str): LP solver used to build the model
+
+    Returns: optlang.interface.Model
+    """
+    from .io import _get_optlang_interface
+
+    interface = _get_optlang_interface(solver)
+    if solver == "gurobi":
+        return interface.Model(problem=_build_gurobi_problem(problem), name=problem.name)
+    elif solver == "glpk":
+        return interface.Model(problem=_build_glpk_problem(problem), name=problem.name)
+    return _build_optlang_model(problem, interface)
+
+
+def merge_reverse_variables(problem):
+    """Replaces every forward/reverse variable pair with a single net flux variable
+
+    COBRA splits each reaction into a forward and a reverse variable. As long as their columns and objective coefficients are exact opposites (i.e. before any coupling constraints are added),
+    the pair can be replaced by one variable holding the net flux (forward - reverse) with bounds `(forward.lb - reverse.ub, forward.ub - reverse.lb)`.
+    The net variable keeps the name of the forward variable, pairs that aren't exact opposites are left as they are.
+
+    Args:
+        problem (LinearProblem): Problem as returned by `get_linear_problem`
+
+    Returns: LinearProblem with half as many columns for a COBRA model
+    """
+    from .utils import _get_reverse_id
+
+    index = {c: i for i, c in enumerate(problem.col_names)}
+    pairs = [(i, index.get(_get_reverse_id(c))) for i, c in enumerate(problem.col_names)]
+    forward = np.array([f for f, r in pairs if r is not None], dtype=int)
+    reverse = np.array([r for f, r in pairs if r is not None], dtype=int)
+
+    A = problem.A.tocsc()
+    mismatch = A[:, forward] + A[:, reverse]
+    mismatch.eliminate_zeros()
+    opposite = (np.diff(mismatch.indptr) == 0) & (problem.obj[forward] == -problem.obj[reverse])
+    forward, reverse = forward[opposite], reverse[opposite]
+
+    col_lb, col_ub = problem.col_lb.copy(), problem.col_ub.copy()
+    col_lb[forward] = problem.col_lb[forward] - problem.col_ub[reverse]
+    col_ub[forward] = problem.col_ub[forward] - problem.col_lb[reverse]
+
+    keep = np.ones(len(problem.col_names), dtype=bool)
+    keep[reverse] = False
+    return problem._replace(
+        A=A[:, keep].tocsr(),
+        col_names=problem.col_names[keep],
+        col_lb=col_lb[keep],
+        col_ub=col_ub[keep],
+        obj=problem.obj[keep],
+    )
+
+
+def _get_gurobi_problem(model):
+    grb = model.problem
+    grb_vars = grb.getVars()
+    grb_constrs = grb.getConstrs()
+
+    rhs = np.array(grb.getAttr("RHS", grb_constrs), dtype=float)
+    senses = np.array(grb.getAttr("Sense", grb_constrs))
+    row_lb = np.where(senses == "<", -np.inf, rhs)
+    row_ub = np.where(senses == ">", np.inf, rhs)
+
+    return LinearProblem(
+        name=model.name,
+        A=csr_matrix(grb.getA()),
+        col_names=np.array(grb.getAttr("VarName", grb_vars), dtype=object),
+        row_names=np.array(grb.getAttr("ConstrName", grb_constrs), dtype=object),
+        col_lb=_to_inf(grb.getAttr("LB", grb_vars)),
+        col_ub=_to_inf(grb.getAttr("UB", grb_vars)),
+        row_lb=row_lb,
+        row_ub=row_ub,
+        obj=np.array(grb.getAttr("Obj", grb_vars), dtype=float),
+        sense="max" if grb.ModelSense == -1 else "min",
+    )
+
+
+def _get_optlang_problem(model):
+    # Fallback, works for every optlang interface
+    variables = list(model.variables)
+    index = {v.name: i for i, v in enumerate(variables)}
+
+    rows, cols, values = [], [], []
+    for i, c in enumerate(model.constraints):
+        for v, coef in c.get_linear_coefficients(c.variables).items():
+            if coef != 0:
+                rows.append(i)
+                cols.append(index[v.name])
+                values.append(float(coef))
+
+    obj = np.zeros(len(variables))
+    for v, coef in model.objective.get_linear_coefficients(model.objective.variables).items():
+        obj[index[v.name]] = float(coef)
+
+    return LinearProblem(
+        name=model.name,
+        A=csr_matrix((values, (rows, cols)), shape=(len(model.constraints), len(variables))),
+        col_names=np.array([v.name for v in variables], dtype=object),
+        row_names=np.array([c.name for c in model.constraints], dtype=object),
+        col_lb=_to_inf([v.lb for v in variables], -np.inf),
+        col_ub=_to_inf([v.ub for v in variables], np.inf),
+        row_lb=_to_inf([c.lb for c in model.constraints], -np.inf),
+        row_ub=_to_inf([c.ub for c in model.constraints], np.inf),
+        obj=obj,
+        sense=model.objective.direction,
+    )
+
+
+def _build_gurobi_problem(problem):
+    import gurobipy
+
+    grb = gurobipy.Model(problem.name)
+    grb.Params.OutputFlag = 0
+
+    x = grb.addVars(
+        len(problem.col_names),
+        lb=_from_inf(problem.col_lb, -gurobipy.GRB.INFINITY).tolist(),
+        ub=_from_inf(problem.col_ub, gurobipy.GRB.INFINITY).tolist(),
+        obj=problem.obj.tolist(),
+    )
+    x = [x[i] for i in range(len(problem.col_names))]
+    grb.update()
+    grb.setAttr("VarName", x, list(problem.col_names))
+
+    A = problem.A.tocsr()
+    for i, name in enumerate(problem.row_names):
+        start, end = A.indptr[i], A.indptr[i + 1]
+        expr = gurobipy.LinExpr(A.data[start:end].tolist(), [x[j] for j in A.indices[start:end]])
+        lb, ub = problem.row_lb[i], problem.row_ub[i]
+        if lb == ub:
+            grb.addLConstr(expr, gurobipy.GRB.EQUAL, lb, name=name)
+        elif np.isinf(lb):
+            grb.addLConstr(expr, gurobipy.GRB.LESS_EQUAL, ub, name=name)
+        elif np.isinf(ub):
+            grb.addLConstr(expr, gurobipy.GRB.GREATER_EQUAL, lb, name=name)
+        else:
+            grb.addRange(expr, lb, ub, name=name)
+
+    grb.ModelSense = -1 if problem.sense == "max" else 1
+    grb.update()
+    return grb
+
+
+def _build_glpk_problem(problem):
+    import swiglpk as glp
+
+    lp = glp.glp_create_prob()
+    glp.glp_set_prob_name(lp, str(problem.name))
+    glp.glp_set_obj_dir(lp, glp.GLP_MAX if problem.sense == "max" else glp.GLP_MIN)
+
+    glp.glp_add_rows(lp, len(problem.row_names))
+    for i, name in enumerate(problem.row_names):
+        glp.glp_set_row_name(lp, i + 1, str(name))
+        glp.glp_set_row_bnds(lp, i + 1, *_glpk_bounds(glp, problem.row_lb[i], problem.row_ub[i]))
+
+    glp.glp_add_cols(lp, len(problem.col_names))
+    for j, name in enumerate(problem.col_names):
+        glp.glp_set_col_name(lp, j + 1, str(name))
+        glp.glp_set_col_bnds(lp, j + 1, *_glpk_bounds(glp, problem.col_lb[j], problem.col_ub[j]))
+        glp.glp_set_obj_coef(lp, j + 1, float(problem.obj[j]))
+
+    A = problem.A.tocoo()
+    ia, ja, ar = glp.intArray(A.nnz + 1), glp.intArray(A.nnz + 1), glp.doubleArray(A.nnz + 1)
+    for k, (i, j, v) in enumerate(zip(A.row, A.col, A.data)):
+        ia[k + 1], ja[k + 1], ar[k + 1] = int(i) + 1, int(j) + 1, float(v)
+    glp.glp_load_matrix(lp, A.nnz, ia, ja, ar)
+    return lp
+
+
+def _glpk_bounds(glp, lb, ub):
+    if np.isinf(lb) and np.isinf(ub):
+        return glp.GLP_FR, 0.0, 0.0
+    elif np.isinf(ub):
+        return glp.GLP_LO, float(lb), 0.0
+    elif np.isinf(lb):
+        return glp.GLP_UP, 0.0, float(ub)
+    elif lb == ub:
+        return glp.GLP_FX, float(lb), float(ub)
+    return glp.GLP_DB, float(lb), float(ub)
+
+
+def _build_optlang_model(problem, interface):
+    model = interface.Model(name=problem.name)
+    variables = [
+        interface.Variable(
+            name,
+            lb=None if np.isinf(problem.col_lb[j]) else float(problem.col_lb[j]),
+            ub=None if np.isinf(problem.col_ub[j]) else float(problem.col_ub[j]),
+        )
+        for j, name in enumerate(problem.col_names)
+    ]
+    constraints = [
+        interface.Constraint(
+            Zero,
+            lb=None if np.isinf(problem.row_lb[i]) else float(problem.row_lb[i]),
+            ub=None if np.isinf(problem.row_ub[i]) else float(problem.row_ub[i]),
+            name=name,
+        )
+        for i, name in enumerate(problem.row_names)
+    ]
+    model.add(variables)
+    model.add(constraints)
+    model.update()
+
+    A = problem.A.tocsr()
+    for i, c in enumerate(constraints):
+        start, end = A.indptr[i], A.indptr[i + 1]
+        c.set_linear_coefficients(
+            {variables[j]: float(v) for j, v in zip(A.indices[start:end], A.data[start:end])}
+        )
+
+    model.objective = interface.Objective(Zero, direction=problem.sense)
+    model.objective.set_linear_coefficients(
+        {variables[j]: float(problem.obj[j]) for j in np.flatnonzero(problem.obj)}
+    )
+    model.update()
+    return model
+
+
+def _to_inf(values, default=None):
+    # optlang uses None for unbounded, gurobi uses +/-1e100
+    values = np.array([default if v is None else v for v in values], dtype=float)
+    values[values >= 1e30] = np.inf
+    values[values <= -1e30] = -np.inf
+    return values
+
+
+def _from_inf(values, infinity):
+    return np.where(np.isinf(values), np.sign(values) * abs(infinity), values)
@@ -1,27 +1,30 @@
-from .utils import get_abundances
-import cobra
+from .utils import get_abundances, get_reactions
+from .io import _is_cobra_model
+import optlang
 
 def _compute_diversity_metrics(model):
-    assert isinstance(model, cobra.Model), '`model` needs to be COBRA model to compute diversity metrics.'
+    # COBRA models or LP problems (i.e. samples that are skipped because their LP problem already exists)
+    assert _is_cobra_model(model) or isinstance(model, optlang.interface.Model), '`model` needs to be COBRA model or LP problem to compute diversity metrics.'
     print('Computing metrics for %s...'%model.name)
 
     taxa = get_abundances(model)[model.name].to_dict()
-    unique_reactions = set(r.id.split('__')[0] for r in model.reactions if 
-        'EX' not in r.id and 
-        'biomass' not in r.id and
-        'UFEt_' not in r.id and 
-        'DUt_' not in r.id and
-        'community' not in r.id and
-        'sink' not in r.id
+    reactions = [r.id for r in model.reactions] if _is_cobra_model(model) else [v.name for v in get_reactions(model)]
+    unique_reactions = set(r.split('__')[0] for r in reactions if 
+        'EX' not in r and 
+        'biomass' not in r and
+        'UFEt_' not in r and 
+        'DUt_' not in r and
+        'community' not in r and
+        'sink' not in r
     )
     rxn_abundance = {r:0 for r in unique_reactions}
-    for r in model.reactions:
+    for r in reactions:
         try:
-            rxn_id = r.id.split('__')[0]
+            rxn_id = r.split('__')[0]
             if not rxn_id in unique_reactions:
                 continue 
 
-            rxn_taxa = r.id.split('__')[1]
+            rxn_taxa = r.split('__')[1]
             rxn_taxa = rxn_taxa.split('_')[1] if rxn_taxa.startswith('_') else rxn_taxa # small fix for weird naming bug
             rxn_abundance[rxn_id] += taxa[rxn_taxa]
         except:
@@ -34,3 +37,23 @@ def _compute_diversity_metrics(model):
     to_return['reaction_abundance'] = rxn_abundance
     return to_return
 
+
+def _get_model_summary(model):
+    # Lightweight stand-in for the full community model (see `cobra_output` in `build_models`), JSON-serializable
+    taxa = get_abundances(model)[model.name].to_dict()
+    per_taxon = {t: {'reactions': 0, 'metabolites': 0} for t in taxa}
+    for key, objects in [('reactions', model.reactions), ('metabolites', model.metabolites)]:
+        for o in objects:
+            taxon = o.id.split('__')[-1] if '__' in o.id else None
+            if taxon in per_taxon:
+                per_taxon[taxon][key] += 1
+
+    return {
+        'sample': model.name,
+        'abundances': taxa,
+        'reactions': len(model.reactions),
+        'metabolites': len(model.metabolites),
+        'compartments': sorted(model.compartments),
+        'taxa': per_taxon,
+        'exchanges': [r.id for r in model.reactions if r.boundary],
+    }
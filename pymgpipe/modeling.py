@@ -1,13 +1,19 @@
-import cobra
 import re
 import os
+import json
 import time
+import tempfile
+import numpy as np
 from optlang.symbolics import Zero
-from cobra.medium import is_boundary_type
-from .io import load_cobra_model, UnsupportedSolverException
+from .io import load_cobra_model, write_cobra_model, UnsupportedSolverException, _set_cobra_solver
 from .utils import load_dataframe
+from .cache import get_problem_key
+from .matrix import LinearProblem, get_linear_problem, merge_reverse_variables, build_model
 from .logger import logger
 
+# cache of `find_blocked_taxon_reactions`, hidden so it isn't picked up as a taxon
+_BLOCKED_DIR = ".blocked_reactions"
+
 def build(
     abundances,
     sample,
@@ -15,6 +21,7 @@ def build(
     threshold=1e-6,
     diet_fecal_compartments=True,
     solver="gurobi",
+    remove_blocked=False,
 ):
     """Build community COBRA model using mgpipe-like compartments and constraints.
 
@@ -26,16 +33,20 @@ def build(
         taxa_directory (str): Directory containing individual strain/species taxa models (file names corresponding to index of coverage matrix)
         threshold (float): Abundance threshold, any taxa with an abundance less than this value will be left out and abundances will be re-normalized
         diet_fecal_compartments (bool): Build models with mgpipe's diet/fecal compartmentalization, defaults to False
-        solver (str): LP solver (gurobi or cplex) used to solve models, defaults to gurobi
+        solver (str): LP solver (gurobi, cplex, glpk or highs) used to solve models, defaults to gurobi
+        remove_blocked (bool): Leave out taxon reactions that can never carry flux (see `find_blocked_taxon_reactions`), defaults to False
 
+    Returns: cobra.Model (see `get_net_flux_problem` for its LP problem with a single net flux variable per reaction)
     """
+    import cobra
+
     abundances = load_dataframe(abundances)
     assert sample in abundances.columns, 'Sample %s not found in abundance matrix!'%sample 
 
     if not os.path.exists(taxa_directory):
         raise Exception('Taxa directory %s not found!'%taxa_directory)
 
-    if solver not in ['gurobi','cplex']:
+    if solver not in ['gurobi','cplex','glpk','highs']:
         raise UnsupportedSolverException
 
     sample_abundances = abundances[sample]
@@ -59,19 +70,22 @@ def build(
     print('Building community model for %s with %s unique taxa...\n'%(sample,len(sample_abundances.index)))
     start = time.time()
     community_model = cobra.Model(name=sample)
-    community_model.solver = solver 
+    _set_cobra_solver(community_model, solver)
 
+    removed_reactions, removed_metabolites = 0, 0
     for taxon in sample_abundances.index:
-        model = load_cobra_model(existing_taxa_files[taxon])
-        taxon = taxon.replace(' ','_')
-        ex_metabolites = [m for m in model.metabolites if '[e]' in m.id]
-        missing = []
-        for ex in ex_metabolites:
-            if 'EX_%s(e)'%ex.id.split('[e]')[0] not in model.reactions:                
-                missing.append(_get_missing_exchange(ex))
+        model = load_cobra_model(existing_taxa_files[taxon], solver)
+        missing = _add_missing_exchanges(model)
         if len(missing) > 0:
             print('Adding %s missing exchange reaction(s) to %s!'%(len(missing),taxon))
-            model.add_reactions(missing)
+
+        if remove_blocked:
+            blocked = find_blocked_taxon_reactions(existing_taxa_files[taxon], solver=solver)
+            n_metabolites = len(model.metabolites)
+            model.remove_reactions(blocked, remove_orphans=True)
+            removed_reactions += len(blocked)
+            removed_metabolites += n_metabolites - len(model.metabolites)
+        taxon = taxon.replace(' ','_')
 
         # -- Reactions --
         for r in list(model.reactions):
@@ -115,12 +129,169 @@ def build(
     community_model.objective_direction = 'max'
     community_model.solver.update()
 
+    if remove_blocked:
+        # every reaction is split into a forward and reverse variable
+        logger.info(
+            'Removed %s blocked reactions from %s (%s variables, %s constraints)'
+            % (removed_reactions, sample, 2 * removed_reactions, removed_metabolites)
+        )
+
     elapsed = time.time() - start
     print('\n-----------------------------------')
     logger.info('Finished building %s in %.2f minutes!'%(sample,elapsed/60))
     return community_model
 
+def get_net_flux_problem(model, solver="gurobi"):
+    """Returns LP problem of a community model with a single net flux variable per reaction
+
+    Halves the number of variables compared to COBRA's forward and reverse variables, without changing the feasible net fluxes.
+    The problem is derived from the finished model, so this speeds up everything that solves the problem (FVA, NMPCs), not the build itself.
+    Unlike `remove_reverse_vars`, this never leaves dead columns behind and doesn't remove variables one by one.
+
+    Args:
+        model (cobra.Model | optlang.interface.Model): Community model, before coupling constraints are added
+        solver (str): LP solver (gurobi, cplex, glpk or highs) used to build the problem
+
+    Returns: optlang.interface.Model
+    """
+    problem = merge_reverse_variables(get_linear_problem(model))
+    logger.info('Merged reverse variables of %s (%s variables left)'%(problem.name,len(problem.col_names)))
+    return build_model(problem, solver)
+
+def get_cobra_model(problem, solver="gurobi", out_file=None):
+    """Rebuilds community COBRA model from its LP problem
+
+    Lets `build_models` skip writing community models altogether (see `cobra_output`), since the model can always be generated on demand from the problem in `problems/`.
+    The rebuilt model has the reactions, metabolites, stoichiometry, bounds and objective of the problem. Diet bounds are carried over, coupling constraints are left out (they aren't reactions), and so are names, genes and annotations (they were never part of the problem).
+
+    Args:
+        problem (optlang.interface.Model | LinearProblem | str): LP problem or path to one
+        solver (str): LP solver (gurobi, cplex, glpk or highs) of the returned model
+        out_file (str): If given, the model is written here (i.e. `models/mc1.xml.gz`), or loaded from here if it already exists
+
+    Returns: cobra.Model
+    """
+    import cobra
+
+    if out_file is not None and os.path.exists(out_file):
+        return load_cobra_model(out_file, solver)
+
+    problem = problem if isinstance(problem, LinearProblem) else get_linear_problem(problem)
+    # metabolite mass balances are the equality rows
+    balances = np.flatnonzero(problem.row_lb == problem.row_ub)
+    problem = merge_reverse_variables(
+        problem._replace(
+            A=problem.A[balances],
+            row_names=problem.row_names[balances],
+            row_lb=problem.row_lb[balances],
+            row_ub=problem.row_ub[balances],
+        )
+    )
+
+    model = cobra.Model(str(problem.name))
+    _set_cobra_solver(model, solver)
+    metabolites = [cobra.Metabolite(m, compartment=_get_compartment(m)) for m in problem.row_names]
+
+    A = problem.A.tocsc()
+    reactions = []
+    for j, r in enumerate(problem.col_names):
+        rxn = cobra.Reaction(r, lower_bound=float(problem.col_lb[j]), upper_bound=float(problem.col_ub[j]))
+        rows = slice(A.indptr[j], A.indptr[j + 1])
+        rxn.add_metabolites({metabolites[i]: float(v) for i, v in zip(A.indices[rows], A.data[rows])})
+        reactions.append(rxn)
+    model.add_reactions(reactions)
+
+    model.objective = {reactions[j]: float(problem.obj[j]) for j in np.flatnonzero(problem.obj)}
+    model.objective_direction = problem.sense
+
+    if out_file is not None:
+        write_cobra_model(model, out_file)
+    return model
+
+def _get_compartment(metabolite):
+    # i.e. `glc_D[c]__TaxaA` -> `c__TaxaA`, `glc_D[d]` -> `d`
+    match = re.match(r'^.*\[(\w+)\](__.+)?$', metabolite)
+    return None if match is None else match.group(1) + (match.group(2) or '')
+
+def find_blocked_taxon_reactions(taxon_file, solver="gurobi", cache_dir=None):
+    """Finds reactions of a taxon model that can never carry flux, in any community it's part of
+
+    Runs a FASTCC consistency check (see `cobra.flux_analysis.fastcc`) on the taxon with the same exchanges and bounds it gets inside community models,
+    i.e. all exchanges are open, so any reaction it finds is blocked regardless of the other taxa, diet or coupling constraints.
+    Results are cached per taxon file, keyed by the hash of the file, so the check only runs once for each version of a taxon.
+
+    Args:
+        taxon_file (str): Path to taxon model
+        solver (str): LP solver (gurobi, cplex, glpk or highs) used to run the check
+        cache_dir (str): Directory used to cache results, defaults to a hidden directory within the taxa directory. Set to False to disable caching
+
+    Returns: list of blocked reaction ids (as found in the taxon model)
+    """
+    import cobra
+    from cobra.medium import is_boundary_type
+
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(taxon_file), _BLOCKED_DIR)
+    key = get_problem_key(taxon_file)
+    cache_file = (
+        os.path.join(cache_dir, os.path.basename(taxon_file).split(".")[0] + ".json")
+        if cache_dir
+        else None
+    )
+
+    if cache_file is not None and os.path.exists(cache_file):
+        with open(cache_file) as f:
+            cached = json.load(f)
+        if cached["key"] == key:
+            return cached["blocked"]
+
+    model = load_cobra_model(taxon_file, solver)
+    _add_missing_exchanges(model)
+    for r in list(model.reactions):
+        # same bounds as in `_add_exchanges`
+        if r.id.startswith("DM_"):
+            r.lower_bound = 0
+        if r.id.startswith("sink_"):
+            r.lower_bound = -1
+        if 'biomass' in r.id.lower():
+            # biomass exchanges are replaced by the community biomass reaction, which only drains biomass
+            r.bounds = (0, 1000)
+        elif is_boundary_type(r, 'exchange', 'e'):
+            r.bounds = (-1000, 1000)
+
+    consistent = cobra.flux_analysis.fastcc(model)
+    blocked = sorted(
+        set(r.id for r in model.reactions if not ('biomass' in r.id.lower() and 'EX_' in r.id))
+        - set(consistent.reactions.list_attr("id"))
+    )
+
+    if cache_file is not None:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            # written to a temporary file first so that concurrent builds never read a partial entry
+            fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix=".json")
+            with os.fdopen(fd, "w") as f:
+                json.dump({"key": key, "blocked": blocked}, f)
+            os.replace(tmp, cache_file)
+        except OSError as e:
+            logger.warning("Could not cache blocked reactions of %s- %s" % (taxon_file, e))
+    return blocked
+
+
+def _add_missing_exchanges(model):
+    ex_metabolites = [m for m in model.metabolites if '[e]' in m.id]
+    missing = []
+    for ex in ex_metabolites:
+        if 'EX_%s(e)'%ex.id.split('[e]')[0] not in model.reactions:                
+            missing.append(_get_missing_exchange(ex))
+    if len(missing) > 0:
+        model.add_reactions(missing)
+    return missing
+
+
 def _add_exchanges(model, diet_fecal_compartments):
+    from cobra.medium import is_boundary_type
+
     for r in list(model.reactions):
         r_taxon = r.id.split('__')[-1]
 
@@ -164,6 +335,8 @@ def _add_exchanges(model, diet_fecal_compartments):
 
 
 def _add_lumen_exchange(model, met):
+    import cobra
+
     ex_medium = cobra.Reaction(
         id="EX_" + met.id,
         name=met.id + " lumen exchange",
@@ -177,6 +350,8 @@ def _add_lumen_exchange(model, met):
 
 
 def _add_fecal_exchange(model, met):
+    import cobra
+
     f_m = met.copy()
     f_m.id = met.id.replace("[u]", "[fe]")
     f_m.global_id = f_m.id[:-4]
@@ -209,6 +384,8 @@ def _add_fecal_exchange(model, met):
 
 
 def _add_diet_exchange(model, met):
+    import cobra
+
     d_m = met.copy()
     d_m.id = met.id.replace("[u]", "[d]")
     d_m.global_id = d_m.id[:-3]
@@ -240,6 +417,8 @@ def _add_diet_exchange(model, met):
     model.add_reactions([d_ex, d_tr])
 
 def _get_missing_exchange(metab):
+    import cobra
+
     ex = cobra.Reaction(
         id='EX_%s(e)'%metab.id.split('[e]')[0],
         name='%s exchange'%metab.name,
@@ -1,16 +1,21 @@
 import os
-import tqdm
+import re
+import tempfile
+import numpy as np
 import pandas as pd
 import optlang
 import time
 from collections import namedtuple
 from pathlib import Path
-from .fva import FVA_TYPE, fva
+from urllib.parse import quote, unquote
+from .fva import FVA_TYPE, fva, _cohort_fva
 from .utils import load_dataframe, load_model, set_objective, Constants
 from .io import suppress_stdout
+from .pruning import analyze_structure
+from .binary import is_problem_store, get_store_samples, split_store_path
 from .logger import logger
-import cobra
-import optlang
+
+_res = namedtuple("res", "nmpc objectives fluxes")
 
 def compute_nmpcs(
     samples,
@@ -33,7 +38,12 @@ def compute_nmpcs(
     scaling=0,
     mem_aff="none",
     schedule="dynamic",
-    signed=False
+    signed=False,
+    cache_dir=None,
+    max_resident=2,
+    shard_dir=None,
+    targeted=False,
+    reduce=False,
 ):
     """Compute NMPCs as well as associated reaction metrics on specified list (or directory) of samples
 
@@ -45,7 +55,7 @@ def compute_nmpcs(
     In cases where models are not build with diet/fecal compartments, NMPCs are simply calculated as the sum of the max and min fluxes.
 
     Args:
-        samples (list | str): List of samples or directory containing samples
+        samples (list | str): List of samples, directory containing samples or problem store (see `pymgpipe.binary.write_to_store`). Samples within a store can also be listed as `problems.pms::sample`
         out_dir (str): Directory to output results
         out_file (str): Name of file containing final NMPCs
         objective_out_file (str): Name of file containing community objectives
@@ -55,43 +65,51 @@ def compute_nmpcs(
         diet_fecal_compartments (bool): Whether or not models are built with diet/fecal compartmentalization
         ex_only (bool): Compute NMPCs on exchange reactions only
         fva_type (str): FVA type used to compute NMPCs, allowed values are `fast` and `regular`
-        solver (str): LP solver used to compute NMPCs, allowed values are `gurobi` and `cplex`
+        solver (str): LP solver used to compute NMPCs, allowed values are `gurobi`, `cplex`, `glpk` and `highs`
         obj_optimality (float): Percent of optimal objective value constrained during NMPC computation
         threshold (float): Fluxes below threshold will be set to 0
         write_to_file (bool): Write results to file
+        cache_dir (str): Name of directory (within `out_dir`) used to cache the optimal solution of each sample (i.e. `optima`). If set to None, nothing is cached
+        max_resident (int): Number of problems each worker keeps loaded when computing `regular` or `native` NMPCs in parallel
+        shard_dir (str): Name of directory (within `out_dir`) used to keep the results of each sample (i.e. `shards`). If set to None, results are only kept until they're merged into `out_file`, `objective_out_file` and `fluxes_out_file`
+        targeted (bool): Only solve the FVA directions NMPCs are computed from and skip exchanges certified by structural pruning (see `get_nmpc_directions`), only applies if `diet_fecal_compartments` is True and `fva_type` is `regular` or `native`
+        reduce (bool): Run FVA on a lossless reduction of each sample (see `pymgpipe.reduction.reduce_problem`), only applies if `fva_type` is `regular` or `native`
 
     Notes:
-        If computation is cut short prematurely, this function will pick up where it left off based on which samples are already present in `out_file`.
+        Results of each sample are written to their own shard as soon as the sample finishes, and `out_file`, `objective_out_file` and `fluxes_out_file` are written once all samples are done (see `merge_nmpcs`).
+        Samples already present in `out_file` are skipped. With `shard_dir` set, a run that's cut short prematurely also picks up where it left off based on which shards already exist.
+        With `cache_dir` set, optimal solutions are cached (only if `write_to_file` is True), so reruns skip the initial solve of every sample and start FVA from its optimal basis.
+        The number of LPs solved, skipped and certified by this call (summed over samples, see `fva`) are stored in `res.nmpc.attrs`.
+
+        With `targeted` set to True, only the max of each fecal exchange and the min of each diet exchange are solved, so the remaining fluxes are left empty (NaN).
+        Exchanges whose flux is certified from the structure of the model alone are left empty as well, the number of LPs saved this way is logged for every sample.
+        Structural pruning only runs with `targeted` set to True, by default every exchange is solved in both directions.
+
+        In parallel, `regular` and `native` NMPCs are computed on a single process pool shared by all samples. Reactions of every sample are scheduled as (sample, reaction-batch) tasks,
+        so workers are kept busy even when individual samples have few reactions, and NMPCs are written as soon as each sample finishes.
 
     """
     start = time.time()
     out_dir = out_dir + "/" if out_dir[-1] != "/" else out_dir
     Path(out_dir).mkdir(exist_ok=True)
 
-    out_file = out_dir + out_file
-    objective_out_file = out_dir + objective_out_file
-    fluxes_out_file = out_dir + fluxes_out_file
+    cache_dir = out_dir + cache_dir if write_to_file and cache_dir is not None else None
+    # without `shard_dir`, shards only live until they're merged
+    tmp_shards = tempfile.TemporaryDirectory() if write_to_file and shard_dir is None else None
+    shard_dir = tmp_shards.name if tmp_shards is not None else shard_dir
 
-    nmpcs = (
-        pd.DataFrame()
-        if force or not write_to_file
-        else load_dataframe(out_file, return_empty=True)
-    )
-    all_fluxes = (
-        pd.DataFrame()
-        if force or not write_to_file
-        else load_dataframe(fluxes_out_file, return_empty=True)
-    )
-    obj_values = (
-        pd.DataFrame()
-        if force or not write_to_file
-        else load_dataframe(objective_out_file, return_empty=True)
-    )
-    obj_values["communityBiomass"] = (
-        None if obj_values.empty else obj_values[obj_values.columns[0]]
-    )
+    if write_to_file and not force:
+        _shard_csv_results(
+            os.path.join(out_dir, shard_dir),
+            out_dir + out_file,
+            out_dir + objective_out_file,
+            out_dir + fluxes_out_file,
+        )
+    finished = set(_list_shards(os.path.join(out_dir, shard_dir))) if write_to_file and not force else set()
 
-    if isinstance(samples, str) and os.path.isdir(samples):
+    if isinstance(samples, str) and is_problem_store(samples):
+        models = get_store_samples(samples)
+    elif isinstance(samples, str) and os.path.isdir(samples):
         models = [
             os.path.dirname(samples) + "/" + m
             for m in os.listdir(os.path.dirname(samples))
@@ -101,71 +119,348 @@ def compute_nmpcs(
     else:
         models = [samples]
   
-    models = [
-        f for f in models if force
-        or (
-            f.split("/")[-1].split(".")[0] not in list(nmpcs.columns)
-            if isinstance(f, str) else f.name not in list(nmpcs.columns)
-        )
-    ]
+    models = [f for f in models if _get_sample_name(f) not in finished]
     print("Computing NMPCs on %s models using %s..." % (len(models), str(fva_type)))
 
-    for m in tqdm.tqdm(models, total=len(models)):
-        m_name = m.split("/")[-1].split(".")[0] if isinstance(m, str) else m.name
-        try:
-            res = fva(
-                m,
-                solver=solver,
-                fva_type=fva_type,
-                reactions=reactions,
-                regex=regex,
-                ex_only=ex_only,
-                threads=threads,
-                parallel=parallel,
-                write_to_file=False,
-                threshold=threshold,
-                objective_percent=objective_percent,
-                scaling=scaling,
-                mem_aff=mem_aff,
-                schedule=schedule,
-            )
-        except Exception as e:
-            logger.warning(f"Cannot solve {m_name} model!\n{e}")
-            continue
-        if res is None:
-            return
-        res["sample_id"] = m_name
-        all_fluxes = pd.concat([all_fluxes, res], axis=0)
-        if diet_fecal_compartments:
-            metabs = [
-                m
-                for m in res.index.str.split("[").str[0].drop_duplicates()
-                if not m.startswith("Diet")
-            ]
-            df = {}
-            for metab in metabs:
-                fe = res.loc[metab + "[fe]"]["max"]
-                d = res.loc["Diet_" + metab + "[d]"]["min"]
-
-                df[metab.split("EX_")[1]] = d + fe
-            nmpc = pd.DataFrame({m_name: df})
-        else:
-            nmpc = res["min"] + res["max"]
-            nmpc.name = m_name
+    directions = get_nmpc_directions if targeted and diet_fecal_compartments else None
 
-        nmpcs = pd.concat([nmpcs, nmpc], axis=1).fillna(0)
-        if not signed:
-            nmpcs = abs(nmpcs)
+    threads = os.cpu_count() if threads == -1 or threads > os.cpu_count() else threads
+    if parallel and threads > 1 and fva_type in [FVA_TYPE.REGULAR, FVA_TYPE.NATIVE]:
+        if reactions is None and regex is None and ex_only is True:
+            regex = Constants.EX_REGEX
+        results = _cohort_fva(
+            models,
+            fva_type=fva_type,
+            reactions=reactions,
+            regex=regex,
+            solver=solver,
+            threads=threads,
+            threshold=threshold,
+            objective_percent=objective_percent,
+            cache_dir=cache_dir,
+            max_resident=max_resident,
+            directions=directions,
+            reduce=reduce,
+        )
+    else:
+        results = _fva_per_sample(
+            models,
+            solver=solver,
+            fva_type=fva_type,
+            reactions=reactions,
+            regex=regex,
+            ex_only=ex_only,
+            threads=threads,
+            parallel=parallel,
+            write_to_file=False,
+            threshold=threshold,
+            objective_percent=objective_percent,
+            scaling=scaling,
+            mem_aff=mem_aff,
+            schedule=schedule,
+            cache_dir=cache_dir,
+            directions=directions,
+            reduce=reduce,
+        )
 
-        if write_to_file:
-            nmpcs.to_csv(out_file)
-            obj_values.to_csv(objective_out_file)
-            all_fluxes.to_csv(fluxes_out_file)
+    import tqdm
+
+    samples_run, results_in_memory = [], {}
+    lp_counts = {"lp_solved": 0, "lp_skipped": 0, "lp_certified": 0}
+    try:
+        for m, res in tqdm.tqdm(results, total=len(models)):
+            m_name = _get_sample_name(m)
+            if isinstance(res, Exception):
+                logger.warning(f"Cannot solve {m_name} model!\n{res}")
+                continue
+            if res is None:
+                logger.warning(f"No reactions to run for {m_name} model, skipping...")
+                continue
 
-    res = namedtuple("res", "nmpc objectives fluxes")
+            if res.attrs.get("lp_certified", 0) > 0:
+                logger.info("Saved %s LPs on %s using structural pruning" % (res.attrs["lp_certified"], m_name))
+            for k in lp_counts:
+                lp_counts[k] += res.attrs.get(k, 0)
+
+            result = _get_sample_result(res, diet_fecal_compartments)
+            samples_run.append(m_name)
+            if write_to_file:
+                _write_shard(os.path.join(out_dir, shard_dir), m_name, result)
+            else:
+                results_in_memory[m_name] = result
+
+        if write_to_file:
+            res = merge_nmpcs(
+                out_dir=out_dir,
+                out_file=out_file,
+                objective_out_file=objective_out_file,
+                fluxes_out_file=fluxes_out_file,
+                shard_dir=shard_dir,
+                samples=samples_run if force else None,
+                signed=signed,
+            )
+        else:
+            res = _merge_results(results_in_memory, signed)
+    finally:
+        if tmp_shards is not None:
+            tmp_shards.cleanup()
+    # LP counts of this call, summed over samples (as in `fva`)
+    res.nmpc.attrs.update(lp_counts)
 
     print("-------------------------------------------------------")
     print("Finished computing NMPCs!")
     print("Process took %s minutes to run..." % round((time.time() - start) / 60, 3))
 
-    return res(nmpcs, obj_values, all_fluxes)
+    return res
+
+
+def get_nmpc_directions(reactions, problem=None):
+    """Returns the FVA directions needed to compute NMPCs of models built with diet/fecal compartments
+
+    NMPCs only use the max flux of each fecal exchange (`EX_*[fe]`) and the min flux of each diet exchange (`Diet_EX_*[d]`), so every other reaction (e.g. lumen exchanges) is left out.
+
+    If `problem` is given, exchanges whose flux is certified by `pymgpipe.pruning.analyze_structure` don't need an LP and are mapped to no directions at all.
+    These are exchanges with zero flux (e.g. diet exchanges of metabolites missing from the diet) and both exchanges of pass-through metabolites, whose NMPC is exactly 0.
+
+    Args:
+        reactions (list): List of target reactions
+        problem (LinearProblem): LP problem the reactions belong to
+
+    Returns: dict mapping reactions to the directions to solve, can be passed as `directions` to `fva`
+    """
+    zero_flux, pass_through = set(), set()
+    if problem is not None:
+        structure = analyze_structure(problem)
+        zero_flux, pass_through = structure.zero_flux_reactions, structure.pass_through_metabolites
+
+    directions = {}
+    for r in reactions:
+        if re.match(Constants.FE_REGEX, r):
+            certified = r in zero_flux or r[len("EX_") : -len("[fe]")] in pass_through
+            directions[r] = [] if certified else ["max"]
+        elif r.startswith("Diet_") and re.match(Constants.DIET_REGEX, r):
+            certified = r in zero_flux or r[len("Diet_EX_") : -len("[d]")] in pass_through
+            directions[r] = [] if certified else ["min"]
+    return directions
+
+
+def merge_nmpcs(
+    out_dir="./",
+    out_file="nmpcs.csv",
+    objective_out_file="community_objectives.csv",
+    fluxes_out_file="all_fluxes.csv",
+    shard_dir="shards",
+    samples=None,
+    signed=False,
+    write_to_file=True,
+):
+    """Merges per-sample results written by `compute_nmpcs` into NMPC, community objective and flux tables
+
+    Can be run at any point during (or after) `compute_nmpcs` to collect the samples that have finished so far.
+
+    Args:
+        out_dir (str): Directory containing results
+        out_file (str): Name of file containing final NMPCs
+        objective_out_file (str): Name of file containing community objectives
+        fluxes_out_file (str): Name of file containing fluxes
+        shard_dir (str): Name of directory (within `out_dir`) containing the results of each sample
+        samples (list): Samples to merge, merges all finished samples if set to None
+        signed (bool): Keep sign of NMPCs
+        write_to_file (bool): Write merged results to `out_file`, `objective_out_file` and `fluxes_out_file`
+
+    Returns: namedtuple with `nmpc`, `objectives` and `fluxes` DataFrames
+    """
+    out_dir = out_dir + "/" if out_dir[-1] != "/" else out_dir
+    shards = _list_shards(os.path.join(out_dir, shard_dir))
+    if samples is not None:
+        shards = {s: shards[s] for s in samples if s in shards}
+
+    res = _merge_results({s: _read_shard(path) for s, path in shards.items()}, signed)
+    if write_to_file:
+        res.nmpc.to_csv(out_dir + out_file)
+        res.objectives.to_csv(out_dir + objective_out_file)
+        res.fluxes.to_csv(out_dir + fluxes_out_file)
+    return res
+
+
+def _get_sample_name(m):
+    store, sample = split_store_path(m)
+    if sample is not None:
+        return sample
+    return m.split("/")[-1].split(".")[0] if isinstance(m, str) else m.name
+
+
+def assemble_nmpcs(fluxes, diet_fecal_compartments=True, signed=False, threshold=None):
+    """Computes NMPCs of every sample in a FVA result table
+
+    Works on a single `fva` result or on the `fluxes` of `compute_nmpcs` (i.e. `all_fluxes.csv`), so NMPCs can be recomputed with different `signed`/`threshold` settings without re-solving anything.
+
+    Args:
+        fluxes (pandas.DataFrame | str): FVA results with `min` and `max` columns, indexed by reaction. Results of multiple samples are told apart by a `sample_id` column
+        diet_fecal_compartments (bool): Whether or not models are built with diet/fecal compartmentalization
+        signed (bool): Keep sign of NMPCs
+        threshold (float): Fluxes below threshold will be set to 0
+
+    Notes:
+        Fluxes that were not solved (NaN) count as 0, which is how exchanges certified without an LP (see `get_nmpc_directions`) end up in the NMPCs.
+
+    Returns: pandas.DataFrame with metabolites (or reactions) as rows and samples as columns
+    """
+    fluxes = load_dataframe(fluxes)
+    samples = fluxes["sample_id"] if "sample_id" in fluxes.columns else pd.Series(0, index=fluxes.index)
+    min_flux, max_flux = fluxes["min"], fluxes["max"]
+    if threshold is not None:
+        min_flux = min_flux.mask(abs(min_flux) < threshold, 0)
+        max_flux = max_flux.mask(abs(max_flux) < threshold, 0)
+
+    if diet_fecal_compartments:
+        # NMPC = max secretion into the fecal compartment + min uptake from the diet compartment
+        ids = fluxes.index.to_series()
+        fecal = _get_sample_table(max_flux, ids.str.extract(r"^EX_(.*)\[fe\]$", expand=False), samples)
+        diet = _get_sample_table(min_flux, ids.str.extract(r"^Diet_EX_(.*)\[d\]$", expand=False), samples)
+        nmpcs = fecal.add(diet, fill_value=0)
+    else:
+        nmpcs = _get_sample_table(min_flux + max_flux, fluxes.index.to_series(), samples)
+
+    nmpcs = nmpcs.reindex(columns=pd.unique(samples)).fillna(0)
+    nmpcs.index.name, nmpcs.columns.name = None, None
+    return nmpcs if signed else abs(nmpcs)
+
+
+def _get_sample_table(values, keys, samples):
+    # One row per key and one column per sample, rows without a key are dropped
+    found = keys.notna().to_numpy()
+    return pd.Series(
+        values.to_numpy()[found],
+        index=pd.MultiIndex.from_arrays([keys[found], samples.to_numpy()[found]]),
+    ).unstack()
+
+
+def _get_sample_result(res, diet_fecal_compartments):
+    # Arrays stored per sample, NMPCs are kept signed until merged
+    nmpc = assemble_nmpcs(res.drop(columns="sample_id", errors="ignore"), diet_fecal_compartments, signed=True)[0]
+
+    objective_values = res.attrs.get("objective_values", {})
+    return {
+        "flux_ids": np.array(res.index, dtype=str),
+        "flux_min": res["min"].to_numpy(dtype=float),
+        "flux_max": res["max"].to_numpy(dtype=float),
+        "nmpc_ids": np.array(nmpc.index, dtype=str),
+        "nmpc_values": nmpc.to_numpy(dtype=float),
+        "objective_ids": np.array(list(objective_values.keys()), dtype=str),
+        "objective_values": np.array(list(objective_values.values()), dtype=float),
+    }
+
+
+def _merge_results(results, signed):
+    # Builds all three tables at once instead of concatenating sample by sample
+    if len(results) == 0:
+        return _res(pd.DataFrame(), pd.DataFrame(), pd.DataFrame())
+    names = list(results.keys())
+    results = list(results.values())
+
+    fluxes = pd.DataFrame(
+        {
+            "min": np.concatenate([r["flux_min"] for r in results]),
+            "max": np.concatenate([r["flux_max"] for r in results]),
+            "sample_id": np.repeat(names, [len(r["flux_ids"]) for r in results]),
+        },
+        index=pd.Index(np.concatenate([r["flux_ids"] for r in results]), name="id"),
+    )
+
+    nmpcs = (
+        pd.Series(
+            np.concatenate([r["nmpc_values"] for r in results]),
+            index=pd.MultiIndex.from_arrays(
+                [
+                    np.concatenate([r["nmpc_ids"] for r in results]),
+                    np.repeat(names, [len(r["nmpc_ids"]) for r in results]),
+                ]
+            ),
+        )
+        .unstack()
+        .reindex(columns=names)
+        .fillna(0)
+    )
+    nmpcs.index.name, nmpcs.columns.name = None, None
+    if not signed:
+        nmpcs = abs(nmpcs)
+
+    objectives = pd.DataFrame(
+        [dict(zip(r["objective_ids"], r["objective_values"])) for r in results],
+        index=names,
+    )
+    return _res(nmpcs, objectives, fluxes)
+
+
+def _shard_path(shard_dir, name):
+    return os.path.join(shard_dir, quote(name, safe="") + ".npz")
+
+
+def _list_shards(shard_dir):
+    if not os.path.isdir(shard_dir):
+        return {}
+    return {
+        unquote(f[: -len(".npz")]): os.path.join(shard_dir, f)
+        for f in sorted(os.listdir(shard_dir))
+        if f.endswith(".npz")
+    }
+
+
+def _write_shard(shard_dir, name, result):
+    os.makedirs(shard_dir, exist_ok=True)
+
+    # written to a temporary file first so that an interrupted run never leaves a partial shard behind
+    fd, tmp = tempfile.mkstemp(dir=shard_dir, suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        np.savez(f, **result)
+    os.replace(tmp, _shard_path(shard_dir, name))
+
+
+def _read_shard(path):
+    with np.load(path) as f:
+        return {k: f[k] for k in f.files}
+
+
+def _shard_csv_results(shard_dir, out_file, objective_out_file, fluxes_out_file):
+    # Results of runs from before shards were introduced are moved into shards once, so they're kept on the next merge
+    nmpcs = load_dataframe(out_file, return_empty=True)
+    finished = _list_shards(shard_dir)
+    missing = [s for s in nmpcs.columns if s not in finished]
+    if len(missing) == 0:
+        return
+
+    fluxes = load_dataframe(fluxes_out_file, return_empty=True)
+    objectives = load_dataframe(objective_out_file, return_empty=True)
+    for s in missing:
+        sample_fluxes = (
+            fluxes[fluxes["sample_id"] == s]
+            if "sample_id" in fluxes.columns
+            else pd.DataFrame(columns=["min", "max"])
+        )
+        objective = (
+            objectives.loc[s].dropna() if s in objectives.index else pd.Series(dtype=float)
+        )
+        _write_shard(
+            shard_dir,
+            s,
+            {
+                "flux_ids": np.array(sample_fluxes.index, dtype=str),
+                "flux_min": sample_fluxes["min"].to_numpy(dtype=float),
+                "flux_max": sample_fluxes["max"].to_numpy(dtype=float),
+                "nmpc_ids": np.array(nmpcs.index, dtype=str),
+                "nmpc_values": nmpcs[s].to_numpy(dtype=float),
+                "objective_ids": np.array(objective.index, dtype=str),
+                "objective_values": objective.to_numpy(dtype=float),
+            },
+        )
+
+
+def _fva_per_sample(models, **kwargs):
+    # Runs FVA one sample at a time, yields `(sample, result)` (or the exception raised for that sample)
+    for m in models:
+        try:
+            res = fva(m, **kwargs)
+        except Exception as e:
+            res = e
+        yield m, res
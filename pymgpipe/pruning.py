@@ -0,0 +1,132 @@
+import numpy as np
+from collections import namedtuple
+from .utils import _get_reverse_id
+
+StructuralAnalysis = namedtuple(
+    "StructuralAnalysis", "blocked_variables zero_flux_reactions pass_through_metabolites"
+)
+StructuralAnalysis.__doc__ = """Result of `analyze_structure`
+
+    `blocked_variables` holds every variable that is zero in all feasible solutions, `zero_flux_reactions` every reaction whose net flux (forward - reverse) is zero in all feasible solutions
+    and `pass_through_metabolites` every metabolite that no community member can secrete or consume (see `analyze_structure`).
+"""
+
+
+def analyze_structure(model):
+    """Certifies zero fluxes from the stoichiometry and bounds of an LP problem alone, without solving any LPs
+
+    Blocked variables are found by repeatedly looking for constraints (metabolites) that, given the bounds of the remaining variables, can only be produced or only be consumed.
+    Every variable in such a constraint has to be zero, so dead ends are propagated through the whole network. Reactions that are only blocked through cycles are not found.
+
+    A reaction has zero net flux if it's blocked, or if it's the only reaction left in one of the steady-state constraints.
+
+    Pass-through metabolites are lumen metabolites whose taxa exchanges are all blocked (or missing), so they only flow from the diet compartment to the fecal compartment.
+    Their fecal secretion always equals their diet uptake, which makes their NMPC exactly 0 regardless of the diet.
+
+    Args:
+        model (optlang.interface.Model | LinearProblem): LP problem
+
+    Returns: StructuralAnalysis
+    """
+    from .matrix import LinearProblem, get_linear_problem
+
+    problem = model if isinstance(model, LinearProblem) else get_linear_problem(model)
+    blocked = _find_blocked_columns(problem)
+    reactions, base = _get_reactions(problem.col_names)
+
+    A = problem.A.tocsr()
+    steady_state = (problem.row_lb == 0) & (problem.row_ub == 0)
+    terms = [_get_net_terms(A, i, blocked, reactions, base) for i in range(len(problem.row_names))]
+
+    # reactions with all of their variables blocked
+    unblocked = np.bincount(base, weights=~blocked, minlength=len(base))
+    zero_flux = set(reactions[np.flatnonzero((unblocked == 0) & (base == np.arange(len(base))))])
+    for i in np.flatnonzero(steady_state):
+        if len(terms[i]) == 1:
+            zero_flux.update(terms[i])
+
+    rows = {r: i for i, r in enumerate(problem.row_names)}
+    pass_through = [
+        row[: -len("[u]")]
+        for i, row in enumerate(problem.row_names)
+        if row.endswith("[u]") and _is_pass_through(row[: -len("[u]")], rows, terms, steady_state)
+    ]
+
+    return StructuralAnalysis(
+        blocked_variables=set(problem.col_names[blocked]),
+        zero_flux_reactions=zero_flux,
+        pass_through_metabolites=set(pass_through),
+    )
+
+
+def _find_blocked_columns(problem):
+    # Returns mask of columns that are zero in every feasible solution
+    A = problem.A.tocoo()
+    rows, cols, coefs = A.row, A.col, A.data
+    nonzero = coefs != 0
+    rows, cols, coefs = rows[nonzero], cols[nonzero], coefs[nonzero]
+
+    lb, ub = problem.col_lb.copy(), problem.col_ub.copy()
+    blocked = (lb == 0) & (ub == 0)
+    n_rows = len(problem.row_names)
+    while True:
+        can_increase = ((coefs > 0) & (ub[cols] > 0)) | ((coefs < 0) & (lb[cols] < 0))
+        can_decrease = ((coefs > 0) & (lb[cols] < 0)) | ((coefs < 0) & (ub[cols] > 0))
+        has_positive = np.bincount(rows, weights=can_increase, minlength=n_rows) > 0
+        has_negative = np.bincount(rows, weights=can_decrease, minlength=n_rows) > 0
+
+        # a sum of nonnegative terms that can't be positive (or vice versa) forces every term to zero
+        forced = ((problem.row_ub == 0) & ~has_negative) | ((problem.row_lb == 0) & ~has_positive)
+        newly_blocked = np.zeros(len(blocked), dtype=bool)
+        newly_blocked[cols[forced[rows]]] = True
+        newly_blocked &= ~blocked
+        if not newly_blocked.any():
+            return blocked
+
+        blocked |= newly_blocked
+        lb[newly_blocked], ub[newly_blocked] = 0, 0
+
+
+def _get_reactions(col_names):
+    # Maps each column to its reaction, i.e. reverse variables are mapped to their forward variable
+    index = {c: i for i, c in enumerate(col_names)}
+    base = np.arange(len(col_names))
+    for i, c in enumerate(col_names):
+        reverse = index.get(_get_reverse_id(c))
+        if reverse is not None:
+            base[reverse] = i
+    return np.array(col_names, dtype=object), base
+
+
+def _get_net_terms(A, i, blocked, reactions, base):
+    # Coefficients of the net flux of every reaction with an unblocked variable in row `i`
+    terms = {}
+    for j, coef in zip(A.indices[A.indptr[i] : A.indptr[i + 1]], A.data[A.indptr[i] : A.indptr[i + 1]]):
+        if blocked[j] or coef == 0:
+            continue
+        # net flux is forward - reverse
+        terms[reactions[base[j]]] = coef if base[j] == j else -coef
+    return terms
+
+
+def _is_pass_through(metab, rows, terms, steady_state):
+    fecal, diet, lumen = rows.get(metab + "[fe]"), rows.get(metab + "[d]"), rows.get(metab + "[u]")
+    if fecal is None or diet is None or not all(steady_state[[fecal, diet, lumen]]):
+        return False
+
+    ex, fecal_tr = "EX_%s[fe]" % metab, "UFEt_" + metab
+    diet_ex, diet_tr = "Diet_EX_%s[d]" % metab, "DUt_" + metab
+    if (
+        not set(terms[lumen]) <= {fecal_tr, diet_tr}
+        or not set(terms[fecal]) <= {ex, fecal_tr}
+        or not set(terms[diet]) <= {diet_ex, diet_tr}
+    ):
+        return False
+
+    # writes both exchanges as a multiple of the diet transport flux (0 if the chain is broken by a blocked reaction)
+    lumen_ratio = -terms[lumen][diet_tr] / terms[lumen][fecal_tr] if len(terms[lumen]) == 2 else 0
+    ex_ratio = -terms[fecal][fecal_tr] / terms[fecal][ex] * lumen_ratio if len(terms[fecal]) == 2 else 0
+    diet_ratio = -terms[diet][diet_tr] / terms[diet][diet_ex] if len(terms[diet]) == 2 else 0
+
+    # max(k * t) + min(-k * t) = 0
+    return abs(ex_ratio + diet_ratio) <= 1e-9 * max(1, abs(ex_ratio))
@@ -0,0 +1,276 @@
+import numpy as np
+import pandas as pd
+from collections import namedtuple
+from scipy.sparse import csc_matrix, identity
+from .matrix import LinearProblem, get_linear_problem
+from .pruning import _find_blocked_columns
+
+Reduction = namedtuple("Reduction", "problem original steps")
+Reduction.__doc__ = """Result of `reduce_problem`
+
+    `problem` is the reduced LinearProblem, `original` the LinearProblem it was reduced from and `steps` the list of eliminations applied (used by `recover_fluxes` and `recover_ranges`).
+"""
+
+# x[name] = 0
+_Fixed = namedtuple("_Fixed", "names")
+# x[name] = scale * x[representative]
+_Scaled = namedtuple("_Scaled", "names representatives scales")
+# x[representative] now holds sum(sign * x[member]) over all members of its group
+_Shared = namedtuple("_Shared", "representative names signs lb ub")
+
+
+def reduce_problem(model, keep=None, tol=1e-12):
+    """Shrinks an LP problem without changing its feasible set (projected onto the remaining variables)
+
+    Repeats the following eliminations until none of them applies anymore-
+
+    - Variables that are zero in every feasible solution (see `pymgpipe.pruning.analyze_structure`) are removed
+    - Reaction chains are merged, i.e. for every steady-state constraint with only two variables `a * x + b * y = 0`, `y` is replaced by `-a/b * x`
+    - Duplicate variables (identical or opposite columns and objective coefficients, e.g. forward and reverse variables of an uncoupled reaction) are merged into their sum
+    - Constraints with a single variable are turned into variable bounds, and empty or duplicate constraints are removed
+
+    Variables in `keep` and objective variables are never eliminated, so their FVA ranges can be computed on the reduced problem directly.
+    The value and range of every other variable can be recovered with `recover_fluxes` and `recover_ranges`.
+
+    Args:
+        model (optlang.interface.Model | LinearProblem): LP problem
+        keep (list): Variables that have to stay in the reduced problem
+        tol (float): Coefficients below this value (relative to the largest coefficient of their constraint) are treated as 0 after merging
+
+    Returns: Reduction
+    """
+    original = model if isinstance(model, LinearProblem) else get_linear_problem(model)
+    problem = original
+    keep = set(keep if keep is not None else []) | set(original.col_names[original.obj != 0])
+
+    steps = []
+    while True:
+        size = (len(problem.col_names), len(problem.row_names), problem.A.nnz)
+        problem = _remove_rows(problem, tol)
+        problem = _remove_blocked(problem, keep, steps)
+        problem = _merge_chains(problem, keep, steps, tol)
+        problem = _merge_duplicates(problem, keep, steps)
+        if (len(problem.col_names), len(problem.row_names), problem.A.nnz) == size:
+            return Reduction(problem=problem, original=original, steps=steps)
+
+
+def recover_fluxes(reduction, fluxes):
+    """Recovers the value of every variable of the original problem from a solution of the reduced problem
+
+    Merged duplicate variables are split by filling them up one after the other (starting from 0 or their closest bound), so the result is one of the solutions of the original problem.
+
+    Args:
+        reduction (Reduction): As returned by `reduce_problem`
+        fluxes (pandas.Series | dict): Values of the variables of the reduced problem
+
+    Returns: pandas.Series indexed by variables of the original problem
+    """
+    values = dict(fluxes)
+    for step in reversed(reduction.steps):
+        if isinstance(step, _Fixed):
+            values.update(dict.fromkeys(step.names, 0.0))
+        elif isinstance(step, _Scaled):
+            for name, rep, scale in zip(step.names, step.representatives, step.scales):
+                values[name] = scale * values[rep]
+        else:
+            lb, ub = step.signs * step.lb, step.signs * step.ub
+            lb, ub = np.minimum(lb, ub), np.maximum(lb, ub)
+            # signed contributions, filled up in order until they add up to the merged value
+            parts = np.clip(0, lb, ub)
+            residual = values[step.representative] - parts.sum()
+            for i in range(len(parts)):
+                change = np.clip(residual, lb[i] - parts[i], ub[i] - parts[i])
+                parts[i] += change
+                residual -= change
+            values.update(dict(zip(step.names, step.signs * parts)))
+    return pd.Series(values, dtype=float).reindex(reduction.original.col_names)
+
+
+def recover_ranges(reduction, ranges):
+    """Recovers the range (min and max value) of every variable of the original problem from the ranges of the reduced problem
+
+    The recovered ranges are exact, i.e. identical to running FVA on each variable of the original problem, as long as `ranges` are exact for every variable of the reduced problem.
+
+    Args:
+        reduction (Reduction): As returned by `reduce_problem`
+        ranges (pandas.DataFrame): `min` and `max` value of the variables of the reduced problem
+
+    Returns: pandas.DataFrame with `min` and `max` columns, indexed by variables of the original problem
+    """
+    low, high = ranges["min"].to_dict(), ranges["max"].to_dict()
+    for step in reversed(reduction.steps):
+        if isinstance(step, _Fixed):
+            low.update(dict.fromkeys(step.names, 0.0))
+            high.update(dict.fromkeys(step.names, 0.0))
+        elif isinstance(step, _Scaled):
+            for name, rep, scale in zip(step.names, step.representatives, step.scales):
+                low[name], high[name] = sorted([scale * low[rep], scale * high[rep]])
+        else:
+            lb, ub = step.signs * step.lb, step.signs * step.ub
+            lb, ub = np.minimum(lb, ub), np.maximum(lb, ub)
+            # each signed contribution is the merged value minus any feasible combination of the others
+            merged_low, merged_high = low[step.representative], high[step.representative]
+            for i, name in enumerate(step.names):
+                others_lb, others_ub = np.delete(lb, i).sum(), np.delete(ub, i).sum()
+                part_low = max(lb[i], merged_low - others_ub)
+                part_high = min(ub[i], merged_high - others_lb)
+                low[name], high[name] = sorted([step.signs[i] * part_low, step.signs[i] * part_high])
+    return pd.DataFrame({"min": pd.Series(low, dtype=float), "max": pd.Series(high, dtype=float)}).reindex(
+        reduction.original.col_names
+    )
+
+
+def _remove_rows(problem, tol):
+    # Turns single-variable constraints into bounds, drops empty and duplicate constraints
+    A = _drop_small(problem.A, tol)
+    row_lb, row_ub = problem.row_lb.copy(), problem.row_ub.copy()
+    col_lb, col_ub = problem.col_lb.copy(), problem.col_ub.copy()
+    counts = np.diff(A.indptr)
+
+    if ((counts == 0) & ((row_lb > 0) | (row_ub < 0))).any():
+        raise Exception("%s is infeasible, found empty constraint with non-zero bounds" % problem.name)
+
+    for i in np.flatnonzero(counts == 1):
+        j, coef = A.indices[A.indptr[i]], A.data[A.indptr[i]]
+        lb, ub = sorted([row_lb[i] / coef, row_ub[i] / coef])
+        col_lb[j], col_ub[j] = max(col_lb[j], lb), min(col_ub[j], ub)
+
+    # duplicate constraints (identical up to a scaling factor) are merged into the first one
+    keep = counts > 1
+    seen = {}
+    for i in np.flatnonzero(keep):
+        start, end = A.indptr[i], A.indptr[i + 1]
+        scale = A.data[start]
+        key = (A.indices[start:end].tobytes(), (A.data[start:end] / scale).tobytes())
+        lb, ub = sorted([row_lb[i] / scale, row_ub[i] / scale])
+        if key in seen:
+            first = seen[key]
+            row_lb[first], row_ub[first] = max(row_lb[first], lb), min(row_ub[first], ub)
+            keep[i] = False
+        else:
+            seen[key] = i
+            A.data[start:end] /= scale
+            row_lb[i], row_ub[i] = lb, ub
+
+    return problem._replace(
+        A=A[keep],
+        row_names=problem.row_names[keep],
+        row_lb=row_lb[keep],
+        row_ub=row_ub[keep],
+        col_lb=col_lb,
+        col_ub=col_ub,
+    )
+
+
+def _remove_blocked(problem, keep, steps):
+    blocked = _find_blocked_columns(problem)
+    kept = np.array([c in keep for c in problem.col_names], dtype=bool)
+
+    # blocked variables that have to stay are fixed instead
+    col_lb, col_ub = problem.col_lb.copy(), problem.col_ub.copy()
+    col_lb[blocked & kept], col_ub[blocked & kept] = 0, 0
+
+    removed = blocked & ~kept
+    if not removed.any():
+        return problem._replace(col_lb=col_lb, col_ub=col_ub)
+
+    steps.append(_Fixed(list(problem.col_names[removed])))
+    return _select_columns(problem._replace(col_lb=col_lb, col_ub=col_ub), ~removed)
+
+
+def _merge_chains(problem, keep, steps, tol):
+    A = problem.A.tocsr()
+    counts = np.diff(A.indptr)
+    candidates = np.flatnonzero((counts == 2) & (problem.row_lb == 0) & (problem.row_ub == 0))
+
+    # every variable is either eliminated or absorbs others in one pass, chains collapse over repeated passes
+    eliminated, representatives = {}, set()
+    for i in candidates:
+        (a, b), (coef_a, coef_b) = A.indices[A.indptr[i] : A.indptr[i + 1]], A.data[A.indptr[i] : A.indptr[i + 1]]
+        if a in eliminated or b in eliminated:
+            continue
+        for rep, other, coef_rep, coef_other in [(a, b, coef_a, coef_b), (b, a, coef_b, coef_a)]:
+            if problem.col_names[other] not in keep and other not in representatives:
+                eliminated[other] = (rep, -coef_rep / coef_other)
+                representatives.add(rep)
+                break
+    if len(eliminated) == 0:
+        return problem
+
+    names, reps, scales = [], [], []
+    S = identity(len(problem.col_names), format="lil")
+    col_lb, col_ub = problem.col_lb.copy(), problem.col_ub.copy()
+    obj = problem.obj.copy()
+    for j, (rep, scale) in eliminated.items():
+        S[j, j], S[j, rep] = 0, scale
+        lb, ub = sorted([problem.col_lb[j] / scale, problem.col_ub[j] / scale])
+        col_lb[rep], col_ub[rep] = max(col_lb[rep], lb), min(col_ub[rep], ub)
+        obj[rep] += scale * obj[j]
+        names.append(problem.col_names[j])
+        reps.append(problem.col_names[rep])
+        scales.append(scale)
+    steps.append(_Scaled(names, reps, np.array(scales)))
+
+    remaining = np.ones(len(problem.col_names), dtype=bool)
+    remaining[list(eliminated)] = False
+    A = _drop_small(A @ S.tocsc(), tol)
+    return _select_columns(problem._replace(A=A, col_lb=col_lb, col_ub=col_ub, obj=obj), remaining)
+
+
+def _merge_duplicates(problem, keep, steps):
+    A = csc_matrix(problem.A)
+    A.sort_indices()
+
+    # columns are matched up to their sign
+    groups = {}
+    for j, name in enumerate(problem.col_names):
+        start, end = A.indptr[j], A.indptr[j + 1]
+        if name in keep or start == end:
+            continue
+        sign = 1 if A.data[start] > 0 else -1
+        key = (A.indices[start:end].tobytes(), (sign * A.data[start:end]).tobytes(), sign * problem.obj[j])
+        groups.setdefault(key, []).append((j, sign))
+    groups = [g for g in groups.values() if len(g) > 1]
+    if len(groups) == 0:
+        return problem
+
+    col_lb, col_ub = problem.col_lb.copy(), problem.col_ub.copy()
+    obj = problem.obj.copy()
+    removed = np.zeros(len(problem.col_names), dtype=bool)
+    for group in groups:
+        columns, signs = np.array([j for j, _ in group]), np.array([s for _, s in group], dtype=float)
+        rep = columns[0]
+        steps.append(
+            _Shared(
+                representative=problem.col_names[rep],
+                names=list(problem.col_names[columns]),
+                signs=signs * signs[0],
+                lb=problem.col_lb[columns],
+                ub=problem.col_ub[columns],
+            )
+        )
+        # representative becomes sum(sign * x), expressed in the orientation of the representative
+        lb, ub = signs[0] * signs * problem.col_lb[columns], signs[0] * signs * problem.col_ub[columns]
+        col_lb[rep], col_ub[rep] = np.minimum(lb, ub).sum(), np.maximum(lb, ub).sum()
+        removed[columns[1:]] = True
+
+    return _select_columns(problem._replace(col_lb=col_lb, col_ub=col_ub, obj=obj), ~removed)
+
+
+def _select_columns(problem, mask):
+    return problem._replace(
+        A=problem.A.tocsc()[:, mask].tocsr(),
+        col_names=problem.col_names[mask],
+        col_lb=problem.col_lb[mask],
+        col_ub=problem.col_ub[mask],
+        obj=problem.obj[mask],
+    )
+
+
+def _drop_small(A, tol):
+    # Removes coefficients that are negligible compared to the largest coefficient of their row (e.g. cancelled out by merging)
+    A = A.tocsr(copy=True)
+    scale = np.maximum(abs(A).max(axis=1).toarray().ravel(), 1)
+    A.data[abs(A.data) <= tol * np.repeat(scale, np.diff(A.indptr))] = 0
+    A.eliminate_zeros()
+    return A
@@ -1,10 +1,14 @@
 import cobra
 import os
+import shutil
+import tempfile
 import pandas as pd
+import pytest
 from pkg_resources import resource_filename
 from pytest_check import check
 from pymgpipe import get_abundances
-from pymgpipe.modeling import build
+from pymgpipe.io import load_cobra_model, write_cobra_model
+from pymgpipe.modeling import build, find_blocked_taxon_reactions, get_cobra_model
 import re
 
 
@@ -71,3 +75,182 @@ def test_build():
     built_abundances = get_abundances(pymgpipe_model).to_dict()["sample1"]
     true_abundances = sample_data['sample1'].to_dict()
     assert built_abundances == true_abundances
+
+
+def test_build_remove_blocked():
+    sample_data = pd.DataFrame({"sample1": [0.1, 0.2, 0.3, 0.4]}, index=["TaxaA", "TaxaB", "TaxaC", "TaxaD"])
+
+    with tempfile.TemporaryDirectory() as taxa_directory:
+        for t in sample_data.index:
+            shutil.copy(resource_filename("pymgpipe", "resources/miniTaxa/%s.xml.gz" % t), taxa_directory)
+
+        # dead end, deadend[c] can only be produced
+        taxon = load_cobra_model(os.path.join(taxa_directory, "TaxaA.xml.gz"))
+        dead_end = cobra.Reaction("DEADEND", lower_bound=0, upper_bound=1000)
+        dead_end.add_metabolites({taxon.metabolites.get_by_id("glc__D[e]"): -1, cobra.Metabolite("deadend[c]", compartment="c"): 1})
+        taxon.add_reactions([dead_end])
+        write_cobra_model(taxon, os.path.join(taxa_directory, "TaxaA.xml.gz"))
+
+        assert find_blocked_taxon_reactions(os.path.join(taxa_directory, "TaxaA.xml.gz")) == ["DEADEND"]
+        assert os.path.exists(os.path.join(taxa_directory, ".blocked_reactions", "TaxaA.json"))
+
+        full = build(sample_data, sample="sample1", taxa_directory=taxa_directory)
+        pruned = build(sample_data, sample="sample1", taxa_directory=taxa_directory, remove_blocked=True)
+
+    with check:
+        assert "DEADEND__TaxaA" in full.reactions and "DEADEND__TaxaA" not in pruned.reactions
+        assert "deadend[c]__TaxaA" not in pruned.metabolites
+        assert len(pruned.variables) == len(full.variables) - 2
+        assert pruned.slim_optimize() == pytest.approx(full.slim_optimize())
+
+
+def test_build_net_fluxes():
+    from pymgpipe import fva, add_coupling_constraints, constrain_reactions, solve_model, get_reaction_bounds, set_reaction_bounds, get_net_flux_problem
+
+    sample_data = pd.DataFrame({"sample1": [0.1, 0.2, 0.3, 0.4]}, index=["TaxaA", "TaxaB", "TaxaC", "TaxaD"])
+    taxa_directory = resource_filename("pymgpipe", "resources/miniTaxa/")
+
+    model = build(sample_data, sample="sample1", taxa_directory=taxa_directory)
+    net = get_net_flux_problem(model)
+    full = model.solver
+    with check:
+        assert len(net.variables) == len(full.variables) / 2
+        assert not any("reverse" in v.name for v in net.variables)
+        assert get_abundances(net).to_dict()["sample1"] == sample_data["sample1"].to_dict()
+
+    for model in [full, net]:
+        add_coupling_constraints(model)
+    net.optimize(), full.optimize()
+    assert net.objective.value == pytest.approx(full.objective.value)
+
+    reactions = ["EX_ac[fe]", "EX_glc__D[fe]", "Diet_EX_glc__D[d]", "PGI__TaxaA"]
+    full_ranges, net_ranges = fva(full, reactions=reactions, parallel=False), fva(net, reactions=reactions, parallel=False)
+    assert net_ranges.shape == (4, 2) and ((full_ranges - net_ranges).abs() < 1e-6).all().all()
+
+    # helpers work without reverse variables
+    set_reaction_bounds(net, "Diet_EX_glc__D[d]", -5, 0)
+    assert get_reaction_bounds(net, "Diet_EX_glc__D[d]") == (-5, 0)
+    constrain_reactions(net, {"Diet_EX_glc__D[d]": -4}, threshold=0.5)
+    assert get_reaction_bounds(net, "Diet_EX_glc__D[d]") == (-4.5, -3.5)
+    assert -4.5 <= solve_model(net, reactions=["Diet_EX_glc__D[d]"]).values[0] <= -3.5
+
+
+
+def test_cobra_output():
+    import json
+    from pymgpipe import build_models, add_coupling_constraints, get_reaction_bounds, set_reaction_bounds
+
+    sample_data = pd.DataFrame({"sample1": [0.1, 0.2, 0.3, 0.4]}, index=["TaxaA", "TaxaB", "TaxaC", "TaxaD"])
+    taxa_directory = resource_filename("pymgpipe", "resources/miniTaxa/")
+
+    # models rebuilt from LP problems keep stoichiometry, bounds (including diet) and objective, but not coupling constraints
+    model = build(sample_data, sample="sample1", taxa_directory=taxa_directory)
+    problem = model.solver
+    set_reaction_bounds(problem, "Diet_EX_glc__D[d]", -5, 0)
+    problem.optimize()
+    objective = problem.objective.value
+    add_coupling_constraints(problem)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        out_file = os.path.join(tmp_dir, "sample1.xml.gz")
+        rebuilt = get_cobra_model(problem, out_file=out_file)
+        assert os.path.exists(out_file)
+        with check:
+            assert len(rebuilt.reactions) == len(model.reactions) and len(rebuilt.metabolites) == len(model.metabolites)
+            assert rebuilt.reactions.PGI__TaxaA.reaction == model.reactions.PGI__TaxaA.reaction
+            assert rebuilt.reactions.get_by_id("Diet_EX_glc__D[d]").bounds == get_reaction_bounds(problem, "Diet_EX_glc__D[d]")
+            assert rebuilt.slim_optimize() == pytest.approx(objective)
+        assert len(get_cobra_model(None, out_file=out_file).reactions) == len(model.reactions)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        kwargs = dict(coverage_file=sample_data, taxa_dir=taxa_directory, out_dir=tmp_dir, parallel=False, sample_prefix=None, diet_fecal_compartments=True)
+        build_models(cobra_output="summary", **kwargs)
+        with open(os.path.join(tmp_dir, "models", "sample1.summary.json")) as f:
+            summary = json.load(f)
+        with check:
+            assert summary["abundances"] == sample_data["sample1"].to_dict()
+            assert summary["reactions"] == len(model.reactions) and summary["taxa"]["TaxaA"]["reactions"] > 0
+
+        # samples with an LP problem are skipped, even without a model
+        os.remove(os.path.join(tmp_dir, "models", "sample1.summary.json"))
+        problem_file = os.path.join(tmp_dir, "problems", "sample1.mps.gz")
+        modified = os.path.getmtime(problem_file)
+        build_models(cobra_output="full", **kwargs)
+        assert os.listdir(os.path.join(tmp_dir, "models")) == [] and os.path.getmtime(problem_file) == modified
+
+        build_models(cobra_output=None, force=True, **kwargs)
+        assert os.listdir(os.path.join(tmp_dir, "models")) == [] and os.path.getmtime(problem_file) > modified
+
+
+def test_stored_metrics(monkeypatch):
+    import sys
+    from pymgpipe import build_models
+
+    sample_data = pd.DataFrame({"sample1": [0.1, 0.2, 0.3, 0.4]}, index=["TaxaA", "TaxaB", "TaxaC", "TaxaD"])
+    taxa_directory = resource_filename("pymgpipe", "resources/miniTaxa/")
+    main = sys.modules["pymgpipe.main"]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        kwargs = dict(coverage_file=sample_data, taxa_dir=taxa_directory, out_dir=tmp_dir, parallel=False, sample_prefix=None, lp_type=".pms", compute_metrics=True)
+        build_models(**kwargs)
+        with open(os.path.join(tmp_dir, "reaction_abundance.csv")) as f:
+            abundances = f.read()
+
+        # skipped samples take their metrics from the store, without loading their LP problem
+        def fail(*args, **kwargs):
+            raise AssertionError("LP problem was loaded")
+
+        monkeypatch.setattr(main, "load_model", fail)
+        build_models(**kwargs)
+        with open(os.path.join(tmp_dir, "reaction_abundance.csv")) as f:
+            assert f.read() == abundances
+        build_models(**dict(kwargs, compute_metrics=False))
+
+
+def test_parallel_writes(monkeypatch):
+    import sys
+    import time
+    import pymgpipe.io
+    from pymgpipe import build_models
+
+    samples = ["sample1", "sample2", "sample3"]
+    sample_data = pd.DataFrame({s: [0.1, 0.2, 0.3, 0.4] for s in samples}, index=["TaxaA", "TaxaB", "TaxaC", "TaxaD"])
+    taxa_directory = resource_filename("pymgpipe", "resources/miniTaxa/")
+    main = sys.modules["pymgpipe.main"]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        log_file = os.path.join(tmp_dir, "log.txt")
+
+        def log(event, sample):
+            with open(log_file, "a") as f:
+                f.write("%s %s %s %s\n" % (event, sample, os.getpid(), time.time()))
+
+        # workers are forked, so they inherit the patched functions
+        def slow_build(*args, **kwargs):
+            log("build", kwargs["sample"])
+            return build(*args, **kwargs)
+
+        compress_temp_file = pymgpipe.io._compress_temp_file
+
+        def slow_compress(tmp_dir, tmp, out_file, threads=-1):
+            compress_temp_file(tmp_dir, tmp, out_file, threads)
+            if ".mps" in out_file:
+                time.sleep(1)
+                log("written", os.path.basename(out_file).split(".")[0])
+
+        monkeypatch.setattr(main, "build", slow_build)
+        monkeypatch.setattr(pymgpipe.io, "_compress_temp_file", slow_compress)
+        build_models(coverage_file=sample_data, taxa_dir=taxa_directory, out_dir=tmp_dir, parallel=True, threads=1, sample_prefix=None)
+
+        # every write is flushed by the time build_models returns, even though workers only drain their writer on exit
+        with check:
+            assert sorted(os.listdir(os.path.join(tmp_dir, "problems"))) == [s + ".mps.gz" for s in samples]
+            assert sorted(os.listdir(os.path.join(tmp_dir, "models"))) == [s + ".xml.gz" for s in samples]
+
+        with open(log_file) as f:
+            events = {(event, sample): (pid, float(t)) for event, sample, pid, t in (line.split() for line in f)}
+        assert len({pid for pid, _ in events.values()}) == 1
+
+        # the next sample is built while the previous one is written
+        order = sorted(samples, key=lambda s: events[("build", s)][1])
+        for previous, current in zip(order, order[1:]):
+            assert events[("build", current)][1] < events[("written", previous)][1]
@@ -1,7 +1,16 @@
 import optlang
 import os
+import sys
 import pandas as pd
-from pymgpipe import get_reactions, fva, compute_nmpcs
+import tempfile
+import pytest
+from functools import partial
+from pymgpipe import get_reactions, fva, compute_nmpcs, merge_nmpcs, assemble_nmpcs, get_nmpc_directions, FVA_TYPE
+from pymgpipe.fva import _cohort_fva
+from pymgpipe.utils import Constants, load_model, set_reaction_bounds
+from pymgpipe.pruning import analyze_structure
+from pymgpipe.matrix import get_linear_problem, build_model
+from pymgpipe.reduction import reduce_problem, recover_fluxes, recover_ranges
 
 
 def test_regularFVA(mini_optlang_model):
@@ -11,6 +20,122 @@ def test_regularFVA(mini_optlang_model):
     assert set(ex_reactions) == set(fva_res.index.to_list())
 
 
+def test_pruned_fva(mini_optlang_model):
+    full = fva(mini_optlang_model, parallel=False, prune=False)
+    pruned = fva(mini_optlang_model, parallel=False, prune=True)
+
+    assert pruned.attrs["lp_skipped"] > 0
+    assert ((full - pruned).abs() < 1e-6).all().all()
+
+
+def test_pruned_fva_batches(mini_optlang_model, monkeypatch):
+    # extremes certified by one batch are used by the batches that follow, even when every batch holds a single reaction
+    fva_module = sys.modules["pymgpipe.fva"]
+    monkeypatch.setattr(fva_module, "_schedule_batches", partial(fva_module._schedule_batches, max_batch=1))
+    full = fva(mini_optlang_model, parallel=False, prune=False)
+    pruned = fva(mini_optlang_model, parallel=False, prune=True)
+
+    assert pruned.attrs["lp_skipped"] > 0
+    assert ((full - pruned).abs() < 1e-6).all().all()
+
+
+def test_nativeFVA(mini_optlang_model):
+    pytest.importorskip("highspy")
+
+    regular = fva(mini_optlang_model, parallel=False, objective_percent=90)
+    native = fva(
+        pytest.resource_problems_dir + "mini_model.mps",
+        fva_type=FVA_TYPE.NATIVE,
+        parallel=False,
+        objective_percent=90,
+    )
+
+    assert list(regular.index) == list(native.index)
+    assert ((regular - native).abs() < 1e-6).all().all()
+
+
+def test_resume_fva(mini_optlang_model):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        out_file = os.path.join(tmpdirname, "fva.csv")
+        full = fva(mini_optlang_model, parallel=False, write_to_file=True, out_file=out_file)
+
+        # simulate a run that was cut short halfway through writing a row
+        lines = open(out_file).read().splitlines()
+        with open(out_file, "w") as f:
+            f.write("\n".join(lines[:10]) + "\n" + lines[10][:5])
+
+        resumed = fva(mini_optlang_model, parallel=False, write_to_file=True, out_file=out_file)
+        written = pd.read_csv(out_file, index_col=0)
+
+        assert list(resumed.index) == list(full.index)
+        assert ((written - full).abs() < 1e-6).all().all()
+
+
+def test_cached_fva(mini_optlang_model):
+    problem = pytest.resource_problems_dir + "mini_model.mps"
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        first = fva(problem, parallel=False, objective_percent=90, cache_dir=tmpdirname)
+        assert len(os.listdir(tmpdirname)) == 1
+
+        cached = fva(problem, parallel=False, objective_percent=90, cache_dir=tmpdirname)
+        assert len(os.listdir(tmpdirname)) == 1
+        assert ((first - cached).abs() < 1e-6).all().all()
+
+
+def test_cohort_fva(mini_optlang_model):
+    problem = pytest.resource_problems_dir + "mini_model.mps"
+    second_sample = optlang.Model.clone(mini_optlang_model)
+    second_sample.name = "A second sample"
+
+    expected = fva(problem, parallel=False, objective_percent=90)
+    results = dict(
+        _cohort_fva(
+            [problem, second_sample, "missing.mps"],
+            regex=Constants.EX_REGEX,
+            threads=2,
+            objective_percent=90,
+            max_resident=1,
+        )
+    )
+
+    assert isinstance(results["missing.mps"], Exception)
+    for sample in [problem, second_sample]:
+        assert list(results[sample].index) == list(expected.index)
+        assert ((results[sample] - expected).abs() < 1e-6).all().all()
+
+    # samples that share a name are still run on their own problems
+    reaction = expected["max"].idxmax()
+    third_sample = optlang.Model.clone(mini_optlang_model)
+    third_sample.name = second_sample.name
+    set_reaction_bounds(third_sample, reaction, third_sample.variables[reaction].lb, expected["max"][reaction] / 2)
+    results = dict(
+        _cohort_fva(
+            [second_sample, third_sample],
+            regex=Constants.EX_REGEX,
+            threads=2,
+            objective_percent=90,
+        )
+    )
+    assert ((results[second_sample] - expected).abs() < 1e-6).all().all()
+    assert results[third_sample]["max"][reaction] <= expected["max"][reaction] / 2 + 1e-6
+
+    # workers that didn't solve a sample load its reduced problem and cached basis
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        reduced = dict(
+            _cohort_fva(
+                [problem, second_sample],
+                regex=Constants.EX_REGEX,
+                threads=2,
+                objective_percent=90,
+                max_resident=1,
+                reduce=True,
+                cache_dir=tmpdirname,
+            )
+        )
+    for sample in [problem, second_sample]:
+        assert ((reduced[sample] - expected).abs() < 1e-6).all().all()
+
+
 def test_nmpc(mini_optlang_model):
     nmpc_res = compute_nmpcs(samples=mini_optlang_model, force=True, objective_percent=None)
 
@@ -46,3 +171,127 @@ def test_nmpc_multisample(mini_optlang_model):
         .round(6)
         .equals(nmpc_res.nmpc["A second sample"].round(6))
     )
+    assert assemble_nmpcs(nmpc_res.fluxes).equals(nmpc_res.nmpc)
+
+
+def test_nmpc_skipped_sample(mini_optlang_model):
+    # a sample without any reactions to run is skipped, the rest of the cohort still finishes
+    no_exchanges = optlang.Model.clone(mini_optlang_model)
+    no_exchanges.name = "No exchanges"
+    no_exchanges.remove([v for v in no_exchanges.variables if "EX_" in v.name])
+
+    nmpc_res = compute_nmpcs(
+        samples=[mini_optlang_model, no_exchanges], force=True, objective_percent=None, write_to_file=False
+    )
+    assert nmpc_res.nmpc.columns.to_list() == ["mini_model"]
+
+
+def test_nmpc_shards(mini_optlang_model):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        nmpc_res = compute_nmpcs(samples=mini_optlang_model, out_dir=tmpdirname, force=True, cache_dir="optima", shard_dir="shards")
+        assert os.listdir(os.path.join(tmpdirname, "shards")) == ["mini_model.npz"]
+        assert len(os.listdir(os.path.join(tmpdirname, "optima"))) == 1
+
+        merged = merge_nmpcs(out_dir=tmpdirname, write_to_file=False)
+        assert merged.nmpc.equals(nmpc_res.nmpc)
+        assert merged.fluxes.equals(nmpc_res.fluxes)
+        assert merged.objectives.loc["mini_model", "communityBiomass"] > 0
+
+        # finished samples are picked up from their shards
+        rerun = compute_nmpcs(samples=mini_optlang_model, out_dir=tmpdirname, cache_dir="optima", shard_dir="shards")
+        assert rerun.nmpc.equals(nmpc_res.nmpc)
+
+
+def test_nmpc_outputs(mini_optlang_model):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        nmpc_res = compute_nmpcs(samples=mini_optlang_model, out_dir=tmpdirname, force=True)
+        assert sorted(os.listdir(tmpdirname)) == ["all_fluxes.csv", "community_objectives.csv", "nmpcs.csv"]
+
+        # finished samples are picked up from `out_file`
+        rerun = compute_nmpcs(samples=mini_optlang_model, out_dir=tmpdirname)
+        assert ((rerun.nmpc - nmpc_res.nmpc).abs() < 1e-6).all().all()
+
+
+def test_targeted_nmpc(mini_optlang_model):
+    full = fva(mini_optlang_model, parallel=False, prune=False)
+    targeted = fva(mini_optlang_model, parallel=False, prune=False, directions=get_nmpc_directions)
+
+    assert targeted.attrs["lp_solved"] == full.attrs["lp_solved"] / 2
+    fe = targeted.index.str.endswith("[fe]")
+    assert targeted["min"][fe].isna().all() and targeted["max"][~fe].isna().all()
+    assert ((targeted - full).abs() < 1e-6).sum().sum() == targeted.notna().sum().sum()
+
+    nmpc_res = compute_nmpcs(samples=mini_optlang_model, write_to_file=False, parallel=False, targeted=True)
+    full_res = compute_nmpcs(samples=mini_optlang_model, write_to_file=False, parallel=False, targeted=False)
+    assert ((nmpc_res.nmpc - full_res.nmpc).abs() < 1e-6).all().all()
+
+
+def test_structural_pruning():
+    model = load_model(pytest.resource_problems_dir + "mini_model.mps")
+    # no taxon can exchange acetate, and glucose is missing from the diet
+    for r in get_reactions(model, regex=r"^IEX_ac\[u\]__"):
+        set_reaction_bounds(model, r, 0, 0)
+    set_reaction_bounds(model, "Diet_EX_glc__D[d]", 0, 1000)
+
+    structure = analyze_structure(model)
+    assert structure.pass_through_metabolites == {"ac"}
+    assert "Diet_EX_glc__D[d]" in structure.zero_flux_reactions
+
+    full = fva(model, parallel=False, prune=False)
+    pruned = fva(model, parallel=False, prune=False, directions=get_nmpc_directions)
+    assert pruned.attrs["lp_certified"] == 3
+    assert pruned.attrs["lp_solved"] == full.attrs["lp_solved"] / 2 - 3
+    assert pruned.loc["Diet_EX_ac[d]"].isna().all()
+
+    nmpcs = assemble_nmpcs(pruned, signed=True)[0]
+    assert ((nmpcs - assemble_nmpcs(full, signed=True)[0]).abs() < 1e-6).all()
+    assert nmpcs["ac"] == 0 and full.loc["EX_ac[fe]", "max"] > 0
+
+    # structural pruning is part of targeted NMPCs, which are opt-in
+    nmpc_res = compute_nmpcs(samples=model, write_to_file=False, parallel=False, targeted=True)
+    assert nmpc_res.nmpc.attrs["lp_certified"] == 3
+    assert compute_nmpcs(samples=model, write_to_file=False, parallel=False).nmpc.attrs["lp_certified"] == 0
+
+
+def test_reduced_fva(mini_optlang_model):
+    full = fva(mini_optlang_model, parallel=False)
+    reduced = fva(mini_optlang_model, parallel=False, reduce=True)
+    assert ((full - reduced).abs() < 1e-6).all().all()
+
+    problem = get_linear_problem(mini_optlang_model)
+    reduction = reduce_problem(problem)
+    assert len(reduction.problem.col_names) < len(problem.col_names) / 2
+
+    # recovered solution is feasible for the original problem
+    model = build_model(reduction.problem, "gurobi")
+    model.optimize()
+    x = recover_fluxes(reduction, model.primal_values)[problem.col_names].to_numpy()
+    assert ((problem.A @ x >= problem.row_lb - 1e-6) & (problem.A @ x <= problem.row_ub + 1e-6)).all()
+    assert ((x >= problem.col_lb - 1e-6) & (x <= problem.col_ub + 1e-6)).all()
+
+    # recovered ranges match FVA on the original variables
+    ranges = {}
+    for v in model.variables:
+        for direction in ["min", "max"]:
+            model.objective = model.interface.Objective(v, direction=direction)
+            model.optimize()
+            ranges.setdefault(direction, {})[v.name] = v.primal
+    ranges = recover_ranges(reduction, pd.DataFrame(ranges))
+
+    original = build_model(problem, "gurobi")
+    for name in problem.col_names[::25]:
+        for direction in ["min", "max"]:
+            original.objective = original.interface.Objective(original.variables[name], direction=direction)
+            original.optimize()
+            assert ranges.loc[name, direction] == pytest.approx(original.objective.value, abs=1e-6)
+
+
+def test_assemble_nmpcs(mini_optlang_model):
+    res = fva(mini_optlang_model, parallel=False)
+    nmpcs = assemble_nmpcs(res, signed=True)[0]
+
+    for metab in ["ac", "glc__D", "h2o"]:
+        expected = res.loc["EX_%s[fe]" % metab, "max"] + res.loc["Diet_EX_%s[d]" % metab, "min"]
+        assert nmpcs[metab] == pytest.approx(expected)
+    assert len(nmpcs) == 20
+    assert (assemble_nmpcs(res, threshold=1e6) == 0).all().all()
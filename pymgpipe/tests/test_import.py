@@ -0,0 +1,29 @@
+import subprocess
+import sys
+from pkg_resources import resource_filename
+
+# import time itself is measured by benchmarks/import_time.py
+_LAZY = ["cobra", "libsbml", "matplotlib", "seaborn", "skbio", "tqdm", "pkg_resources"]
+
+
+def _run(code):
+    return subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout.splitlines()
+
+
+def test_lazy_imports():
+    imported = _run(
+        "import sys\n"
+        "import pymgpipe\n"
+        "print([m for m in %r if m in sys.modules])" % _LAZY
+    )[-1]
+    assert imported == "[]"
+
+    # loading and solving LP problems never needs COBRA or any of the plotting libraries
+    problem = resource_filename("pymgpipe", "resources/problems/mini_model.mps.gz")
+    imported = _run(
+        "import sys\n"
+        "from pymgpipe import load_model, solve_model\n"
+        "solve_model(load_model(%r, solver='gurobi'))\n"
+        "print([m for m in %r if m in sys.modules])" % (problem, _LAZY)
+    )[-1]
+    assert imported == "[]"
@@ -4,6 +4,7 @@ import pytest
 from pkg_resources import resource_filename
 from pytest_check import check
 from pymgpipe import *
+from pymgpipe.io import show_available_solvers
 import random
 
 
@@ -54,3 +55,178 @@ def test_write_cobra(mini_cobra_model):
 
             assert ex1.bounds == ex1_new.bounds and ex2.bounds == ex2_new.bounds
             assert len(loaded.variables) == len(mini_cobra_model.variables)
+
+
+@pytest.mark.parametrize("solver", ["glpk", "highs"])
+def test_open_source_solvers(solver):
+    if solver == "highs":
+        pytest.importorskip("highspy")
+    if solver not in show_available_solvers():
+        pytest.skip("%s not available" % solver)
+
+    m = load_model(pytest.resource_problems_dir + "mini_model.mps.gz", solver=solver)
+    with check:
+        assert len(m.variables) == 926 and len(m.constraints) == 354
+
+    reference = load_model(pytest.resource_problems_dir + "mini_model.mps")
+    reference.optimize()
+    m.optimize()
+    assert m.objective.value == pytest.approx(reference.objective.value, abs=1e-6)
+
+    with tempfile.NamedTemporaryFile(delete=True, suffix=".mps.gz") as tmp:
+        write_lp_problem(m, out_file=tmp.name, compress=False)
+        loaded = load_model(tmp.name, solver=solver)
+        assert len(loaded.variables) == len(m.variables)
+
+
+def test_binary_problem():
+    from pymgpipe.binary import read_binary_metadata
+    from pymgpipe.matrix import get_linear_problem
+
+    m = load_model(pytest.resource_problems_dir + "mini_model.mps")
+    add_coupling_constraints(m)
+    m.optimize()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # detected by magic bytes, not by extension
+        path = os.path.join(tmp_dir, "mini_model.bin")
+        write_lp_problem(m, out_file=os.path.join(tmp_dir, "mini_model.pmg"))
+        os.rename(os.path.join(tmp_dir, "mini_model.pmg"), path)
+        assert os.listdir(tmp_dir) == ["mini_model.bin"]
+
+        metadata = read_binary_metadata(path)
+        with check:
+            assert metadata["sample"] == "mini_model"
+            assert metadata["abundances"] == {"TaxaA": 0.1, "TaxaB": 0.2, "TaxaC": 0.3, "TaxaD": 0.4}
+            assert metadata["coupling"]["C_const"] == 400 and metadata["coupling"]["u_const"] == 0.01
+            assert len(metadata["diet"]) == len(get_reactions(m, regex="Diet_EX_.*"))
+
+        for solver in ["gurobi"] + [s for s in ["glpk", "highs"] if s in show_available_solvers()]:
+            loaded = load_model(path, solver=solver)
+            original, problem = get_linear_problem(m), get_linear_problem(loaded)
+            with check:
+                assert (problem.col_names == original.col_names).all() and (problem.row_names == original.row_names).all()
+                assert (problem.A != original.A).nnz == 0 and (problem.col_ub == original.col_ub).all()
+            loaded.optimize()
+            assert loaded.objective.value == pytest.approx(m.objective.value, abs=1e-6)
+
+
+def test_problem_store():
+    from pymgpipe.binary import get_store_samples, read_from_store, read_store_metadata
+
+    m = load_model(pytest.resource_problems_dir + "mini_model.mps")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = os.path.join(tmp_dir, "problems.pms")
+        sizes = []
+        for sample in ["mc1", "mc2"]:
+            write_lp_problem(m, out_file=store + "::" + sample)
+            sizes.append(os.path.getsize(store))
+        set_reaction_bounds(m, "Diet_EX_glc__D[d]", -5, 0)
+        write_lp_problem(m, out_file=store + "::mc3")
+
+        with check:
+            assert get_store_samples(store) == [store + "::mc1", store + "::mc2", store + "::mc3"]
+            # identical samples share all of their arrays
+            assert sizes[1] - sizes[0] < 0.1 * sizes[0]
+            assert read_store_metadata(store, "mc3")["diet"]["Diet_EX_glc__D[d]"] == [-5, 0]
+            assert get_abundances(store + "::mc2").to_dict() == {"mc2": {"TaxaA": 0.1, "TaxaB": 0.2, "TaxaC": 0.3, "TaxaD": 0.4}}
+            assert read_from_store(store, "mc1").A.nnz == read_from_store(store, "mc3").A.nnz
+
+        loaded = load_model(store + "::mc3")
+        assert loaded.name == "mc3" and get_reaction_bounds(loaded, "Diet_EX_glc__D[d]") == (-5, 0)
+        m.optimize(), loaded.optimize()
+        assert loaded.objective.value == pytest.approx(m.objective.value, abs=1e-6)
+        assert len(solve_model(store + "::mc3").values) == 40
+
+        res = compute_nmpcs(samples=store, write_to_file=False, parallel=False, reactions=["EX_ac[fe]", "Diet_EX_ac[d]"])
+        assert res.nmpc.columns.tolist() == ["mc1", "mc2", "mc3"]
+
+
+def test_problem_store_size(monkeypatch):
+    import sys
+    import json
+    from pymgpipe.binary import get_store_samples, _load_store_index
+
+    # stores are written without locking where `fcntl` isn't available
+    monkeypatch.setitem(sys.modules, "fcntl", None)
+    m = load_model(pytest.resource_problems_dir + "mini_model.mps")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = os.path.join(tmp_dir, "problems.pms")
+        write_lp_problem(m, out_file=store + "::mc0")
+        first = os.path.getsize(store)
+        for i in range(1, 50):
+            write_lp_problem(m, out_file=store + "::mc%s" % i)
+
+        assert len(get_store_samples(store)) == 50
+        # the index is kept in reusable slots, so the file grows with the size of the index rather than with every write of it
+        index = len(json.dumps(_load_store_index(store)).encode())
+        assert os.path.getsize(store) - first < 10 * index
+
+
+def test_compression(mini_cobra_model, monkeypatch):
+    import pymgpipe.io
+
+    # many small gzip members
+    monkeypatch.setattr(pymgpipe.io, "_GZIP_CHUNK_SIZE", 1 << 14)
+    formats = [".gz"]
+    try:
+        import zstandard
+        formats.append(".zst")
+    except ImportError:
+        pass
+
+    m = load_model(pytest.resource_problems_dir + "mini_model.mps")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for ext in formats:
+            problem = os.path.join(tmp_dir, "mini_model.mps" + ext)
+            write_lp_problem(m, out_file=problem, threads=4)
+            loaded = load_model(problem)
+            with check:
+                assert loaded.name == "mini_model" and len(loaded.variables) == 926
+
+            pymgpipe.io.decompress_file(problem, os.path.join(tmp_dir, "plain.mps"))
+            assert len(load_model(os.path.join(tmp_dir, "plain.mps")).constraints) == 354
+
+            model = os.path.join(tmp_dir, "mini_model.xml" + ext)
+            write_cobra_model(mini_cobra_model, model, threads=4)
+            assert len(load_cobra_model(model).reactions) == len(mini_cobra_model.reactions)
+        assert sorted(os.listdir(tmp_dir)) == sorted(["plain.mps"] + ["mini_model.%s%s" % (t, ext) for t in ["mps", "xml"] for ext in formats])
+
+
+
+def test_async_writer(mini_cobra_model):
+    import threading
+    from pymgpipe.io import AsyncWriter, _stage_cobra_model, _stage_lp_problem
+
+    writer = AsyncWriter(max_pending=1)
+    release = threading.Event()
+    writer.submit("first", release.wait)
+    writer.submit("second", lambda: None)
+
+    # writer thread is busy and the queue is full, so the next submit blocks
+    blocked = threading.Thread(target=writer.submit, args=("third", lambda: None))
+    blocked.start()
+    blocked.join(0.2)
+    with check:
+        assert blocked.is_alive()
+    release.set()
+    blocked.join()
+    writer.drain()
+
+    writer.submit("broken.mps", lambda: 1 / 0)
+    with pytest.raises(Exception, match="broken.mps"):
+        writer.drain()
+
+    m = load_model(pytest.resource_problems_dir + "mini_model.mps")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        model = os.path.join(tmp_dir, "mini_model.xml.gz")
+        problem = os.path.join(tmp_dir, "mini_model.mps.gz")
+        writer.submit(model, _stage_cobra_model(mini_cobra_model, model))
+        writer.submit(problem, _stage_lp_problem(m, out_file=problem))
+        # changes made after staging don't end up in the written files
+        m.remove(m.variables[0])
+        writer.drain()
+
+        assert len(load_cobra_model(model).reactions) == len(mini_cobra_model.reactions)
+        assert len(load_model(problem).variables) == 926
+        assert sorted(os.listdir(tmp_dir)) == ["mini_model.mps.gz", "mini_model.xml.gz"]
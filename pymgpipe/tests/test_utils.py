@@ -1,5 +1,6 @@
 from pymgpipe import *
 from pymgpipe.utils import _get_reverse_id
+import pytest
 
 def test_remove_reverse_reactions(mini_optlang_model):
     num_reactions = len(mini_optlang_model.variables)
@@ -15,3 +16,62 @@ def test_remove_reverse_reactions(mini_optlang_model):
     assert len(mini_optlang_model.variables) == num_reactions/2 and reverse_var_id not in mini_optlang_model.variables
 
 
+
+def test_solve_model():
+    model = load_model(pytest.resource_problems_dir + "mini_model.mps")
+    fluxes = solve_model(model)
+    assert isinstance(fluxes, Fluxes) and len(fluxes.ids) == len(fluxes.values) == 40
+
+    primals = model.primal_values
+    for r, flux in zip(fluxes.ids, fluxes.values):
+        assert flux == pytest.approx(primals[r] - primals.get(_get_reverse_id(r), 0))
+
+    frame = solve_model(model, as_frame=True)
+    assert frame.columns.tolist() == [model.name] and (frame[model.name] == fluxes.to_series()).all()
+
+    reduced_costs, shadow_prices = get_dual_values(model)
+    assert reduced_costs.values.tolist() == list(model.reduced_costs.values())
+    assert shadow_prices.values.tolist() == list(model.shadow_prices.values())
+    assert get_primal_values(model).values.tolist() == list(primals.values())
+
+
+def test_solve_many():
+    model = load_model(pytest.resource_problems_dir + "mini_model.mps")
+    original = str(model.objective)
+    secretions = [r.name for r in get_reactions(model, regex=Constants.FE_REGEX)][:5]
+
+    res = solve_many(model, secretions, directions="max")
+    assert res.index.tolist() == secretions and res.shape == (5, 40)
+    assert str(model.objective) == original
+
+    for r in secretions:
+        set_objective(model, model.variables[r] - model.variables[_get_reverse_id(r)], direction="max")
+        expected = solve_model(model, reactions=[r]).values[0]
+        assert res.attrs["objective_values"][r] == pytest.approx(expected)
+        assert res.loc[r, r] == pytest.approx(expected)
+
+    labeled = solve_many(model, {"both": secretions[:2]}, directions=["min"], reactions=secretions[:2])
+    assert labeled.loc["both"].sum() == pytest.approx(labeled.attrs["objective_values"]["both"])
+
+    # every worker solves a chunk of the objectives on its own copy of the problem (other fluxes can differ between alternative optima)
+    parallel = solve_many(model, secretions, directions="max", threads=2)
+    assert parallel.index.tolist() == secretions and parallel.shape == res.shape
+    assert parallel.attrs["objective_values"] == pytest.approx(res.attrs["objective_values"])
+    for r in secretions:
+        assert parallel.loc[r, r] == pytest.approx(res.loc[r, r])
+
+    with pytest.raises(Exception, match="missing from the model"):
+        solve_many(model, [secretions[0], "EX_missing[fe]"])
+    with pytest.raises(Exception, match="missing from the model"):
+        solve_many(model, [{secretions[0]: 1, "missing": 1}])
+
+
+def test_get_abundances():
+    expected = {"TaxaA": 0.1, "TaxaB": 0.2, "TaxaC": 0.3, "TaxaD": 0.4}
+    for path in ["mini_model.mps", "mini_model.mps.gz"]:
+        assert get_abundances(pytest.resource_problems_dir + path).to_dict() == {"mini_model": expected}
+
+    # read from the problem without solving it
+    model = load_model(pytest.resource_problems_dir + "mini_model.lp")
+    assert get_abundances(model).to_dict() == {"mini_model": expected}
+    assert model.status is None
@@ -5,7 +5,9 @@ import pandas as pd
 import numpy as np
 import warnings
 import time
-from .io import load_model, load_cobra_model
+from collections import namedtuple
+from .io import load_model, load_cobra_model, _get_solver_name, _read_mps_column
+from .binary import split_store_path, is_binary_problem, read_binary_metadata, read_store_metadata
 from .logger import logger
 from math import isinf
 
@@ -21,6 +23,19 @@ class Constants:
     FE_REGEX = "^EX_((?!biomass|community).)*\[fe\]$"
     DIET_REGEX = "^(Diet_)?(?i)EX_((?!biomass|community).)*\[d\]$"
 
+
+class Fluxes(namedtuple("Fluxes", "ids values")):
+    """Values of a solved model as numpy arrays
+
+    `values[i]` belongs to the variable, reaction or constraint `ids[i]`. Use `to_series()` (or `solve_model(..., as_frame=True)`) to get pandas objects instead.
+    """
+
+    __slots__ = ()
+
+    def to_series(self):
+        return pd.Series(self.values, index=self.ids)
+
+
 def solve_model(
     model,
     regex=None,
@@ -31,6 +46,7 @@ def solve_model(
     method="primal",
     flux_threshold=None,
     ex_only=True,
+    as_frame=False,
 ):
     """Solves optlang.interface.Model
 
@@ -40,6 +56,9 @@ def solve_model(
         reactions (list): List of reactions you want to return
         ex_only (bool): Only return fluxes for exchange reactions (will be overridden by either `regex` or `reactions` param)
         flux_threshold (float): Any flux below this threshold value will be set to 0
+        as_frame (bool): Return fluxes as a pandas.DataFrame (with the model name as its only column) instead of numpy arrays
+
+    Returns: Fluxes holding the net flux of every selected reaction (see `get_net_fluxes`), or pandas.DataFrame if `as_frame` is True
 
     Notes:
     `presolve` and `method` are both solver-specific parameters. Please refer to https://optlang.readthedocs.io/en/latest/ for more info.
@@ -48,8 +67,7 @@ def solve_model(
     model = load_model(model, solver)
     model.configuration.verbosity = verbosity
     model.configuration.presolve = presolve
-    model.configuration.lp_method = method
-    model.configuration.qp_method = method
+    _set_method(model, method)
 
     model.update()
 
@@ -63,29 +81,277 @@ def solve_model(
 
     if regex is None and reactions is None and ex_only:
         regex = Constants.EX_REGEX
-    fluxes = _get_fluxes_from_model(
+    fluxes = get_net_fluxes(
         model, threshold=flux_threshold, regex=regex, reactions=reactions
     )
-    res = pd.DataFrame({model.name: fluxes})
-    del model
+    if as_frame:
+        return pd.DataFrame({model.name: fluxes.to_series()})
+    return fluxes
+
+
+def _set_method(model, method):
+    # Not every solver supports every method (i.e. HiGHS has no `primal`), fall back on the solver default
+    for param in ["lp_method", "qp_method"]:
+        try:
+            setattr(model.configuration, param, method)
+        except Exception:
+            setattr(model.configuration, param, "auto")
+
+
+def get_primal_values(model):
+    """Returns the value of every variable of a solved model, fetched from the solver in a single call
+
+    Args:
+        model (optlang.interface.model): Solved LP problem
+
+    Returns: Fluxes
+    """
+    index = _get_variable_index(model)
+    return Fluxes(index.names, np.asarray(model._get_primal_values(), dtype=float))
+
+
+def get_dual_values(model):
+    """Returns the reduced cost of every variable and the shadow price of every constraint of a solved model, each fetched from the solver in a single call
+
+    Args:
+        model (optlang.interface.model): Solved LP problem
+
+    Returns: tuple of Fluxes (reduced costs, shadow prices)
+    """
+    index = _get_variable_index(model)
+    return (
+        Fluxes(index.names, np.asarray(model._get_reduced_costs(), dtype=float)),
+        Fluxes(index.constraints, np.asarray(model._get_shadow_prices(), dtype=float)),
+    )
+
+
+def get_net_fluxes(model, reactions=None, regex=None, threshold=None):
+    """Returns net flux (forward - reverse) of reactions of a solved model
+
+    Args:
+        model (optlang.interface.model): Solved LP problem
+        regex (str): Regex string corresponding to list of reactions you want to return
+        reactions (list): List of reactions you want to return
+        threshold (float): Any flux below this threshold value will be set to 0
+
+    Returns: Fluxes
+    """
+    index = _get_variable_index(model)
+    forward = np.array(
+        [index.positions[r.name] for r in get_reactions(model, reactions, regex)], dtype=int
+    )
+    reverse = index.reverse[forward]
+
+    return Fluxes(index.names[forward], _get_net_values(model, forward, reverse, threshold))
+
+
+def _get_net_values(model, forward, reverse, threshold=None):
+    primals = np.append(np.asarray(model._get_primal_values(), dtype=float), 0)
+    # reactions without reverse variable point at the trailing 0
+    fluxes = primals[forward] - primals[reverse]
+    if threshold is not None:
+        fluxes[abs(fluxes) <= threshold] = 0
+    return fluxes + 0.0
+
+
+def solve_many(
+    model,
+    objectives,
+    directions="max",
+    regex=None,
+    reactions=None,
+    solver="gurobi",
+    threads=1,
+    verbosity=0,
+    presolve=True,
+    method="primal",
+    flux_threshold=None,
+    ex_only=True,
+):
+    """Solves one LP per objective while keeping the problem loaded
+
+    Only the objective changes between solves, it's swapped in place as a sparse coefficient vector and every solve is warm-started from the previous optimal basis.
+    The original objective of the model is restored afterwards.
+
+    Args:
+        model (optlang.interface.model): LP problem
+        objectives (list | dict): Objectives to solve, either a list or a dictionary mapping labels to objectives. Each objective is a reaction ID (optimizes its net flux),
+            a list of reaction IDs (optimizes the sum of their net fluxes) or a dictionary mapping variable IDs to coefficients. IDs missing from the model raise an exception
+        directions (str | list): `max` or `min`, either for all objectives or one per objective
+        regex (str): Regex string corresponding to list of reactions you want to return
+        reactions (list): List of reactions you want to return
+        threads (int): Number of worker processes, each solving a contiguous chunk of the objectives on its own copy of the problem
+        flux_threshold (float): Any flux below this threshold value will be set to 0
+        ex_only (bool): Only return fluxes for exchange reactions (will be overridden by either `regex` or `reactions` param)
+
+    Returns: pandas.DataFrame (objectives x reactions) holding the net flux of every selected reaction, objectives that could not be solved to optimality are left empty.
+        The optimal objective values are stored in `attrs["objective_values"]`.
+
+    Notes:
+    `presolve` and `method` are both solver-specific parameters. Please refer to https://optlang.readthedocs.io/en/latest/ for more info.
+    """
+    model = load_model(model, solver)
+    if isinstance(objectives, dict):
+        labels, objectives = list(objectives.keys()), list(objectives.values())
+    else:
+        labels = [o if isinstance(o, str) else i for i, o in enumerate(objectives)]
+    objectives = [_get_objective_coefficients(model, o) for o in objectives]
+    directions = [directions] * len(objectives) if isinstance(directions, str) else list(directions)
+    if len(directions) != len(objectives):
+        raise Exception(
+            "Received %s directions for %s objectives" % (len(directions), len(objectives))
+        )
+
+    if regex is None and reactions is None and ex_only:
+        regex = Constants.EX_REGEX
+    selected = [r.name for r in get_reactions(model, reactions, regex)]
+    config = (verbosity, presolve, method, selected, flux_threshold)
+
+    threads = max(1, min(os.cpu_count() if threads == -1 else threads, len(objectives)))
+    tasks = list(zip(objectives, directions))
+    if threads == 1:
+        results = _solve_objectives(model, tasks, *config)
+    else:
+        import tempfile
+        from multiprocessing import Pool
+        from .io import write_lp_problem
+
+        logger.info("Solving %s objectives on %s threads..." % (len(tasks), threads))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "%s.mps" % model.name)
+            write_lp_problem(model, out_file=path, compress=False)
+
+            chunks = np.array_split(np.arange(len(tasks)), threads)
+            with Pool(
+                processes=threads,
+                initializer=_solve_many_init,
+                initargs=(path, _get_solver_name(model), config),
+            ) as p:
+                results = [
+                    r
+                    for chunk in p.imap(_solve_many_worker, [[tasks[i] for i in c] for c in chunks])
+                    for r in chunk
+                ]
+
+    values = np.full((len(tasks), len(selected)), np.nan)
+    objective_values = {}
+    for i, (label, (objective_value, fluxes)) in enumerate(zip(labels, results)):
+        objective_values[label] = objective_value
+        if fluxes is not None:
+            values[i] = fluxes
+    failed = sum(f is None for _, f in results)
+    if failed > 0:
+        logger.warning("%s out of %s objectives could not be solved to optimality" % (failed, len(tasks)))
+
+    res = pd.DataFrame(values, index=labels, columns=selected)
+    res.attrs["objective_values"] = objective_values
     return res
 
 
-def _get_fluxes_from_model(model, reactions=None, regex=None, threshold=1e-5):
-    fluxes = {}
+def _get_objective_coefficients(model, objective):
+    # Sparse objective vector {variable ID: coefficient}, reactions are optimized by their net flux
+    ids = objective if isinstance(objective, (dict, list, tuple, set)) else [objective]
+    missing = [v for v in (v if isinstance(v, str) else v.name for v in ids) if v not in model.variables]
+    if len(missing) > 0:
+        raise Exception("Objective %s refers to variables missing from the model- %s" % (objective, missing))
 
-    for forward in get_reactions(model, reactions, regex):
-        r_id = _get_reverse_id(forward.name)
-        if r_id not in model.variables:
-            flux = float(forward.primal)
-        else:
-            reverse = model.variables[r_id]
-            flux = float(forward.primal - reverse.primal)
-        flux = 0 if flux == -0.0 else flux
-        if threshold is not None:
-            flux = flux if abs(flux) > threshold else 0
-        fluxes[forward.name] = flux
-    return fluxes
+    if isinstance(objective, dict):
+        return {(v if isinstance(v, str) else v.name): c for v, c in objective.items()}
+    if isinstance(objective, (str, optlang.interface.Variable)):
+        objective = [objective]
+
+    coefficients = {}
+    for r in get_reactions(model, reactions=list(objective)):
+        coefficients[r.name] = coefficients.get(r.name, 0) + 1
+        reverse = _get_reverse_id(r.name)
+        if reverse in model.variables:
+            coefficients[reverse] = coefficients.get(reverse, 0) - 1
+    if len(coefficients) == 0:
+        raise Exception("Objective %s does not contain any model variables" % objective)
+    return coefficients
+
+
+def _solve_objectives(model, tasks, verbosity, presolve, method, selected, threshold):
+    # Returns (objective value, net fluxes) per task, fluxes are None if the LP wasn't solved to optimality
+    from optlang.symbolics import Zero
+
+    model.configuration.verbosity = verbosity
+    model.configuration.presolve = presolve
+    _set_method(model, method)
+
+    original = (
+        model.objective.get_linear_coefficients(model.objective.variables),
+        model.objective.direction,
+    )
+    model.objective = model.interface.Objective(Zero, direction="max")
+    model.update()
+
+    index = _get_variable_index(model)
+    forward = np.array([index.positions[r] for r in selected], dtype=int)
+    reverse = index.reverse[forward]
+
+    results = []
+    previous = {}
+    try:
+        for objective, direction in tasks:
+            # resets the coefficients of the previous objective and sets the new ones in one call, leaving the loaded problem (and its basis) untouched
+            coefficients = {model.variables[v]: 0 for v in previous}
+            coefficients.update({model.variables[v]: c for v, c in objective.items()})
+            model.objective.set_linear_coefficients(coefficients)
+            model.objective.direction = direction
+            previous = objective
+
+            status = model.optimize()
+            if status != "optimal":
+                results.append((np.nan, None))
+                continue
+            results.append(
+                (model.objective.value, _get_net_values(model, forward, reverse, threshold))
+            )
+            # presolve would discard the optimal basis of the previous solve
+            model.configuration.presolve = False
+    finally:
+        coefficients, direction = original
+        model.objective = model.interface.Objective(Zero, direction=direction)
+        model.objective.set_linear_coefficients(coefficients)
+        model.configuration.presolve = presolve
+        model.update()
+    return results
+
+
+def _solve_many_init(path, solver, config):
+    global _solve_many_model, _solve_many_config
+    _solve_many_model = load_model(path, solver)
+    _solve_many_config = config
+
+
+def _solve_many_worker(tasks):
+    return _solve_objectives(_solve_many_model, tasks, *_solve_many_config)
+
+
+_VariableIndex = namedtuple("_VariableIndex", "names positions reverse constraints")
+
+
+def _get_variable_index(model):
+    # Variable positions and forward -> reverse mapping, cached on the model until its variables change
+    index = getattr(model, "_pymgpipe_index", None)
+    if (
+        index is not None
+        and len(index.names) == len(model.variables)
+        and len(index.constraints) == len(model.constraints)
+        and (len(index.names) == 0 or index.names[-1] == model.variables[-1].name)
+    ):
+        return index
+
+    names = np.array([v.name for v in model.variables], dtype=object)
+    positions = {n: i for i, n in enumerate(names)}
+    # reactions without reverse variable map to one past the last variable
+    reverse = np.array([positions.get(_get_reverse_id(n), len(names)) for n in names], dtype=int)
+    index = _VariableIndex(
+        names, positions, reverse, np.array([c.name for c in model.constraints], dtype=object)
+    )
+    model._pymgpipe_index = index
+    return index
 
 
 def get_reactions(model, reactions=None, regex=None, include_reverse=False):
@@ -146,9 +412,13 @@ def get_net_reactions(model, reactions=None, regex=None):
     By default, COBRA adds a reverse variable for every forward variable within the model. 
     Therefore, to calculate the flux going through `reaction_A` for example, you must subtract the forward and reverse fluxes like so- `reaction_A - reaction_A_reverse`
     """
-    rxns = get_reactions(model,reactions,regex,include_reverse=True)
-    net = {rxns[i].name:rxns[i]-rxns[i+1] for i in range(0,len(rxns),2)}
-    return net 
+    model = load_model(model)
+    net = {}
+    for r in get_reactions(model, reactions, regex):
+        reverse = _get_reverse_id(r.name)
+        # net flux problems (see `get_net_flux_problem`) have no reverse variables
+        net[r.name] = r - model.variables[reverse] if reverse in model.variables else r
+    return net
 
 def constrain_reactions(model, flux_map, threshold=0.0):
     """Constrains reactions within model to specific value (or range of values)
@@ -168,6 +438,9 @@ def constrain_reactions(model, flux_map, threshold=0.0):
     flux_map = {k: v for k, v in flux_map.items() if k in model.variables}
     for f_id, flux in flux_map.items():
         forward_var = model.variables[f_id]
+        if _get_reverse_id(f_id) not in model.variables:
+            forward_var.set_bounds(flux - threshold, flux + threshold)
+            continue
         reverse_var = model.variables[_get_reverse_id(f_id)]
 
         if flux > 0:
@@ -214,6 +487,7 @@ def remove_reverse_vars(model,hard_remove=False):
     By default, COBRA adds a reverse variable for every forward variable within the model. 
     Therefore, to calculate the flux going through `reaction_A` for example, you must subtract the forward and reverse fluxes like so- `reaction_A - reaction_A_reverse`.
     This function removes all reverse variables to make calculations a lot simpler and faster. Also, reduces the size of the models by roughly 50%!
+    Models can also be built without reverse variables from the start, see `pymgpipe.modeling.get_net_flux_problem`.
     """
     start = time.time()
     model = load_model(model) 
@@ -285,8 +559,50 @@ def get_reverse_var(model, v):
     return model.variables[_get_reverse_id(v)]
 
 def get_abundances(model):
-    """Returns taxa abundances within community-level model"""
-    model = load_model(model)
+    """Returns taxa abundances within community-level model
+
+    Abundances are read straight from the coefficients of the `communityBiomass` reaction, without solving the model.
+    Problems passed in as .mps files are never fully loaded, only the `communityBiomass` column is read from the file. Binary problems and samples within a problem store only read the metadata.
+
+    Args:
+        model (str | cobra.Model | optlang.interface.Model): Community model or path to community model
+
+    Returns: pandas.DataFrame (taxa x 1) with the model name as its only column
+    """
+    store, sample = split_store_path(model)
+    if sample is not None:
+        return pd.DataFrame({sample: read_store_metadata(store, sample)["abundances"]})
+    elif isinstance(model, str) and is_binary_problem(model):
+        name = model.split("/")[-1].split(".")[0]
+        return pd.DataFrame({name: read_binary_metadata(model)["abundances"]})
+    elif isinstance(model, str) and re.search(r"\.mps(\.gz)?$", model):
+        name = model.split("/")[-1].split(".")[0]
+        coefficients = _read_mps_column(model, "communityBiomass")
+    else:
+        model = load_model(model)
+        name = model.name
+        coefficients = {}
+        if "communityBiomass" in model.variables:
+            community = model.variables["communityBiomass"]
+            coefficients = {
+                c.name: c.get_linear_coefficients([community])[community]
+                for c in model.constraints
+                if c.name.startswith("biomass")
+            }
+
+    abundances = {
+        row.split("__")[1]: -float(coef)
+        for row, coef in coefficients.items()
+        if re.match("^biomass.*__", row, re.IGNORECASE) and coef != 0
+    }
+    if len(abundances) == 0:
+        # e.g. ported mgPipe models, which name their biomass metabolites differently
+        return _solve_abundances(load_model(model))
+    return pd.DataFrame({name: abundances})
+
+
+def _solve_abundances(model):
+    # Taxa biomass fluxes of an optimal solution, these only match the abundances if communityBiomass is 1
     try:
         model.variables[1].primal
     except Exception:
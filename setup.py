@@ -23,6 +23,10 @@ setup(
         "seaborn",
         "gurobipy"
     ],
+    extras_require={
+        "glpk": ["swiglpk"],
+        "highs": ["highspy==1.15.1", "osqp==1.1.3"],
+    },
     url="https://github.com/korem-lab/pymgpipe",
     package_dir={"pymgpipe": "pymgpipe"},
     packages=find_packages(include=["pymgpipe"]),